@@ -0,0 +1,120 @@
+#	Comic Spread Stitch - for making digital comic books easier to read
+#	Copyright (C) 2024 Reed Mauzy
+#
+#	This program is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Writes books so that a crash at any point leaves either the old book or the new one in place, never half of one
+# New books are written to a .tmp file next to the old one and only swapped in once they're complete and on the disk
+# The backup is made as a hard link to the old book before the swap, so the old book never leaves its name until the new one takes it
+# recoverBookDir tidies up after a run that was stopped part way through, so the book can be processed again
+
+from contextlib import contextmanager
+import os
+import logging
+
+tmpSuffix = ".tmp"
+backupSuffix = "_old"
+bookExts = [".cbz", ".epub", ".pdf"]
+logger = logging.getLogger(__name__)
+
+# gives the name of a temporary file to write destFile to, which is deleted if it's still there afterwards,
+# such as when writing it failed part way through or the book was skipped
+@contextmanager
+def tempFile(destFile):
+	tmpFile = destFile + tmpSuffix
+	try:
+		yield tmpFile
+	finally:
+		if os.path.exists(tmpFile):
+			os.remove(tmpFile)
+			logger.debug(f"{tmpFile} deleted")
+
+def syncFile(path):
+	with open(path, "rb+") as fp:
+		os.fsync(fp.fileno())
+
+# flushes tmpFile to the disk and then puts it in place of destFile in one step
+def replaceFile(tmpFile, destFile, synced = False):
+	if not synced:
+		syncFile(tmpFile)
+	os.replace(tmpFile, destFile)
+	syncDir(os.path.dirname(os.path.abspath(destFile)))
+
+# makes sure a rename in directory survives a crash
+# Windows can't open directories, and doesn't need to since renames there are written straight away
+def syncDir(directory):
+	try:
+		fd = os.open(directory, os.O_RDONLY)
+	except OSError:
+		return
+	try:
+		os.fsync(fd)
+	except OSError:
+		pass
+	finally:
+		os.close(fd)
+
+# keeps the old book as bookFile_old, unless backedup says there already is one, and puts newBookFile in its place
+# if the new book can't be put in place, the backup is undone and the error is raised
+def replaceBook(bookFile, newBookFile, backedup = False):
+	backupFile = bookFile + backupSuffix
+	linked = renamed = False
+	# the new book is flushed before the backup is made, so the backup is only there on its own for as short a time as possible
+	syncFile(newBookFile)
+	if not backedup:
+		try:
+			os.link(bookFile, backupFile)
+			linked = True
+		except FileExistsError:
+			raise
+		except OSError:
+			# filesystems without hard links
+			os.rename(bookFile, backupFile)
+			renamed = True
+		logger.debug("Backup created")
+	else:
+		logger.debug("Backup not created because a backup already exists")
+	try:
+		replaceFile(newBookFile, bookFile, True)
+	except BaseException:
+		if linked:
+			os.remove(backupFile)
+		elif renamed:
+			os.rename(backupFile, bookFile)
+		raise
+
+# puts a book directory back the way it was before a run that was stopped while writing one of its books
+# nothing else can be writing books in bookDir while this runs, since a backup or .tmp file another book is part way through looks the same as a stopped one
+# returns a message for each unfinished book deleted and each backup put back or deleted, and logs them as warnings
+def recoverBookDir(bookDir):
+	recovered = []
+	for fileName in sorted(os.listdir(bookDir)):
+		path = os.path.join(bookDir, fileName)
+		root, ext = os.path.splitext(fileName)
+		# a new book that was never finished
+		if ext == tmpSuffix and os.path.splitext(root)[1].lower() in bookExts and os.path.isfile(path):
+			os.remove(path)
+			recovered.append(f"Deleted unfinished {fileName}")
+		# a backup made for a new book that never took the old one's place
+		elif fileName.endswith(backupSuffix) and ext[:-len(backupSuffix)].lower() in bookExts:
+			bookFile = path[:-len(backupSuffix)]
+			if not os.path.exists(bookFile):
+				os.rename(path, bookFile)
+				recovered.append(f"Restored {os.path.basename(bookFile)} from {fileName}")
+			elif os.path.samefile(path, bookFile):
+				os.remove(path)
+				recovered.append(f"Deleted {fileName}, which was still the same file as {os.path.basename(bookFile)}")
+	for message in recovered:
+		logger.warning(message)
+	return recovered
@@ -0,0 +1,173 @@
+#	Comic Spread Stitch - for making digital comic books easier to read
+#	Copyright (C) 2024 Reed Mauzy
+#
+#	This program is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Times the slow parts of the scripts on made-up books so that changes can be compared
+# Each result is printed as a line of JSON
+
+import comicSpreadStitch
+import epubToCbz
+import processPdf
+import pdfToCbz
+import fakeBooks
+import cv2
+from zipfile import ZipFile
+from PIL import Image
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+benchmarks = ["stitchPages", "removeRightLines", "processBook", "convertEpubToCbz", "processPdf", "convertPdfToCbz", "startup"]
+scriptDir = os.path.dirname(os.path.abspath(__file__))
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("-p", "--pages", type = int, default = 40, help = "number of pages in each made-up book")
+	parser.add_argument("--width", type = int, default = 1000, help = "width of each page in pixels")
+	parser.add_argument("--height", type = int, default = 1500, help = "height of each page in pixels")
+	parser.add_argument("-f", "--format", choices = [".jpg", ".png"], default = ".jpg", help = "image format of the pages")
+	parser.add_argument("-n", "--repeat", type = int, default = 3, help = "number of times to time each benchmark")
+	parser.add_argument("-o", "--overlap", type = int, default = 50, help = "number of columns to check for overlap")
+	parser.add_argument("-c", "--compression", type = int, default = 75, help = "fuzz factor for compression artifacts")
+	parser.add_argument("-r", "--rotation", choices = comicSpreadStitch.rotationModes, default = "decode", help = "how to rotate JPEG pages that aren't stitched")
+	parser.add_argument("-j", "--jobs", type = int, default = 1, help = "number of processes for the benchmarks that can use more than one")
+	parser.add_argument("-b", "--benchmark", action = "append", choices = benchmarks, help = "benchmark to run; can be given more than once and defaults to all of them")
+	parser.add_argument("--output", help = "file to append the results to as well as printing them")
+	args = parser.parse_args()
+
+	for name in args.benchmark or benchmarks:
+		result = runBenchmark(name, args.pages, args.width, args.height, args.format, args.repeat, args.overlap, args.compression, args.rotation, args.jobs)
+		line = json.dumps(result)
+		print(line)
+		if args.output:
+			with open(args.output, "a") as fp:
+				fp.write(line + "\n")
+
+# returns a dict describing the benchmark and how long each run of it took in seconds
+def runBenchmark(name, pages = 40, width = 1000, height = 1500, imgFormat = ".jpg", repeat = 3, overlap = 50, compression = 75, rotation = "decode", jobs = 1):
+	times = []
+	with tempfile.TemporaryDirectory() as workDir:
+		for i in range(repeat):
+			runDir = os.path.join(workDir, str(i))
+			os.mkdir(runDir)
+			times.append(timeBenchmark(name, runDir, pages, width, height, imgFormat, overlap, compression, rotation, jobs))
+			shutil.rmtree(runDir)
+	return {
+		"benchmark": name,
+		"pages": pages,
+		"width": width,
+		"height": height,
+		"format": imgFormat,
+		"overlap": overlap,
+		"compression": compression,
+		"rotation": rotation,
+		"jobs": jobs,
+		"times": times,
+		"min": min(times),
+		"median": statistics.median(times),
+	}
+
+# sets up a fresh book in runDir, then times only the call being benchmarked
+def timeBenchmark(name, runDir, pages, width, height, imgFormat, overlap, compression, rotation, jobs = 1):
+	match name:
+		case "stitchPages":
+			left, right = fakeBooks.makeSpread(width, height, overlap // 2, 0)
+			start = time.perf_counter()
+			comicSpreadStitch.stitchPages(left, right, overlap, compression)
+			return time.perf_counter() - start
+		case "removeRightLines":
+			book = fakeBooks.makeCbz(runDir, pages, width, height, imgFormat, overlap)
+			with ZipFile(book, "r") as zipf:
+				imgList = comicSpreadStitch.getZipImgs(zipf)
+				start = time.perf_counter()
+				comicSpreadStitch.removeRightLines(imgList, comicSpreadStitch.ZipPages(zipf))
+				return time.perf_counter() - start
+		case "processBook":
+			fakeBooks.makeCbz(runDir, pages, width, height, imgFormat, overlap)
+			line = f"{runDir}|{makePageList(pages)}"
+			start = time.perf_counter()
+			status, reason = comicSpreadStitch.processBook(line, overlap, compression, rotation)
+			elapsed = time.perf_counter() - start
+		case "convertEpubToCbz":
+			book = makeEpub(runDir, pages, width, height, imgFormat, overlap)
+			start = time.perf_counter()
+			status, reason = epubToCbz.convertEpubToCbz(book)
+			elapsed = time.perf_counter() - start
+		case "processPdf":
+			book = makePdf(runDir, pages, width, height, overlap)
+			pageList = comicSpreadStitch.convertPageList(makePageList(pages), runDir)[0]
+			start = time.perf_counter()
+			status, reason = processPdf.processPdf(book, pageList, False, False)
+			elapsed = time.perf_counter() - start
+		case "convertPdfToCbz":
+			book = makePdf(runDir, pages, width, height, overlap)
+			start = time.perf_counter()
+			status, reason = pdfToCbz.convertPdfToCbz(book, jobs)
+			elapsed = time.perf_counter() - start
+		# runs comicSpreadStitch.py in a new Python on a line for a book that isn't there,
+		# which is how long a run that has little to do takes before it gets to any pages
+		case "startup":
+			with open(os.path.join(runDir, "pagesToProcess.txt"), "w") as fp:
+				fp.write(f"{os.path.join(runDir, 'missing')}|1\n")
+			start = time.perf_counter()
+			subprocess.run([sys.executable, os.path.join(scriptDir, "comicSpreadStitch.py")], cwd = runDir, capture_output = True, check = True)
+			return time.perf_counter() - start
+		case _:
+			raise ValueError(f"Unknown benchmark {name}")
+	if status:
+		raise RuntimeError(f"{name} did not succeed: {reason}")
+	return elapsed
+
+# stitches every fourth page to the one after it, rotates one page each way, and deletes the second to last page
+def makePageList(pages):
+	pageList = [str(page) for page in range(2, pages - 2, 4)]
+	if pages >= 8:
+		pageList += ["4r", "8l"]
+	pageList.append(f"{pages - 1}d")
+	return ", ".join(pageList)
+
+def makeEpub(bookDir, pages, width, height, imgFormat, overlap):
+	book = os.path.join(bookDir, "Benchmark.epub")
+	mediaType = "image/jpeg" if imgFormat == ".jpg" else "image/png"
+	manifest = []
+	spine = []
+	with ZipFile(book, "w") as epub:
+		epub.writestr("mimetype", "application/epub+zip")
+		epub.writestr("META-INF/container.xml", '<?xml version="1.0"?>\n<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">\n<rootfiles>\n<rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>\n</rootfiles>\n</container>\n')
+		for i, page in enumerate(fakeBooks.makePages(pages, width, height, overlap)):
+			epub.writestr(f"OEBPS/images/page{i}{imgFormat}", fakeBooks.encodePage(page, imgFormat))
+			epub.writestr(f"OEBPS/page{i}.xhtml", f'<?xml version="1.0" encoding="utf-8"?>\n<html xmlns="http://www.w3.org/1999/xhtml">\n<head><title>Page {i}</title></head>\n<body>\n<div><img src="images/page{i}{imgFormat}" alt="Page {i}"/></div>\n</body>\n</html>\n')
+			manifest.append(f'<item id="page{i}" href="page{i}.xhtml" media-type="application/xhtml+xml"/>')
+			manifest.append(f'<item id="img{i}" href="images/page{i}{imgFormat}" media-type="{mediaType}"/>')
+			spine.append(f'<itemref idref="page{i}"/>')
+		newline = "\n"
+		epub.writestr("OEBPS/content.opf", f'<?xml version="1.0" encoding="utf-8"?>\n<package xmlns="http://www.idpf.org/2007/opf" version="2.0">\n<manifest>\n{newline.join(manifest)}\n</manifest>\n<spine>\n{newline.join(spine)}\n</spine>\n</package>\n')
+	return book
+
+# Pillow makes a PDF with one JPEG image per page
+def makePdf(bookDir, pages, width, height, overlap):
+	book = os.path.join(bookDir, "Benchmark.pdf")
+	imgs = [Image.fromarray(cv2.cvtColor(page, cv2.COLOR_BGR2RGB)) for page in fakeBooks.makePages(pages, width, height, overlap)]
+	imgs[0].save(book, save_all = True, append_images = imgs[1:])
+	return book
+
+if __name__ == "__main__":
+	main()
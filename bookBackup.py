@@ -0,0 +1,203 @@
+#	Comic Spread Stitch - for making digital comic books easier to read
+#	Copyright (C) 2024 Reed Mauzy
+#
+#	This program is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Keeps the original of each processed book, and puts it back when asked
+# full: the original is kept whole as bookFile_old
+# delta: only the parts of the original CBZ that aren't in the processed book are kept, in bookFile_delta
+# Pages that weren't changed are copied into the processed CBZ byte for byte, so a delta holds the changed pages and the ZIP headers,
+# and the original is rebuilt exactly, byte for byte, from the delta and the processed book
+# A delta only works with the book it was made against, so a book with a delta that's processed again has its delta remade
+# PDFs are rewritten from scratch, so they always get a full backup
+
+from zipfile import ZipFile, ZIP_STORED
+import zipUtils
+import atomicFile
+import argparse
+import hashlib
+import json
+import os
+import logging
+
+backupModes = ["full", "delta"]
+deltaSuffix = "_delta"
+backupSuffixes = [atomicFile.backupSuffix, deltaSuffix]
+deltaExts = [".cbz"]
+# the original is read and copied in pieces this big
+chunkSize = 1 << 20
+logger = logging.getLogger(__name__)
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("books", nargs = "+", help = "book files or book directories to put the original books back in, from their _old or _delta backups")
+	args = parser.parse_args()
+	for book in args.books:
+		if os.path.isdir(book):
+			bookFiles = [os.path.join(book, fileName[:-len(suffix)]) for fileName in sorted(os.listdir(book)) for suffix in backupSuffixes if fileName.endswith(suffix)]
+			if not bookFiles:
+				print(f"{book} has no backups in it.")
+		else:
+			bookFiles = [book]
+		for bookFile in bookFiles:
+			status, reason = restoreBook(bookFile)
+			print(reason)
+
+# keeps the original of bookFile in the way mode says to, unless backedup says there already is a backup, and puts newBookFile in its place
+def replaceBook(bookFile, newBookFile, backedup = False, mode = "full"):
+	deltaFile = bookFile + deltaSuffix
+	backupFile = bookFile + atomicFile.backupSuffix
+	# the delta won't work with the new book, so the original is rebuilt from it first and kept as a full backup until the new book is in place
+	if os.path.isfile(deltaFile):
+		with atomicFile.tempFile(backupFile) as newBackupFile:
+			restoreDelta(deltaFile, bookFile, newBackupFile)
+			atomicFile.replaceFile(newBackupFile, backupFile)
+		os.remove(deltaFile)
+		backedup = True
+	if mode != "delta" or os.path.splitext(bookFile)[1].lower() not in deltaExts:
+		atomicFile.replaceBook(bookFile, newBookFile, backedup)
+		return
+
+	with atomicFile.tempFile(deltaFile) as newDeltaFile:
+		size = writeDelta(backupFile if backedup else bookFile, newBookFile, newDeltaFile)
+		atomicFile.replaceFile(newDeltaFile, deltaFile)
+	logger.debug(f"Delta backup created, keeping {size} bytes of the original")
+	try:
+		atomicFile.replaceFile(newBookFile, bookFile)
+	except BaseException:
+		if not backedup:
+			os.remove(deltaFile)
+		raise
+	if backedup:
+		os.remove(backupFile)
+
+# writes the parts of originalFile that aren't in newBookFile to deltaFile, returning how many bytes of the original that was
+# a member is left out if newBookFile has one with the same name, CRC, and compressed size, which copyMember keeps the same
+def writeDelta(originalFile, newBookFile, deltaFile):
+	with ZipFile(newBookFile, "r") as newZip:
+		newMembers = {(info.filename, info.CRC, info.compress_size, info.compress_type) for info in newZip.infolist()}
+	with ZipFile(originalFile, "r") as originalZip:
+		# every member whose data can be taken from the new book, as [name, CRC, compressed size, where its data starts]
+		shared = [[info.filename, info.CRC, info.compress_size, zipUtils.dataOffset(originalZip, info)] for info in originalZip.infolist() if (info.filename, info.CRC, info.compress_size, info.compress_type) in newMembers]
+	shared.sort(key = lambda member: member[3])
+
+	# the original is a run of pieces that are kept, each followed by a member taken from the new book
+	segments = []
+	sha = hashlib.sha256()
+	keptSize = 0
+	with open(originalFile, "rb") as original, ZipFile(deltaFile, "w", ZIP_STORED) as delta:
+		with delta.open("data", "w", force_zip64 = True) as data:
+			position = 0
+			for name, crc, size, offset in shared + [[None, 0, 0, os.path.getsize(originalFile)]]:
+				if offset < position:
+					continue
+				copyRange(original, offset - position, sha, data)
+				keptSize += offset - position
+				copyRange(original, size, sha)
+				segments.append([offset - position] + ([name, crc, size] if name is not None else []))
+				position = offset + size
+		delta.writestr("delta.json", json.dumps({"size": position, "sha256": sha.hexdigest(), "segments": segments}))
+	return keptSize
+
+# reads size bytes from src into sha, and writes them to dst if it's given
+def copyRange(src, size, sha, dst = None):
+	while size > 0:
+		chunk = src.read(min(size, chunkSize))
+		if not chunk:
+			raise ValueError("Book ended before expected")
+		sha.update(chunk)
+		if dst:
+			dst.write(chunk)
+		size -= len(chunk)
+
+# rebuilds the original of bookFile from deltaFile into originalFile, checking that it's the same as when the delta was made
+def restoreDelta(deltaFile, bookFile, originalFile):
+	sha = hashlib.sha256()
+	with ZipFile(deltaFile, "r") as delta, ZipFile(bookFile, "r") as bookZip, open(originalFile, "wb") as original:
+		header = json.loads(delta.read("delta.json"))
+		members = {info.filename: info for info in bookZip.infolist()}
+		with delta.open("data", "r") as data:
+			for segment in header["segments"]:
+				copyRange(data, segment[0], sha, original)
+				if len(segment) == 1:
+					continue
+				name, crc, size = segment[1:]
+				info = members.get(name)
+				if info is None or info.CRC != crc or info.compress_size != size:
+					raise ValueError(f"{name} in {os.path.basename(bookFile)} has changed since {os.path.basename(deltaFile)} was made")
+				raw = zipUtils.readRawMember(bookZip, info)
+				sha.update(raw)
+				original.write(raw)
+	if sha.hexdigest() != header["sha256"]:
+		raise ValueError(f"The book rebuilt from {os.path.basename(deltaFile)} isn't the same as the original")
+
+# the size and hash of the original a delta was made from, without rebuilding it
+def deltaOriginal(deltaFile):
+	with ZipFile(deltaFile, "r") as delta:
+		header = json.loads(delta.read("delta.json"))
+	return header["size"], header["sha256"]
+
+# puts back the original of bookFile from whichever backup it has, returning (status, reason)
+def restoreBook(bookFile):
+	deltaFile = bookFile + deltaSuffix
+	backupFile = bookFile + atomicFile.backupSuffix
+	bookFileName = os.path.basename(bookFile)
+	try:
+		if os.path.isfile(backupFile):
+			atomicFile.replaceFile(backupFile, bookFile)
+			if os.path.isfile(deltaFile):
+				os.remove(deltaFile)
+		elif os.path.isfile(deltaFile):
+			with atomicFile.tempFile(bookFile) as originalFile:
+				restoreDelta(deltaFile, bookFile, originalFile)
+				atomicFile.replaceFile(originalFile, bookFile)
+			os.remove(deltaFile)
+		else:
+			return 1, f"{bookFileName} has no backup to restore."
+	except Exception as err:
+		return 2, f"Could not restore {bookFileName}: {err}"
+	return 0, f"{bookFileName} restored."
+
+# puts a book directory back the way it was before a run that was stopped while writing one of its books, see atomicFile.recoverBookDir
+# a delta is only kept if the book it goes with was put in place, and a full backup is kept over a delta
+# returns atomicFile.recoverBookDir's messages followed by one for each delta deleted
+def recoverBookDir(bookDir):
+	recovered = atomicFile.recoverBookDir(bookDir)
+	for fileName in sorted(os.listdir(bookDir)):
+		if not fileName.endswith(deltaSuffix):
+			continue
+		bookFile = os.path.join(bookDir, fileName[:-len(deltaSuffix)])
+		if os.path.isfile(bookFile + atomicFile.backupSuffix):
+			message = f"Deleted {fileName}, since there's a full backup"
+		elif os.path.isfile(bookFile) and isOriginal(bookFile, os.path.join(bookDir, fileName)):
+			message = f"Deleted {fileName}, since {os.path.basename(bookFile)} was never replaced"
+		else:
+			continue
+		os.remove(os.path.join(bookDir, fileName))
+		logger.warning(message)
+		recovered.append(message)
+	return recovered
+
+# whether bookFile is still the original a delta was made from, only reading it if it's the same size
+def isOriginal(bookFile, deltaFile):
+	size, originalHash = deltaOriginal(deltaFile)
+	if os.path.getsize(bookFile) != size:
+		return False
+	sha = hashlib.sha256()
+	with open(bookFile, "rb") as fp:
+		copyRange(fp, size, sha)
+	return sha.hexdigest() == originalHash
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,27 @@
+#	Comic Spread Stitch - for making digital comic books easier to read
+#	Copyright (C) 2024 Reed Mauzy
+#
+#	This program is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Lets whatever started a book being processed follow how far it has got, and stop it part way through
+# progress is a function that's called with (steps done, total steps) before the first page and after each page is done,
+# and it can raise Cancelled to stop the book, which leaves it as it was since nothing is put in its place until the end
+
+class Cancelled(Exception):
+	pass
+
+# calls progress if there is one
+def report(progress, done, total):
+	if progress:
+		progress(done, total)
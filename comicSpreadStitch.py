@@ -14,25 +14,50 @@
 #	You should have received a copy of the GNU General Public License
 #	along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
-import cv2
+# cv2, numpy, and the ePub and PDF modules (which load pypdf) take most of the time it takes to start,
+# so they're imported by the functions that use them, and a run that skips every line or only does PDFs doesn't wait on the rest
+# they're imported inside functions rather than lazily at the top, since books are processed on several threads at once
 from zipfile import ZipFile
 import os
-import shutil
-import numpy as np
-import epubToCbz
-import processPdf
+import posixpath
+import zipUtils
+import losslessJpeg
+import metrics
+import resultCache
+import atomicFile
+import runJournal
+import bookBackup
+import bookProgress
+import pageEncoder
 import argparse
 import traceback
 import logging
 import datetime
+import threading
+import hashlib
+import struct
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
 
-tempPath = "temp"
+# decode: decode, rotate, and re-encode the page, like any other change
+# lossless: rearrange the JPEG's blocks with jpegtran so no quality is lost
+# exif: only change the JPEG's EXIF orientation
+rotationModes = ["decode", "lossless", "exif"]
+imgExts = [".jpg", ".jpeg", ".png", ".webp", ".bmp", ".gif"]
+# overlap windows at least this wide are searched on scaled down pages first
+pyramidMinColumns = 64
+# columns compared for each overlap, overlaps looked at again at full size, and the percent of pixels that have to match, when searching scaled down pages
+matchColumns = 4
+refineCandidates = 3
+matchPercentile = 99.9
 logger = logging.getLogger(__name__)
 
 def main():
 	parser = argparse.ArgumentParser()
-	parser.add_argument("-o", "--overlap", type=int, default=50, help="number of columns to check for overlap")
-	parser.add_argument("-c", "--compression", type=int, default=75, help="fuzz factor for compression artifacts")
+	addBookOptions(parser)
+	parser.add_argument("-j", "--jobs", type=int, default=1, help="number of books to process at the same time")
+	parser.add_argument("-m", "--metrics", help="file to write how long each stage of each book took to as JSON lines")
+	parser.add_argument("-R", "--resume", action="store_true", help="keep track of the lines that are finished so that a run that's stopped can be carried on, and carry on from where the last run with the same options and -R was stopped, skipping the lines it finished")
 	args = parser.parse_args()
 	logging.basicConfig(filename = 'run.log', level = logging.INFO)
 	processed = 0
@@ -42,8 +67,16 @@ def main():
 	with open("pagesToProcess.txt", "r") as pagesFile:
 		lines = pagesFile.readlines()
 
-	for line in lines:
-		result, reason = processBook(line, args.overlap, args.compression)
+	summary = metrics.Summary(args.metrics) if args.metrics else None
+	options = getBookOptions(args)
+	# the journal flushes each line to the disk as it's finished, so it's only kept when asked for
+	journal = runJournal.RunJournal(runJournal.journalName, options, True) if args.resume else None
+	if journal and journal.finished:
+		print(f"Resuming the last run, so {sum(journal.isFinished(line) for line in lines)} lines it finished are being skipped.")
+		lines = [line for line in lines if not journal.isFinished(line)]
+	for message in recoverBookDirs(lines):
+		print(message)
+	for result, reason in processBooks(lines, jobs = args.jobs, summary = summary, journal = journal, **options):
 		match result:
 			case 0:
 				processed += 1
@@ -54,22 +87,142 @@ def main():
 			case _:
 				print("Unexpected result for book")
 		print(reason)
+	if journal:
+		journal.finish()
 
 	print(f"{processed} books processed, {skipped} skipped, and {errors} errors. See output above for results.\n")
+	if summary:
+		print(summary.report())
+
+# the options that change how each book is processed, shared with the other scripts that process books
+def addBookOptions(parser):
+	parser.add_argument("-o", "--overlap", type=int, default=50, help="number of columns to check for overlap")
+	parser.add_argument("-c", "--compression", type=int, default=75, help="fuzz factor for compression artifacts")
+	parser.add_argument("-r", "--rotation", choices=rotationModes, default="decode", help="how to rotate JPEG pages that aren't stitched")
+	parser.add_argument("-k", "--cache", action="store_true", help="remember what was done to each book so that the same line isn't processed twice and stitched pages can be reused")
+	parser.add_argument("-f", "--format", choices=pageEncoder.outputFormats, default="same", help="format to save changed CBZ and ePub pages in")
+	parser.add_argument("-q", "--quality", type=int, help="quality to save changed JPEG and WebP pages at, from 0 to 100")
+	parser.add_argument("-p", "--png-compression", type=int, choices=range(10), metavar="0-9", help="compression level to save changed PNG pages at, from 0 (fastest) to 9 (smallest)")
+	parser.add_argument("-e", "--encode-threads", type=int, default=None, help="number of pages of each book to encode at the same time; defaults to a few more than the number of CPUs")
+	parser.add_argument("-l", "--low-memory", action="store_true", help="write PDFs to the disk a page at a time instead of keeping the whole book in memory, and stitch spreads into a single buffer")
+	parser.add_argument("-b", "--backup", choices=bookBackup.backupModes, default="full", help="keep the whole original of each processed CBZ, or only the parts that changed; see bookBackup.py to put originals back")
+
+# the keyword arguments to processBook for the options added by addBookOptions
+def getBookOptions(args):
+	encoding = {"imgFormat": args.format, "quality": args.quality, "pngCompression": args.png_compression, "threads": args.encode_threads}
+	return {"overlap": args.overlap, "compression": args.compression, "rotation": args.rotation, "cache": args.cache, "lowMemory": args.low_memory, "encoding": encoding, "backupMode": args.backup}
+
+# puts the directories of the books in lines back the way they were before a run that was stopped while writing one of their books,
+# since a backup left behind would make a book look already processed, and returns the messages for each directory with its name in front
+# this has to be done before any of the books are processed, since it can't tell a backup from a stopped run apart from one another book
+# in the same directory is part way through making
+# a directory that can't be recovered is reported and left as it is, so that it doesn't stop the rest of the run
+def recoverBookDirs(lines):
+	recovered = []
+	for bookDir in dict.fromkeys(getBookDir(line) for line in lines):
+		if not (bookDirIsValid(bookDir)[0] and os.path.isdir(bookDir)):
+			continue
+		try:
+			recovered += [f"{bookDir}: {message}" for message in bookBackup.recoverBookDir(bookDir)]
+		except Exception as err:
+			message = f"Could not recover {bookDir} from the last run: {err}"
+			logger.warning(message)
+			recovered.append(message)
+	return recovered
+
+# yields the (status, reason) result of each line in the same order as the lines were given
+# with more than one job, the book directories are handed out to a pool of worker processes
+# if a metrics.Summary is given, each stage of each book is timed and added to it
+# if a runJournal.RunJournal is given, each line is recorded in it as soon as its book is done, even if the lines before it aren't yet
+def processBooks(lines, overlap = 50, compression = 75, jobs = 1, rotation = "decode", summary = None, cache = False, lowMemory = False, encoding = None, journal = None, backupMode = "full"):
+	process = processMeasuredBook if summary else processBook
+	if jobs <= 1:
+		results = map(process, lines, repeat(overlap), repeat(compression), repeat(rotation), repeat(cache), repeat(lowMemory), repeat(encoding), repeat(backupMode))
+		if journal:
+			results = map(recordResult, repeat(journal), lines, results)
+		yield from collectResults(results, summary)
+	else:
+		# lines for the same book directory would write the same files, so each directory's lines are processed in order by one worker
+		bookDirLines = {}
+		for index, line in enumerate(lines):
+			bookDirLines.setdefault(getBookDir(line), []).append(index)
+		with ProcessPoolExecutor(max_workers = jobs) as executor:
+			# the future each line's result will come from, and where it is in that future's results
+			lineResults = [None] * len(lines)
+			for indices in bookDirLines.values():
+				dirLines = [lines[index] for index in indices]
+				future = executor.submit(processBookDir, process, dirLines, overlap, compression, rotation, cache, lowMemory, encoding, backupMode)
+				if journal:
+					future.add_done_callback(lambda future, dirLines = dirLines: future.cancelled() or future.exception() or [recordResult(journal, line, result) for line, result in zip(dirLines, future.result())])
+				for position, index in enumerate(indices):
+					lineResults[index] = (future, position)
+			yield from collectResults((future.result()[position] for future, position in lineResults), summary)
+
+# processes lines that are all for the same book directory one after the other, returning their results in order
+def processBookDir(process, lines, *args):
+	return [process(line, *args) for line in lines]
+
+# the book directory a line is for
+def getBookDir(line):
+	return line.split("|")[0]
+
+def recordResult(journal, line, result):
+	journal.record(line, result[0])
+	return result
+
+def collectResults(results, summary):
+	for result in results:
+		if summary:
+			status, reason, bookMetrics = result
+			summary.add(bookMetrics)
+			yield status, reason
+		else:
+			yield result
 
+# processes a book while timing each stage of it
+def processMeasuredBook(line, overlap = 50, compression = 75, rotation = "decode", cache = False, lowMemory = False, encoding = None, backupMode = "full"):
+	with metrics.measureBook(line) as bookMetrics:
+		status, reason = processBook(line, overlap, compression, rotation, cache, lowMemory, encoding, backupMode)
+	bookMetrics.status = status
+	return status, reason, bookMetrics.toDict()
 
-def processBook(line, overlap = 50, compression = 75):
+# sends everything logged on this thread to run.log in the book's directory
+# the handler only takes records from the calling thread so that books being processed at the same time don't end up in each other's logs
+def addBookLog(bookDir):
+	handler = logging.FileHandler(os.path.join(bookDir, "run.log"))
+	handler.setLevel(logging.INFO)
+	handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+	thread = threading.get_ident()
+	handler.addFilter(lambda record: record.thread == thread)
+	rootLogger = logging.getLogger()
+	if rootLogger.getEffectiveLevel() > logging.INFO:
+		rootLogger.setLevel(logging.INFO)
+	rootLogger.addHandler(handler)
+	return handler
+
+def removeBookLog(handler):
+	logging.getLogger().removeHandler(handler)
+	handler.close()
+
+# with cache, a line that has already been processed is skipped, and a book processed before with different pages is processed again from its backup
+# with lowMemory, PDFs are written to the disk a page at a time and spreads are stitched into a single buffer
+# encoding is a dict of the arguments to pageEncoder.PageEncoder that changed CBZ and ePub pages are encoded with
+# backupMode is one of bookBackup.backupModes, and says how the original of a processed CBZ is kept
+# progress is called as the pages of the book are done and can stop the book part way through, see bookProgress
+def processBook(line, overlap = 50, compression = 75, rotation = "decode", cache = False, lowMemory = False, encoding = None, backupMode = "full", progress = None):
 	bookDir = ""
+	logHandler = None
 	try:
 		parts = line.split("|")
 		bookDir = parts[0]
 		validBookDir, reason = bookDirIsValid(bookDir)
 		if not validBookDir:
 			return 1, reason
-		logging.basicConfig(force = True, filename = os.path.join(bookDir, "run.log"), level = logging.INFO)
+		logHandler = addBookLog(bookDir)
 		logger.info(f"Running at {datetime.datetime.now()}")
 		logger.debug(f"Overlap checking is {overlap} columns")
 		logger.debug(f"Maximum allowable compression fuzz is {compression}")
+		logger.debug(f"Rotation mode is {rotation}")
 		logger.info(f"Line is {line}")
 		manga, backedup, epub, pdf, rightlines, unknownFlag = getBookFlags(parts[2:])
 		logger.debug(f"manga = {manga}")
@@ -82,9 +235,6 @@ def processBook(line, overlap = 50, compression = 75):
 		pageNumbersNotPresent = (len(parts) >= 2 and parts[1].strip() == "") or len(parts) < 2
 		logging.debug(f"Page numbers are{' not' if pageNumbersNotPresent else ''} present")
 
-		os.chdir(bookDir)
-		logger.debug(f"Changed directory into {os.getcwd()}")
-
 		if epub:
 			bookFileType = "ePub"
 		elif pdf:
@@ -92,14 +242,50 @@ def processBook(line, overlap = 50, compression = 75):
 		else:
 			bookFileType = "CBZ"
 		logger.debug(f"Book file type is {bookFileType}")
-		validBookFile, bookFileName = findBookFile(backedup, epub, pdf)
-		if not validBookFile:
-			logger.warning(f"Skipping book because book filename is not valid. Message is: {bookFileName}")
-			return 1, bookFileName
+
+		bookCache = None
+		sourceFile = None
+		if cache:
+			bookCache = resultCache.ResultCache(bookDir)
+			job = {"pages": "".join(parts[1].split()) if len(parts) >= 2 else "", "manga": manga, "rightlines": rightlines, "epub": epub, "pdf": pdf, "overlap": overlap, "compression": compression, "rotation": rotation}
+			# how many threads pages are encoded in doesn't change the result
+			job.update({key: value for key, value in (encoding or {}).items() if key != "threads"})
+			outputName, previous = bookCache.findResult(".pdf" if pdf else ".cbz")
+			if previous and bookCache.isSameJob(previous, job):
+				logger.info("Skipping because the book has already been processed with the same pages and options")
+				return 1, f"{outputName} has already been processed with the same pages and options. Skipping."
+			# a CBZ that this script made from a backup that's still there can be made again from that backup instead of being processed twice
+			# a delta backup isn't a whole book, so it can't be processed from
+			if previous and not epub and not pdf and not backedup and bookCache.sourceIsUnchanged(previous) and previous["source"].endswith(atomicFile.backupSuffix):
+				sourceFile = os.path.join(bookDir, previous["source"])
+				logger.info(f"Processing again from {previous['source']}")
+
+		if sourceFile:
+			bookFileName = outputName
+		else:
+			validBookFile, bookFileName = findBookFile(backedup, epub, pdf, bookDir)
+			if not validBookFile:
+				logger.warning(f"Skipping book because book filename is not valid. Message is: {bookFileName}")
+				return 1, bookFileName
 		logger.debug(f"Book filename is {bookFileName}")
+		bookFile = os.path.join(bookDir, bookFileName)
+
+		# the file each kind of job reads from and the one it leaves behind, for the cache
+		if epub:
+			sourceName, outputName = bookFileName, os.path.splitext(bookFileName)[0] + ".cbz"
+		elif sourceFile:
+			sourceName, outputName = previous["source"], bookFileName
+		else:
+			backupSuffix = bookBackup.deltaSuffix if backupMode == "delta" and not pdf else atomicFile.backupSuffix
+			sourceName, outputName = None if backedup else bookFileName + backupSuffix, bookFileName
 
 		if pageNumbersNotPresent and epub:
-			return epubToCbz.convertEpubToCbz(os.path.join(bookDir, bookFileName))
+			import epubToCbz
+			with metrics.stage("epub", size = os.path.getsize(bookFile)):
+				status, reason = epubToCbz.convertEpubToCbz(bookFile, progress)
+			if not status and bookCache:
+				bookCache.addResult(outputName, sourceName, job)
+			return status, reason
 
 		if pageNumbersNotPresent and pdf:
 			logger.warning("Skipping because conversion from PDF to CBZ in main app are not permitted — use pdfToCbz.py instead")
@@ -108,29 +294,12 @@ def processBook(line, overlap = 50, compression = 75):
 		# This should not be reached if pageNumbersNotPresent and epub, as there is a return statement in that if block
 		if pageNumbersNotPresent and rightlines:
 			logger.info("Only requesting to remove right lines")
-			with ZipFile(bookFileName, 'r') as zipf:
-				zipf.extractall(path = tempPath)
-			os.chdir(tempPath)
-			logger.debug(f"Changed directory into {os.getcwd()}")
-			imgList = getCbzImgs()
-			logger.debug(f"Image list is {imgList}")
-			removeRightLines(imgList)
-			logger.debug("Right lines removed")
-			os.chdir(bookDir)
-			logger.debug(f"Changed directory into {os.getcwd()}")
-			if not backedup:
-				os.rename(bookFileName, bookFileName + "_old")
-				logger.debug("Backup made")
-			else:
-				logger.debug("backedup flag is set, so no backup made")
-			with ZipFile(bookFileName, 'w') as newZip:
-				for file in imgList:
-					filePath = os.path.join(tempPath, file)
-					newZip.write(filePath, arcname = file)
-			logger.debug(f"{bookFileName} has been written to disk")
-			shutil.rmtree(tempPath)
-			logger.debug(f"{tempPath} deleted")
-			logger.info("Right lines removed from book")
+			status, reason = processCbz(bookFile, [], manga, backedup or sourceFile is not None, rightlines, overlap, compression, rotation, bookCache, sourceFile, lowMemory, encoding, backupMode, progress)
+			if status:
+				logger.warning(reason)
+				return status, reason
+			if bookCache:
+				bookCache.addResult(outputName, sourceName, job)
 			logger.info("Processing complete")
 			return 0, f"{bookFileName} has had the right lines removed."
 
@@ -146,147 +315,337 @@ def processBook(line, overlap = 50, compression = 75):
 		logger.debug(f"Page list is {pages}")
 
 		if pdf:
-			status, reason = processPdf.processPdf(bookFileName, pages, manga, backedup)
+			import processPdf
+			with metrics.stage("pdf", size = os.path.getsize(bookFile)):
+				status, reason = processPdf.processPdf(bookFile, pages, manga, backedup, lowMemory, progress)
 			if status:
 				logger.warning(reason)
 				return status, reason
 			else:
+				if bookCache:
+					bookCache.addResult(outputName, sourceName, job)
 				logger.info("Processing complete")
 				return 0, getResultString(bookFileName, pages)
 
-		with ZipFile(bookFileName, 'r') as zipf:
-			zipf.extractall(path = tempPath)
-		logger.debug(f"Extracted ZIP archive to {tempPath}")
+		if epub:
+			status, reason = processEpub(bookFile, pages, manga, rightlines, overlap, compression, rotation, bookCache, lowMemory, encoding, progress)
+		else:
+			status, reason = processCbz(bookFile, pages, manga, backedup or sourceFile is not None, rightlines, overlap, compression, rotation, bookCache, sourceFile, lowMemory, encoding, backupMode, progress)
+		if status:
+			logger.warning(reason)
+			return status, reason
+		if bookCache:
+			bookCache.addResult(outputName, sourceName, job)
+
+		logger.info("Processing complete")
+		return 0, getResultString(bookFileName, pages)
 
-		os.chdir(tempPath)
-		logger.debug(f"Changed directory into {os.getcwd()}")
+	except bookProgress.Cancelled:
+		logger.warning("Cancelled, so the book was left as it was")
+		return 1, f"Processing {bookDir} was cancelled. The book was left as it was."
 
-		if not epub:
-			imgList = getCbzImgs()
+	except Exception as err:
+		if bookDir == "":
+			reason = f"Error occurred before book directory could be read in.\n{traceback.format_exc()}"
 		else:
-			docDir, opfFile = epubToCbz.findOpfEnterDoc(bookDir, tempPath)
+			reason = f"Error occurred while processing {bookDir}.\n{traceback.format_exc()}"
+		logger.error(reason)
+		return 2, reason
+
+	finally:
+		if logHandler:
+			removeBookLog(logHandler)
+
+# processes a CBZ without extracting it, only decoding the pages that are changed
+# the new archive is written next to the old one and only replaces it once it's complete, see atomicFile
+# if sourceFile is given, the pages are read from it instead of from bookFile, so a book can be processed again from its backup
+def processCbz(bookFile, pages, manga, backedup, rightlines, columns, compressionFuzz, rotation = "decode", pageCache = None, sourceFile = None, lowMemory = False, encoding = None, backupMode = "full", progress = None):
+	with atomicFile.tempFile(bookFile) as newBookFile:
+		with ZipFile(sourceFile if sourceFile else bookFile, 'r') as zipf, pageEncoder.PageEncoder(**(encoding or {})) as encoder:
+			imgList = getZipImgs(zipf)
+			logger.debug(f"Image list is {imgList}")
+			if pages and lastPageIsPastEnd(pages, len(imgList)):
+				return 1, f"{os.path.dirname(bookFile)} skipped because the last page to process is past the end of the book."
+
+			pageStore = ZipPages(zipf, encoder)
+			if rightlines:
+				removeRightLines(imgList, pageStore, progress = progress)
+				logger.info("Right lines removed from book")
+			if pages:
+				imgList = processPages(imgList, pages, manga, columns, compressionFuzz, pageStore, rotation, pageCache, lowMemory, progress)
+				logger.info("Pages processed")
+				logger.debug(f"Image list is {imgList}")
+
+			with ZipFile(newBookFile, 'w') as newZip:
+				pageStore.writeZip(newZip)
+			logger.debug(f"{newBookFile} has been written to disk")
+
+		with metrics.stage("replace"):
+			bookBackup.replaceBook(bookFile, newBookFile, backedup, backupMode)
+	logger.info("CBZ written to disk")
+	return 0, ""
+
+# processes the pages of an ePub and writes them out as a CBZ next to it
+# the ePub is never extracted; its OPF file, XHTML files, and images are all read straight out of it
+def processEpub(bookFile, pages, manga, rightlines, columns, compressionFuzz, rotation = "decode", pageCache = None, lowMemory = False, encoding = None, progress = None):
+	import epubToCbz
+	bookFileName = os.path.basename(bookFile)
+	cbzFile = os.path.splitext(bookFile)[0] + ".cbz"
+	with atomicFile.tempFile(cbzFile) as newCbzFile:
+		with ZipFile(bookFile, 'r') as zipf, pageEncoder.PageEncoder(**(encoding or {})) as encoder:
+			with metrics.stage("parse"):
+				docDir, opfFile = epubToCbz.findOpfInZip(zipf)
+				if opfFile:
+					manifest, spine = epubToCbz.getManifestAndSpine(posixpath.join(docDir, opfFile), zipf)
+					imgList = [posixpath.join(docDir, img) for img in epubToCbz.getImageFilenames(manifest, spine, docDir, zipf)]
 			if not opfFile:
-				logger.warning("Skipping book because the OPF file could not be found")
 				return 1, f"Skipping {bookFileName} because the OPF file could not be found."
-			manifest, spine = epubToCbz.getManifestAndSpine(opfFile)
 			logger.debug(f"Manifest is {manifest}")
 			logger.debug(f"Spine is {spine}")
-			imgList = epubToCbz.getImageFilenames(manifest, spine)
-		logger.debug(f"Image list is {imgList}")
-
-		# imgList = os.listdir()
-		# # check to see if the image files are in a subdirectory and bring them out if so
-		# while os.path.isdir(imgList[0]):
-		# for file in os.listdir(imgList[0]):
-		# shutil.move(os.path.join(imgList[0], file), file)
-		# os.rmdir(imgList[0])
-		# imgList = os.listdir()
-
-		# check whether imgList is long enough to account for all of pages
-		if (pages[-1][1] in ["l", "r", "d"] and len(imgList) < pages[-1][0]) or (
-				not (pages[-1][1] in ["l", "r", "d"]) and len(imgList) < pages[-1][0] + 1):
-			logger.warning("Book skipped because the last page to process is past the end of the book")
-			os.chdir(bookDir)
-			logger.debug(f"Changed directory into {os.getcwd()}")
-			shutil.rmtree(tempPath)
-			logger.debug(f"{tempPath} deleted")
-			return 1, f"{bookDir} skipped because the last page to process is past the end of the book."
-
-		if rightlines:
-			removeRightLines(imgList)
-			logger.info("Right lines removed from book")
-
-		imgList = processPages(imgList, pages, manga, overlap, compression)
-		logger.info("Pages processed")
-		logger.debug(f"Image list is {imgList}")
-
-		# this if statement may not be necessary given that processPages returns imgList
-		if not epub:
-			imgList = os.listdir()
 			logger.debug(f"Image list is {imgList}")
-		os.chdir(bookDir)
-		logger.debug(f"Changed directory into {os.getcwd()}")
-		if not backedup and not epub:
-			os.rename(bookFileName, bookFileName + "_old")
-			logger.debug("Backup created")
-		elif epub:
+
+			# check whether imgList is long enough to account for all of pages
+			if lastPageIsPastEnd(pages, len(imgList)):
+				return 1, f"{os.path.dirname(bookFile)} skipped because the last page to process is past the end of the book."
+
+			pageStore = ZipPages(zipf, encoder)
+			if rightlines:
+				removeRightLines(imgList, pageStore, progress = progress)
+				logger.info("Right lines removed from book")
+
+			imgList = processPages(imgList, pages, manga, columns, compressionFuzz, pageStore, rotation, pageCache, lowMemory, progress)
+			logger.info("Pages processed")
+			logger.debug(f"Image list is {imgList}")
 			logger.debug("Backup not created because the input is ePub and the output is CBZ")
-		else:
-			logger.debug("Backup not created because a backup already exists")
 
-		# create new CBZ file with the combined pages
-		if epub:
-			epubToCbz.buildCbzFile(imgList, os.path.join(tempPath, docDir), bookFileName[:-4] + "cbz")
-		else:
-			with ZipFile(bookFileName, 'w') as newZip:
-				for file in imgList:
-					filePath = os.path.join(tempPath, file)
-					newZip.write(filePath, arcname = file)
-		logger.info("CBZ written to disk")
+			# create new CBZ file with the combined pages
+			with ZipFile(newCbzFile, 'w') as newZip:
+				pageStore.writeZip(newZip, list(zip(imgList, epubToCbz.getCbzImgNames(imgList))))
+		with metrics.stage("replace"):
+			atomicFile.replaceFile(newCbzFile, cbzFile)
+	logger.info("CBZ written to disk")
+	return 0, ""
 
-		shutil.rmtree(tempPath)
-		logger.debug(f"{tempPath} deleted")
+def lastPageIsPastEnd(pages, pageCount):
+	if pages[-1][1] in ["l", "r", "d"]:
+		return pageCount < pages[-1][0]
+	return pageCount < pages[-1][0] + 1
 
-		logger.info("Processing complete")
-		return 0, getResultString(bookFileName, pages)
+# reads, writes, and removes page images in a directory
+# pages are encoded with encoder, and a page converted to another format replaces the file it came from
+# but is still read, written, and removed under its old name
+class DirPages:
+	def __init__(self, imgDir = "", encoder = None):
+		self.imgDir = imgDir
+		self.encoder = encoder if encoder else pageEncoder.PageEncoder()
+		self.names = {}
+	
+	def path(self, img):
+		return os.path.join(self.imgDir, self.names.get(img, img))
+	
+	def read(self, img):
+		import cv2
+		with metrics.stage("decode", img, os.path.getsize(self.path(img))):
+			return cv2.imread(self.path(img))
+	
+	def readBytes(self, img):
+		with metrics.stage("read", img) as readStage, open(self.path(img), "rb") as fp:
+			data = fp.read()
+			readStage.size = len(data)
+			return data
+	
+	def write(self, img, page):
+		self.writeBytes(img, self.encoder.encode(img, page), self.encoder.outputName(img))
+	
+	# name is the name the page is saved under, which defaults to img and is only different if data is in another format
+	# if another file already has that name, the page keeps the name it has
+	def writeBytes(self, img, data, name = None):
+		name = name if name else img
+		if name != self.names.get(img, img) and os.path.exists(os.path.join(self.imgDir, name)):
+			logger.debug(f"Kept the name of {img} because {name} already exists")
+			name = self.names.get(img, img)
+		if name != self.names.get(img, img):
+			os.remove(self.path(img))
+			self.names[img] = name
+		with metrics.stage("write", img, len(data)), open(self.path(img), "wb") as fp:
+			fp.write(data)
+	
+	def remove(self, img):
+		os.remove(self.path(img))
+	
+	# identifies the contents of a page, for the stitched page cache
+	def fingerprint(self, img):
+		return hashlib.sha256(self.readBytes(img)).hexdigest()
 
-	except Exception as err:
-		if bookDir == "":
-			reason = f"Error occurred before book directory could be read in.\n{traceback.format_exc()}"
+# reads, writes, and removes page images in an open ZIP archive without extracting it
+# pages are only decoded when they're read, and written pages are kept encoded in memory until writeZip is called
+# pages are encoded with encoder, which may still be encoding them in the background until they're read or written out
+# a page converted to another format is still read, written, and removed under its old name, and gets its new extension in writeZip
+# unless another member already has that name, in which case it keeps its old one
+class ZipPages:
+	def __init__(self, zipf, encoder = None):
+		self.zipf = zipf
+		self.encoder = encoder if encoder else pageEncoder.PageEncoder()
+		self.changed = {}
+		self.names = {}
+		self.removed = set()
+		# ZipFile keeps count of its open members without a lock, so pages are read one at a time
+		self.lock = threading.Lock()
+	
+	def read(self, img):
+		data = self.readBytes(img)
+		with metrics.stage("decode", img, len(data)):
+			return decodePage(data)
+	
+	def readBytes(self, img):
+		if img in self.changed:
+			return pageEncoder.result(self.changed[img])
+		with metrics.stage("read", img) as readStage, self.lock:
+			data = self.zipf.read(img)
+			readStage.size = len(data)
+			return data
+	
+	def write(self, img, page):
+		self.writeBytes(img, self.encoder.submit(img, page), self.encoder.outputName(img))
+	
+	# name is the name the page is saved under, which defaults to img and is only different if data is in another format
+	def writeBytes(self, img, data, name = None):
+		self.changed[img] = data
+		if name and name != img:
+			self.names[img] = name
 		else:
-			reason = f"Error occurred while processing {bookDir}.\n{traceback.format_exc()}"
-		logger.error(reason)
-		return 2, reason
+			self.names.pop(img, None)
+		self.removed.discard(img)
+	
+	def remove(self, img):
+		self.removed.add(img)
+		self.changed.pop(img, None)
+		self.names.pop(img, None)
+	
+	# identifies the contents of a page, for the stitched page cache
+	# pages that haven't been changed are identified by the CRC and size in the archive so that they don't have to be read
+	def fingerprint(self, img):
+		if img in self.changed:
+			return hashlib.sha256(self.readBytes(img)).hexdigest()
+		info = self.zipf.getinfo(img)
+		return f"{info.CRC:08x}-{info.file_size}"
+	
+	# copies the members of the source archive into newZip, leaving out the removed pages
+	# members is a list of (name in source archive, name in newZip) pairs and defaults to every member, in the same order, under the same name
+	# members that haven't changed are copied without being decompressed, and changed pages are stored without compression
+	def writeZip(self, newZip, members = None):
+		if members is None:
+			members = [(info.filename, info.filename) for info in self.zipf.infolist()]
+		members = [(name, arcname) for name, arcname in members if name not in self.removed]
+		arcnames = set(arcname for name, arcname in members)
+		for name, arcname in members:
+			info = self.zipf.getinfo(name)
+			if name in self.changed:
+				data = self.readBytes(name)
+				if name in self.names:
+					newArcname = os.path.splitext(arcname)[0] + os.path.splitext(self.names[name])[1]
+					if newArcname in arcnames:
+						logger.debug(f"Kept the name of {name} because {newArcname} is already in the archive")
+					else:
+						arcnames.discard(arcname)
+						arcnames.add(newArcname)
+						arcname = newArcname
+				with metrics.stage("write", name, len(data)):
+					zipUtils.writeMember(newZip, arcname, data, info.external_attr)
+			else:
+				with metrics.stage("copy", name, info.compress_size):
+					zipUtils.copyMember(self.zipf, info, newZip, arcname)
+
+# imgList is in the order pages are numbered in, and pageStore defaults to image files in the working directory
+# rotation is one of rotationModes and only applies to JPEG pages that are rotated without being stitched
+# stitched pages are saved in pageCache if it's given, and taken from it instead of being stitched again if the same pages were stitched the same way before
+# with lowMemory, spreads are stitched and rotated into a single buffer the size of the finished page, see stitchPagesLowMemory
+# progress is called with how many of the pages in pageList are done, see bookProgress
+def processPages(imgList, pageList, manga, columns, compressionFuzz, pageStore = None, rotation = "decode", pageCache = None, lowMemory = False, progress = None):
+	import cv2
+	if pageStore is None:
+		pageStore = DirPages()
 
-def processPages(imgList, pageList, manga, columns, compressionFuzz):
-	for page in pageList:
+	bookProgress.report(progress, 0, len(pageList))
+	for pageIndex, page in enumerate(pageList):
 		# delete page
 		if page[1] == "d":
-			os.remove(imgList[page[0] - 1])
+			pageStore.remove(imgList[page[0] - 1])
 			logger.info(f"Deleted page {page[0]}")
 		
+		# rotate JPEG without decoding it
+		elif page[1] in ["l", "r"] and rotation != "decode" and rotateJpeg(pageStore, imgList[page[0] - 1], page[1] == "r", rotation):
+			logger.info(f"Rotated page {page[0]} {'counterclockwise' if page[1] == 'l' else 'clockwise'} without decoding it")
+		
 		# rotate without stitching
 		elif page[1] in ["l", "r"]:
 			# read in the page I want
-			img = cv2.imread(imgList[page[0] - 1])
+			img = pageStore.read(imgList[page[0] - 1])
 			
-			if page[1] == "l":
-				# rotate left
-				img = cv2.rotate(img, cv2.ROTATE_90_COUNTERCLOCKWISE)
-			elif page[1] == "r":
-				# rotate right
-				img = cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE)
+			with metrics.stage("rotate", imgList[page[0] - 1]):
+				if page[1] == "l":
+					# rotate left
+					img = cv2.rotate(img, cv2.ROTATE_90_COUNTERCLOCKWISE)
+				elif page[1] == "r":
+					# rotate right
+					img = cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE)
 			
 			# save image
-			cv2.imwrite(imgList[page[0] - 1], img)
+			pageStore.write(imgList[page[0] - 1], img)
 			logger.info(f"Rotated page {page[0]} {'counterclockwise' if page[1] == 'l' else 'clockwise'}")
 		
+		# stitch and possibly rotate, reusing the result from last time if nothing that goes into it has changed
+		elif pageCache and reuseStitchedPage(pageCache, pageStore, imgList, page, manga, columns, compressionFuzz):
+			logger.info(f"Reused stitched pages {page[0]} and {page[0] + 1} from the cache")
+			if not page[0] == 0:
+				pageStore.remove(imgList[page[0]])
+				logger.debug(f"Removed page {page[0] + 1}")
+		
 		# stitch and possibly rotate
 		else:
-			# read in the two pages I want to combine
-			# this is page - 1 and page because python lists are 0-indexed and the page numbers are 1-indexed
-			# print("{}, {}".format(page - 1, page))
-			img1 = cv2.imread(imgList[page[0] - 1])
-			img2 = cv2.imread(imgList[page[0]])
-			
-			# horizontally concatenate the two pages
-			if manga:
-				# combImg = cv2.hconcat([img2, img1])
-				combImg = stitchPages(img2, img1, columns, compressionFuzz)
-			else:
-				# combImg = cv2.hconcat([img1, img2])
-				combImg = stitchPages(img1, img2, columns, compressionFuzz)
-			
-			# rotate if needed
-			if page[1] == "m":
-				# rotate left
-				combImg = cv2.rotate(combImg, cv2.ROTATE_90_COUNTERCLOCKWISE)
-			elif page[1] == "s":
-				# rotate right
-				combImg = cv2.rotate(combImg, cv2.ROTATE_90_CLOCKWISE)
+			# the key has to be worked out before the first page is overwritten
+			if pageCache:
+				cacheKey = stitchKey(pageCache, pageStore, imgList, page, manga, columns, compressionFuzz)
+			combImg = None
+			if lowMemory:
+				if manga:
+					combImg = stitchPagesLowMemory(pageStore, imgList[page[0]], imgList[page[0] - 1], columns, compressionFuzz, page[1])
+				else:
+					combImg = stitchPagesLowMemory(pageStore, imgList[page[0] - 1], imgList[page[0]], columns, compressionFuzz, page[1])
+			if combImg is None:
+				# read in the two pages I want to combine
+				# this is page - 1 and page because python lists are 0-indexed and the page numbers are 1-indexed
+				# print("{}, {}".format(page - 1, page))
+				img1 = pageStore.read(imgList[page[0] - 1])
+				img2 = pageStore.read(imgList[page[0]])
+				
+				# horizontally concatenate the two pages
+				if manga:
+					# combImg = cv2.hconcat([img2, img1])
+					combImg = stitchPages(img2, img1, columns, compressionFuzz)
+				else:
+					# combImg = cv2.hconcat([img1, img2])
+					combImg = stitchPages(img1, img2, columns, compressionFuzz)
+				stitchBytes = img1.nbytes + img2.nbytes + combImg.nbytes
+				
+				# rotate if needed
+				with metrics.stage("rotate", imgList[page[0] - 1]):
+					if page[1] == "m":
+						# rotate left
+						combImg = cv2.rotate(combImg, cv2.ROTATE_90_COUNTERCLOCKWISE)
+						stitchBytes += combImg.nbytes
+					elif page[1] == "s":
+						# rotate right
+						combImg = cv2.rotate(combImg, cv2.ROTATE_90_CLOCKWISE)
+						stitchBytes += combImg.nbytes
+				del img1, img2
+				metrics.recordStitchMemory(stitchBytes)
+				logger.debug(f"Stitching pages {page[0]} and {page[0] + 1} held {stitchBytes / 1000000:.1f} MB of images")
 			
 			# overwrite the first page with the combined pages
-			cv2.imwrite(imgList[page[0] - 1], combImg)
+			pageStore.write(imgList[page[0] - 1], combImg)
+			if pageCache:
+				pageCache.putPage(cacheKey, pageStore.readBytes(imgList[page[0] - 1]))
 			if page[1] in ['m', 's']:
 				logger.info(f"Stitched together pages {page[0]} and {page[0] + 1} and rotated them {'counterclockwise' if page[1] == 'm' else 'clockwise'}")
 			else:
@@ -295,8 +654,10 @@ def processPages(imgList, pageList, manga, columns, compressionFuzz):
 			# remove the second page so I don't see it again separately from the combined pages
 			# unless I'm combining the front and back covers, in which case the front cover gets to stay as it is
 			if not page[0] == 0:
-				os.remove(imgList[page[0]])
+				pageStore.remove(imgList[page[0]])
 				logger.debug(f"Removed page {page[0] + 1}")
+		
+		bookProgress.report(progress, pageIndex + 1, len(pageList))
 	
 	for page in reversed(pageList):
 		if page[1] == "d":
@@ -306,21 +667,213 @@ def processPages(imgList, pageList, manga, columns, compressionFuzz):
 	
 	return imgList
 
+# the cache key for stitching the pages in page together, made from the pages themselves and everything that changes how they're stitched
+def stitchKey(pageCache, pageStore, imgList, page, manga, columns, compressionFuzz):
+	img1, img2 = imgList[page[0] - 1], imgList[page[0]]
+	return pageCache.stitchKey(pageStore.fingerprint(img1), pageStore.fingerprint(img2), os.path.splitext(img1)[1].lower(), pageStore.encoder.settings(), page[1], manga, columns, compressionFuzz)
+
+# writes the stitched page saved in pageCache the last time the same pages were stitched the same way over the first page
+# returns False if there isn't one, in which case the pages are left alone
+def reuseStitchedPage(pageCache, pageStore, imgList, page, manga, columns, compressionFuzz):
+	data = pageCache.getPage(stitchKey(pageCache, pageStore, imgList, page, manga, columns, compressionFuzz))
+	if data is None:
+		return False
+	pageStore.writeBytes(imgList[page[0] - 1], data, pageStore.encoder.outputName(imgList[page[0] - 1]))
+	return True
+
+# whether pageStore's encoder saves img in another format, so that it has to be decoded and re-encoded rather than edited in place
+def changesFormat(pageStore, img):
+	return pageStore.encoder.outputName(img) != img
+
+# rotates a JPEG page 90 degrees without decoding it, either losslessly with jpegtran or by changing its EXIF orientation
+# returns False if the page isn't a JPEG, is being converted to another format, or can't be rotated that way, in which case it's left alone
+def rotateJpeg(pageStore, img, clockwise, rotation):
+	if changesFormat(pageStore, img):
+		return False
+	data = pageStore.readBytes(img)
+	with metrics.stage("rotate", img, len(data)):
+		if rotation == "exif":
+			newData = losslessJpeg.rotateExif(data, clockwise)
+		else:
+			newData = losslessJpeg.rotateLossless(data, clockwise)
+	if newData is None:
+		logger.debug(f"Could not rotate {img} without decoding it")
+		return False
+	pageStore.writeBytes(img, newData)
+	return True
+
 def stitchPages(leftImg, rightImg, columns, compressionFuzz):
+	import cv2
 	if columns == 0:
 		logger.debug("Stitched pages together with no overlap checking")
-		return cv2.hconcat([leftImg, rightImg])
+		with metrics.stage("stitch"):
+			return cv2.hconcat([leftImg, rightImg])
 	else:
-		negcolumns = (columns * -1) - 1
-		for i in range(-1, negcolumns, -1):
-			# account for fuzz factor for compression artifacts
-			# cast ndarrays as int16 because they're uint8 by default, which leads to wrong values when I should get negative ones
-			if np.abs(leftImg[:, i].astype(np.int16) - rightImg[:, 0].astype(np.int16)).max() < compressionFuzz:
-				logger.debug(f"Stitched pages together after finding overlap at column {i * -1}")
-				return cv2.hconcat([leftImg[:, :i], rightImg])
+		with metrics.stage("overlap"):
+			overlap = findOverlap(leftImg, rightImg, columns, compressionFuzz)
+		if overlap:
+			logger.debug(f"Stitched pages together after finding overlap at column {overlap}")
+			with metrics.stage("stitch"):
+				return cv2.hconcat([leftImg[:, :-overlap], rightImg])
 		else:
 			logger.debug(f"Stitched pages together without finding overlap in {columns} columns")
-			return cv2.hconcat([leftImg, rightImg])
+			with metrics.stage("stitch"):
+				return cv2.hconcat([leftImg, rightImg])
+
+# returns how many columns from the right edge of leftImg the column matching the left edge of rightImg is, or 0 if none match
+# the rightmost columns columns of leftImg are all compared against rightImg's left edge at once, blockRows rows at a time
+# any column that doesn't match within a block is dropped before the next block, so tall pages without an overlap stop early
+# if more than one column matches, the one closest to the right edge wins
+# wide windows are searched on scaled down pages first instead, see findOverlapPyramid
+def findOverlap(leftImg, rightImg, columns, compressionFuzz, blockRows = 256):
+	import numpy as np
+	if columns >= pyramidMinColumns:
+		overlap = findOverlapPyramid(leftImg, rightImg, columns, compressionFuzz)
+		if overlap is not None:
+			return overlap
+	width = leftImg.shape[1]
+	candidates = np.arange(max(width - columns, 0), width)
+	# cast ndarrays as int16 because they're uint8 by default, which leads to wrong values when I should get negative ones
+	rightEdge = rightImg[:, 0].astype(np.int16)
+	for start in range(0, leftImg.shape[0], blockRows):
+		block = leftImg[start:start + blockRows, candidates].astype(np.int16)
+		# account for fuzz factor for compression artifacts
+		diff = np.abs(block - rightEdge[start:start + blockRows, np.newaxis])
+		maxDiff = diff.max(axis = 0)
+		# colour images have one more axis to reduce than greyscale ones
+		if maxDiff.ndim > 1:
+			maxDiff = maxDiff.max(axis = 1)
+		candidates = candidates[maxDiff < compressionFuzz]
+		if candidates.size == 0:
+			return 0
+	return int(width - candidates[-1])
+
+# finds the overlap the same way as findOverlap, but on copies of the pages scaled down by 4 or 8 first
+# only the few best overlaps found there are looked at again at full size, so a wide window costs little more than a narrow one
+# matchColumns columns are compared for each overlap rather than one, and a match only needs matchPercentile percent of the pixels
+# to be within compressionFuzz, so a few stray pixels don't spoil a match and a single column that happens to match isn't enough
+# like findOverlap, the match closest to the right edge wins, so plain margins that match at every overlap only lose a column
+# returns None if the pages are too small to scale down, in which case findOverlap checks every column instead
+def findOverlapPyramid(leftImg, rightImg, columns, compressionFuzz):
+	import cv2
+	import numpy as np
+	scale = 8 if columns >= 256 else 4
+	coarseColumns = min(columns, leftImg.shape[1]) // scale
+	if leftImg.shape[0] < scale * 8 or coarseColumns == 0 or rightImg.shape[1] < matchColumns * scale:
+		return None
+	columns = coarseColumns * scale
+	height = leftImg.shape[0] // scale
+	leftSmall = cv2.resize(leftImg[:, leftImg.shape[1] - columns:], (coarseColumns, height), interpolation = cv2.INTER_AREA).astype(np.float32)
+	rightSmall = cv2.resize(rightImg[:, :matchColumns * scale], (matchColumns, height), interpolation = cv2.INTER_AREA).astype(np.float32)
+	# greyscale pages get a channel axis so that they can be handled the same way as colour ones
+	leftSmall = leftSmall.reshape(height, coarseColumns, -1)
+	rightSmall = rightSmall.reshape(height, matchColumns, -1)
+
+	# the columns of leftSmall starting at each column, padded past its right edge with NaN so that narrow overlaps compare fewer columns
+	padded = np.concatenate([leftSmall, np.full((height, matchColumns - 1, leftSmall.shape[2]), np.nan, np.float32)], axis = 1)
+	windows = np.lib.stride_tricks.sliding_window_view(padded, matchColumns, axis = 1)
+	coarseScores = np.nanmean(np.abs(windows - rightSmall.transpose(0, 2, 1)[:, np.newaxis]), axis = (0, 2, 3))
+
+	# overlaps within a scaled down column either side of the best few, since scaling blurs where the overlap is
+	# ties go to the narrowest overlaps
+	starts = np.arange(coarseColumns)
+	overlaps = set()
+	for start in np.lexsort((-starts, coarseScores))[:refineCandidates]:
+		overlap = columns - int(start) * scale
+		overlaps.update(range(max(overlap - scale, 1), min(overlap + scale, columns) + 1))
+	overlaps = np.array(sorted(overlaps))
+
+	# the difference between each pixel of the first matchColumns columns of rightImg and the columns of leftImg it overlaps for every overlap at once,
+	# with NaN past the right edge of leftImg, and colour pages taking the largest difference of the three channels
+	width = leftImg.shape[1]
+	columnIndices = (width - overlaps)[:, np.newaxis] + np.arange(matchColumns)
+	diff = np.abs(leftImg[:, np.minimum(columnIndices, width - 1)].astype(np.int16) - rightImg[:, np.newaxis, :matchColumns].astype(np.int16))
+	if diff.ndim > 3:
+		# numpy is much slower at reducing along a short last axis than at comparing whole arrays
+		diff = np.maximum.reduce([diff[..., channel] for channel in range(diff.shape[3])])
+	diff = np.where(columnIndices < width, diff, np.nan)
+
+	# the narrowest overlap that matches
+	matches = overlaps[np.nanpercentile(diff, matchPercentile, axis = (0, 2)) < compressionFuzz]
+	return int(matches[0]) if matches.size else 0
+
+# stitches leftImg and rightImg from pageStore, turning the result if rotate is "m" or "s", into one buffer allocated up front
+# the pages' sizes are read from their headers, only one page is decoded at a time, and each page is copied or rotated
+# straight into its place in the buffer, so the most held at once is the finished page and one of its halves
+# instead of both halves, the stitched page, and the rotated page
+# the page that goes first in the buffer is put there whole, then the overlap is found against it and the other page is put after it
+# returns None if a page's size can't be read from its header or the pages aren't the same height, so they can be stitched the usual way
+def stitchPagesLowMemory(pageStore, leftImg, rightImg, columns, compressionFuzz, rotate = ""):
+	import cv2
+	import numpy as np
+	leftData = pageStore.readBytes(leftImg)
+	rightData = pageStore.readBytes(rightImg)
+	leftSize = getImageSize(leftData)
+	rightSize = getImageSize(rightData)
+	if not leftSize or not rightSize or leftSize[1] != rightSize[1]:
+		logger.debug(f"Could not read the sizes of {leftImg} and {rightImg} from their headers, so they're stitched the usual way")
+		return None
+	(leftWidth, height), rightWidth = leftSize, rightSize[0]
+
+	# turned counterclockwise, the right page goes at the top of the buffer, otherwise the left page goes first
+	if rotate == "m":
+		out = np.empty((leftWidth + rightWidth, height, 3), np.uint8)
+		right = decodeSizedPage(rightImg, rightData, rightSize)
+		with metrics.stage("rotate", rightImg):
+			cv2.rotate(right, cv2.ROTATE_90_COUNTERCLOCKWISE, dst = out[:rightWidth])
+		halfBytes = right.nbytes
+		del right
+		left = decodeSizedPage(leftImg, leftData, leftSize)
+		# the right page the way it was before it was turned
+		overlap = stitchOverlap(left, np.rot90(out[:rightWidth], -1), columns, compressionFuzz)
+		width = leftWidth - overlap + rightWidth
+		with metrics.stage("rotate", leftImg):
+			cv2.rotate(left[:, :leftWidth - overlap], cv2.ROTATE_90_COUNTERCLOCKWISE, dst = out[rightWidth:width])
+	elif rotate == "s":
+		out = np.empty((leftWidth + rightWidth, height, 3), np.uint8)
+		left = decodeSizedPage(leftImg, leftData, leftSize)
+		with metrics.stage("rotate", leftImg):
+			cv2.rotate(left, cv2.ROTATE_90_CLOCKWISE, dst = out[:leftWidth])
+		halfBytes = left.nbytes
+		del left
+		right = decodeSizedPage(rightImg, rightData, rightSize)
+		# the left page the way it was before it was turned
+		overlap = stitchOverlap(np.rot90(out[:leftWidth]), right, columns, compressionFuzz)
+		width = leftWidth - overlap + rightWidth
+		with metrics.stage("rotate", rightImg):
+			cv2.rotate(right, cv2.ROTATE_90_CLOCKWISE, dst = out[leftWidth - overlap:width])
+	else:
+		out = np.empty((height, leftWidth + rightWidth, 3), np.uint8)
+		left = decodeSizedPage(leftImg, leftData, leftSize)
+		with metrics.stage("stitch"):
+			out[:, :leftWidth] = left
+		halfBytes = left.nbytes
+		del left
+		right = decodeSizedPage(rightImg, rightData, rightSize)
+		overlap = stitchOverlap(out[:, :leftWidth], right, columns, compressionFuzz)
+		width = leftWidth - overlap + rightWidth
+		with metrics.stage("stitch"):
+			out[:, leftWidth - overlap:width] = right
+
+	# the buffer was made wide enough for no overlap, and cutting it down to size is only a view
+	# OpenCV encodes a view with wider rows than its width without copying it
+	stitchBytes = out.nbytes + max(halfBytes, height * (leftWidth if rotate == "m" else rightWidth) * 3)
+	metrics.recordStitchMemory(stitchBytes)
+	logger.debug(f"Stitching {leftImg} and {rightImg} held {stitchBytes / 1000000:.1f} MB of images")
+	return out[:width] if rotate in ["m", "s"] else out[:, :width]
+
+# how many columns of leftImg rightImg overlaps, the same way stitchPages finds it
+def stitchOverlap(leftImg, rightImg, columns, compressionFuzz):
+	if columns == 0:
+		logger.debug("Stitched pages together with no overlap checking")
+		return 0
+	with metrics.stage("overlap"):
+		overlap = findOverlap(leftImg, rightImg, columns, compressionFuzz)
+	if overlap:
+		logger.debug(f"Stitched pages together after finding overlap at column {overlap}")
+	else:
+		logger.debug(f"Stitched pages together without finding overlap in {columns} columns")
+	return overlap
 
 def getResultString(bookFileName, pagesList):
 	pagesString = ""
@@ -440,41 +993,42 @@ def convertPageList(pageString, bookDir):
 	
 	return pageIntList, ""
 
-def findBookFile(backedup, epub, pdf):
-	bookFiles = os.listdir()
+# bookDir defaults to the current working directory
+def findBookFile(backedup, epub, pdf, bookDir = ""):
+	bookDir = os.path.abspath(bookDir)
+	bookFiles = os.listdir(bookDir)
 	bookFileName = ""
 	backupFound = False
 	if epub:
 		ext = ".epub"
-		backupExt = ".epub_old"
 		upperExt = "EPUB"
 	elif pdf:
 		ext = ".pdf"
-		backupExt = ".pdf_old"
 		upperExt = "PDF"
 	else:
 		ext = ".cbz"
-		backupExt = ".cbz_old"
 		upperExt = "CBZ"
-	logger.debug(f"Looking for a {upperExt} file in {os.getcwd()}")
+	# a backup is either the whole original or a delta of it, see bookBackup
+	backupExts = [ext + suffix for suffix in bookBackup.backupSuffixes]
+	logger.debug(f"Looking for a {upperExt} file in {bookDir}")
 	for file in bookFiles:
 		filename, extension = os.path.splitext(file)
 		if not backedup:
 			if extension == ext:
 				bookFileName = file
-			if extension == backupExt:
-				return False, f"{os.getcwd()} contains a backup from a previous run. As such, this book will be skipped. Try again after either deleting the {upperExt}_OLD file or adding \"backedup\" as an option on the input.\n"
+			if extension in backupExts:
+				return False, f"{bookDir} contains a backup from a previous run. As such, this book will be skipped. Try again after either deleting the {extension[1:].upper()} file or adding \"backedup\" as an option on the input.\n"
 		else:
 			if extension == ext:
 				bookFileName = file
-			if extension == backupExt:
+			if extension in backupExts:
 				backupFound = True
 	
 	if backedup and not backupFound:
-		return False, f"{os.getcwd()} had the backedup flag set, but no backup was found. Remove the backedup flag for this directory to process the book normally.\n"
+		return False, f"{bookDir} had the backedup flag set, but no backup was found. Remove the backedup flag for this directory to process the book normally.\n"
 
 	if bookFileName == "":
-		return False, f"{os.getcwd()} has no {upperExt} files in it. Check your input."
+		return False, f"{bookDir} has no {upperExt} files in it. Check your input."
 	
 	return True, bookFileName
 
@@ -508,23 +1062,65 @@ def getBookFlags(flags):
 			logger.debug(f"Found unknown flag: {flag}")
 	return manga, backedup, epub, pdf, rightlines, unknownFlag
 
-def getCbzImgs():
-	imgList = os.listdir()
-	
-	# check to see if the image files are in a subdirectory and bring them out if so
-	while os.path.isdir(imgList[0]):
-		for file in os.listdir(imgList[0]):
-			shutil.move(os.path.join(imgList[0], file), file)
-		os.rmdir(imgList[0])
-		imgList = os.listdir()
-	
-	return imgList
+# comic readers show pages in filename order, so that's the order they're numbered in
+def getZipImgs(zipf):
+	return sorted([name for name in zipf.namelist() if os.path.splitext(name)[1].lower() in imgExts], key = str.lower)
+
+# removes the rightmost column of pixels from every page, several pages at a time
+# progress is called with how many of the pages are done, see bookProgress
+def removeRightLines(imgList, pageStore = None, threads = None, progress = None):
+	if pageStore is None:
+		pageStore = DirPages()
+	with ThreadPoolExecutor(max_workers = threads) as executor:
+		bookProgress.report(progress, 0, len(imgList))
+		try:
+			# any exceptions from the pages are raised here
+			for done, result in enumerate(executor.map(metrics.bindCurrent(removeRightLine), repeat(pageStore), imgList), 1):
+				bookProgress.report(progress, done, len(imgList))
+		except BaseException:
+			# the pages that haven't been started aren't waited for
+			executor.shutdown(cancel_futures = True)
+			raise
+
+# JPEG pages are cropped without being re-encoded where possible, and anything else is decoded, cropped, and re-encoded
+# pages that are being converted to another format are always re-encoded
+def removeRightLine(pageStore, img):
+	data = pageStore.readBytes(img)
+	newData = None
+	if not changesFormat(pageStore, img):
+		with metrics.stage("crop", img, len(data)):
+			newData = losslessJpeg.cropRight(data, 1)
+	if newData is not None:
+		pageStore.writeBytes(img, newData)
+	else:
+		with metrics.stage("decode", img, len(data)):
+			page = decodePage(data)
+		pageStore.write(img, page[:, :-1])
+
+def decodePage(data):
+	import cv2
+	import numpy as np
+	return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+# decodes a page whose (width, height) was read from its header, making sure it came out that size
+def decodeSizedPage(img, data, size):
+	with metrics.stage("decode", img, len(data)):
+		page = decodePage(data)
+	if page is None or page.shape[:2] != (size[1], size[0]):
+		raise ValueError(f"{img} did not decode to the size in its header")
+	return page
 
-def removeRightLines(imgList):
-	for img in imgList:
-		page = cv2.imread(img)
-		page = page[:, :-1]
-		cv2.imwrite(img, page)
+# returns the (width, height) a JPEG or PNG page decodes to, read from its header, or None for any other kind of page
+def getImageSize(data):
+	if data[:8] == b"\x89PNG\r\n\x1a\n" and data[12:16] == b"IHDR":
+		return struct.unpack(">II", data[16:24])
+	if not losslessJpeg.isJpeg(data):
+		return None
+	size = losslessJpeg.getSize(data)
+	# OpenCV applies the EXIF orientation when it decodes, and orientations 5 to 8 swap the width and height
+	if size and losslessJpeg.getOrientation(data) in [5, 6, 7, 8]:
+		return size[1], size[0]
+	return size
 
 if __name__ == "__main__":
 	main()
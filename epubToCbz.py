@@ -16,17 +16,26 @@
 
 from zipfile import ZipFile
 import os
-import shutil
 import argparse
 import math
 import logging
 import traceback
 import datetime
+import posixpath
+import re
+import html
+from urllib.parse import unquote
+from xml.etree import ElementTree
+import zipUtils
+import atomicFile
+import bookProgress
 
 logger = logging.getLogger(__name__)
 
-tempPath = "temp"
-newPath = "new"
+# how much of an XHTML file is parsed at a time while looking for its first image
+xmlReadSize = 16384
+# <img src="..."> or <image xlink:href="...">, for XHTML files that can't be parsed as XML
+imgTagPattern = re.compile(r"""<(?:\w+:)?(img\b[^>]*?\bsrc|image\b[^>]*?\bhref)\s*=\s*["']([^"']*)["']""", re.IGNORECASE)
 
 def main():
     # parse arguments
@@ -48,7 +57,8 @@ def main():
         logger.error(out)
         print(out)
 
-def convertEpubToCbz(book):
+# progress is called as each page is copied into the CBZ, see bookProgress
+def convertEpubToCbz(book, progress = None):
     [root, ext] = os.path.splitext(book)
     if ext.lower() != ".epub":
         return 1, f"{book} is not an ePub."
@@ -57,149 +67,159 @@ def convertEpubToCbz(book):
     logger.debug(f"bookDir is {bookDir}")
     bookEpub = os.path.basename(book)
     logger.debug(f"bookEpub is {bookEpub}")
-    os.chdir(bookDir)
-    logger.debug(f"Changed directory into {os.getcwd()}")
-
-    with ZipFile(bookEpub, "r") as zip:
-        zip.extractall(path = tempPath)
-    logger.debug(f"Extracted ZIP archive to {tempPath}")
-
-    os.chdir(tempPath)
-    logger.debug(f"Changed directory into {os.getcwd()}")
-    docDir, opfFile = findOpfEnterDoc(bookDir, tempPath)
-    if not opfFile:
-        return 1, docDir
-    logger.debug(f"docDir is {docDir}")
-    logger.debug(f"opfFile is {opfFile}")
-
-    # get manifest and spine from OPF file
-    manifest, spine = getManifestAndSpine(opfFile)
-    logger.debug(f"Manifest is {manifest}")
-    logger.debug(f"Spine is {spine}")
-
-    # go through spine and grab image filenames from the manifest
-    imgs = getImageFilenames(manifest, spine)
-    logger.debug(f"Image list is {imgs}")
-
-    os.chdir(bookDir)
-    logger.debug(f"Changed directory into {os.getcwd()}")
-    docPath = os.path.join(tempPath, docDir)
-    logger.debug(f"docPath is {docPath}")
-    cbzFileName = os.path.basename(root) + ".cbz"
-    logger.debug(f"cbzFileName is {cbzFileName}")
-
-    # put pages into CBZ file
-    buildCbzFile(imgs, docPath, cbzFileName)
-    logger.info("CBZ file written to disk")
-
-    # clean up
-    shutil.rmtree(tempPath)
-    logger.debug(f"{tempPath} deleted")
 
-    return 0, f"{bookEpub} converted to CBZ."
+    # everything is read straight out of the ePub and the images are copied into the CBZ still compressed
+    # so nothing but the CBZ is ever written to the disk
+    with ZipFile(book, "r") as epubZip:
+        docDir, opfFile = findOpfInZip(epubZip)
+        if not opfFile:
+            return 1, docDir
+        logger.debug(f"docDir is {docDir}")
+        logger.debug(f"opfFile is {opfFile}")
+
+        # get manifest and spine from OPF file
+        manifest, spine = getManifestAndSpine(posixpath.join(docDir, opfFile), epubZip)
+        logger.debug(f"Manifest is {manifest}")
+        logger.debug(f"Spine is {spine}")
+
+        # go through spine and grab image filenames from the manifest
+        imgs = getImageFilenames(manifest, spine, docDir, epubZip)
+        logger.debug(f"Image list is {imgs}")
 
-# working directory should be in the extracted ePub directory before this is called
-def getDocDir():
-    dirList = os.listdir()
-    for file in dirList:
-        if file not in ["META-INF", "mimetype"] and os.path.isdir(file):
-            return file
-    else:
-        return False
-
-# working directory should be in the ePub's document directory before this is called
-def findOpfFile():
-    dirList = os.listdir()
-    for file in dirList:
-        fileExt = os.path.splitext(file)[1]
-        if fileExt.lower() == ".opf":
-            return file
-    else:
-        return False
+        cbzFileName = os.path.join(bookDir, os.path.basename(root) + ".cbz")
+        logger.debug(f"cbzFileName is {cbzFileName}")
+
+        # put pages into CBZ file, copying them straight out of the ePub
+        # the CBZ only takes its name once it's complete, so a CBZ from a run that was stopped part way through is never left behind
+        with atomicFile.tempFile(cbzFileName) as newCbzFileName:
+            buildCbzFile(imgs, docDir, newCbzFileName, epubZip, progress)
+            atomicFile.replaceFile(newCbzFileName, cbzFileName)
+        logger.info("CBZ file written to disk")
+
+    return 0, f"{bookEpub} converted to CBZ."
 
 # currently returns spine as a list of idrefs
 # and manifest as a dict with ids as keys and hrefs as values
 # could be changed to return more info if more is needed in the future
-def getManifestAndSpine(opfFile):
-    lines = []
-    with open(opfFile, "r", encoding = 'utf-8') as opf:
-        lines = opf.readlines()
-    logger.debug("Read in lines from OPF file")
+# opfFile is a path on disk, or the name of the OPF file inside sourceZip if that's given
+def getManifestAndSpine(opfFile, sourceZip = None):
+    with openEpubFile(opfFile, sourceZip) as opf:
+        manifest, spine = readManifestAndSpine(opf)
+    logger.debug("Read in manifest and spine from OPF file")
 
+    return manifest, spine
+
+# the OPF file is read as it's parsed, so a large one never has to be held in memory as text
+def readManifestAndSpine(opf):
     manifest = {}
     spine = []
-    for line in lines:
-        if "<itemref " in line:
-            spine.append(getHtmlAttributeValue(line, "idref"))
-        elif "<item " in line:
-            manifest[getHtmlAttributeValue(line, "id")] = getHtmlAttributeValue(line, "href")
+    for event, element in ElementTree.iterparse(opf, events = ["start"]):
+        tag = localName(element.tag)
+        if tag == "itemref":
+            spine.append(element.get("idref"))
+        elif tag == "item":
+            manifest[element.get("id")] = element.get("href")
 
     return manifest, spine
 
 # manifest should be a dict, spine should be a list containing only keys in manifest
-def getImageFilenames(manifest, spine):
+# hrefs in the manifest are relative to docPath, which defaults to the working directory
+# if sourceZip is given, docPath is the document directory inside it and the files are read from there
+# each page of a comic is one image, so only the first image in each spine item is used
+def getImageFilenames(manifest, spine, docPath = "", sourceZip = None):
     imgs = []
     for itemref in spine:
-        lines = []
         href = manifest[itemref]
-        with open(href, "r") as xhtml:
-            lines = xhtml.readlines()
-        for line in lines:
-            if "<img " in line:
-                img = getHtmlAttributeValue(line, "src")
-
-                # get the file path to the image from the document directory
-                href = href[:href.rfind("/", 0, -1) + 1]
-                while img.find("../") == 0:
-                    img = img[3:]
-                    href = href[:href.rfind("/", 0, -1) + 1]
-                imgs.append(href + img)
+        with openEpubFile(posixpath.join(docPath, href) if sourceZip else os.path.join(docPath, href), sourceZip) as xhtml:
+            img = readFirstImage(xhtml)
+        if img is None:
+            continue
+
+        # get the file path to the image from the document directory
+        img = unquote(img.split("#")[0])
+        imgPath = posixpath.normpath(posixpath.join(posixpath.dirname(href), img))
+        # anything that climbs out of the document directory is taken to be relative to it instead
+        while imgPath.startswith("../"):
+            imgPath = imgPath[3:]
+        imgs.append(imgPath)
 
     return imgs
 
-# working directory should be 1 level up from the target ePub
-def buildCbzFile(imgs, docPath, cbzFileName):
-    newImgNumber = 0
-    numDigits = math.ceil(math.log(len(imgs), 10))
-    with ZipFile(cbzFileName, "w") as cbz:
-        for img in imgs:
-            imgPath = os.path.join(docPath, img)
-            newImgName = ("{:0" + str(numDigits) + "d}").format(newImgNumber) + os.path.splitext(img)[1]
-            cbz.write(imgPath, arcname = newImgName)
-            newImgNumber += 1
-
-def getHtmlAttributeValue(tag, attr):
-    firstQuoteIndex = tag.find("\"", tag.find(attr))
-    if firstQuoteIndex != -1:
-        return tag[firstQuoteIndex + 1 : tag.find("\"", firstQuoteIndex + 1)]
-    firstQuoteIndex = tag.find("\'", tag.find(attr))
-    return tag[firstQuoteIndex + 1 : tag.find("\'", firstQuoteIndex + 1)]
-
-def findOpfEnterDoc(bookDir, tempPath):
-    # check whether OPF file is in the top-level directory
-    docDir = ""
-    opfFile = findOpfFile()
-    if not opfFile:
-        # find and enter the document folder
-        docDir = getDocDir()
-        if not docDir:
-            os.chdir(bookDir)
-            logger.debug(f"Changed directory into {os.getcwd()}")
-            shutil.rmtree(tempPath)
-            logger.debug(f"{tempPath} deleted")
-            return "Provided ePub has no document directory.", False
-        os.chdir(docDir)
-        logger.debug(f"Changed directory into {os.getcwd()}")
-
-        # find the OPF file
-        opfFile = findOpfFile()
-        if not opfFile:
-            os.chdir(bookDir)
-            logger.debug(f"Changed directory into {os.getcwd()}")
-            shutil.rmtree(tempPath)
-            logger.debug(f"{tempPath} deleted")
-            return "Provided ePub has no OPF file.", False
+def openEpubFile(path, sourceZip = None):
+    if sourceZip:
+        return sourceZip.open(path)
+    return open(path, "rb")
 
+# returns the src of the first <img>, or the href of the first SVG <image>, in an XHTML file, or None if it has neither
+# the file is parsed a chunk at a time and reading stops as soon as the image is found
+def readFirstImage(xhtml):
+    chunks = []
+    parser = ElementTree.XMLPullParser(events = ["start"])
+    try:
+        for chunk in iter(lambda: xhtml.read(xmlReadSize), b""):
+            chunks.append(chunk)
+            parser.feed(chunk)
+            for event, element in parser.read_events():
+                img = getImageSource(element)
+                if img is not None:
+                    return img
+        parser.close()
+    except ElementTree.ParseError:
+        # files that aren't well-formed XML, usually because of HTML entities like &nbsp;, are searched as text instead
+        logger.debug("XHTML file could not be parsed as XML, so searching it as text")
+        text = (b"".join(chunks) + xhtml.read()).decode("utf-8", errors = "replace")
+        match = imgTagPattern.search(text)
+        if match:
+            return html.unescape(match.group(2))
+    return None
+
+def getImageSource(element):
+    tag = localName(element.tag)
+    if tag not in ["img", "image"]:
+        return None
+    for attr, value in element.attrib.items():
+        if localName(attr) == ("src" if tag == "img" else "href"):
+            return value
+    return None
+
+# drops the {namespace} ElementTree puts in front of tag and attribute names
+def localName(name):
+    return name.rsplit("}", 1)[-1]
+
+# imgs are relative to docPath, which is a directory on disk, or the document directory inside sourceZip if that's given
+# images in sourceZip are copied into the CBZ without being decompressed
+def buildCbzFile(imgs, docPath, cbzFileName, sourceZip = None, progress = None):
+    with ZipFile(cbzFileName, "w") as cbz:
+        bookProgress.report(progress, 0, len(imgs))
+        for done, (img, newImgName) in enumerate(zip(imgs, getCbzImgNames(imgs)), 1):
+            if sourceZip:
+                zipUtils.copyMember(sourceZip, sourceZip.getinfo(posixpath.join(docPath, img)), cbz, newImgName)
+            else:
+                zipUtils.writeFile(cbz, os.path.join(docPath, img), newImgName)
+            bookProgress.report(progress, done, len(imgs))
+
+# CBZ images are numbered from 0 in the order they're in, keeping their file extensions
+def getCbzImgNames(imgs):
+    numDigits = math.ceil(math.log(len(imgs), 10))
+    return [("{:0" + str(numDigits) + "d}").format(newImgNumber) + os.path.splitext(img)[1] for newImgNumber, img in enumerate(imgs)]
+
+# finds the document directory and OPF file of an ePub without extracting it
+# the OPF file is the one META-INF/container.xml points to, or failing that, one at the top level or in a directory at the top level
+# docDir is a path inside the archive; if no OPF file is found, the first return value is the reason why
+def findOpfInZip(epubZip):
+    names = epubZip.namelist()
+    if "META-INF/container.xml" in names:
+        with epubZip.open("META-INF/container.xml") as container:
+            for event, element in ElementTree.iterparse(container, events = ["start"]):
+                if localName(element.tag) == "rootfile" and element.get("full-path") in names:
+                    docDir, opfFile = posixpath.split(element.get("full-path"))
+                    return docDir, opfFile
+
+    opfFiles = [name for name in names if posixpath.splitext(name)[1].lower() == ".opf" and name.count("/") <= 1]
+    if not opfFiles:
+        return "Provided ePub has no OPF file.", False
+    # prefer one at the top level
+    docDir, opfFile = posixpath.split(min(opfFiles, key = lambda name: name.count("/")))
     return docDir, opfFile
 
 # currently not used, but was useful for something else and could be useful elsewhere
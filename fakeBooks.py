@@ -0,0 +1,61 @@
+#	Comic Spread Stitch - for making digital comic books easier to read
+#	Copyright (C) 2024 Reed Mauzy
+#
+#	This program is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Made-up pages and books with spreads in them, for the tests and benchmark.py
+
+import cv2
+import numpy as np
+from zipfile import ZipFile
+import math
+import os
+
+# a page with some shapes on it, so that it compresses more like a real page than noise or a flat colour would
+def makePage(width, height, seed):
+	rng = np.random.default_rng(seed)
+	page = np.full((height, width, 3), 255, np.uint8)
+	for i in range(20):
+		x, y = rng.integers(0, width), rng.integers(0, height)
+		colour = [int(c) for c in rng.integers(0, 255, 3)]
+		cv2.rectangle(page, (x, y), (x + int(rng.integers(20, width // 2 + 21)), y + int(rng.integers(20, height // 4 + 21))), colour, -1)
+		cv2.circle(page, (int(rng.integers(0, width)), int(rng.integers(0, height))), int(rng.integers(10, width // 4 + 11)), colour, 3)
+	return page
+
+# two halves of a spread whose edges overlap by overlap columns
+def makeSpread(width, height, overlap, seed):
+	spread = makePage(width * 2 - overlap, height, seed)
+	return spread[:, :width].copy(), spread[:, width - overlap:].copy()
+
+# every other pair of pages is a spread so that stitching has an overlap to find
+def makePages(pages, width, height, overlap):
+	imgs = []
+	for i in range(0, pages, 2):
+		if i % 4 == 0 and i + 1 < pages:
+			imgs += makeSpread(width, height, overlap // 2, i)
+		else:
+			imgs += [makePage(width, height, i), makePage(width, height, i + 1)]
+	return imgs[:pages]
+
+def encodePage(page, imgFormat):
+	success, data = cv2.imencode(imgFormat, page)
+	return data.tobytes()
+
+def makeCbz(bookDir, pages, width, height, imgFormat, overlap):
+	book = os.path.join(bookDir, "Benchmark.cbz")
+	numDigits = math.ceil(math.log(pages + 1, 10))
+	with ZipFile(book, "w") as cbz:
+		for i, page in enumerate(makePages(pages, width, height, overlap)):
+			cbz.writestr(("{:0" + str(numDigits) + "d}").format(i) + imgFormat, encodePage(page, imgFormat))
+	return book
@@ -18,10 +18,18 @@ import tkinter as tk
 from tkinter import filedialog
 import tkinter.ttk as ttk
 import comicSpreadStitch
+import bookProgress
+from concurrent.futures import ThreadPoolExecutor, Future
+import queue
+import threading
 import os
 import logging
 
 logger = logging.getLogger(__name__)
+# books are processed on threads so the window keeps responding, with this many at the same time
+concurrentBooks = min(4, os.cpu_count() or 1)
+# how often the window checks on the books being processed, in milliseconds
+pollMs = 100
 
 def main():
     logging.basicConfig(filename = "run.log", level = logging.INFO)
@@ -35,6 +43,13 @@ class BookWindow:
     def __init__(self):
         self.root = tk.Tk()
         self.root.title("Comic Spread Stitch")
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
+        self.executor = ThreadPoolExecutor(max_workers = concurrentBooks)
+        # (book, pages done, total pages) sent from the threads processing books, since only the main thread can touch the window
+        self.updates = queue.Queue()
+        # the (book, line, overlap, compression fuzz) of each book waiting for the one in front of it in the same directory,
+        # since books in the same directory would write the same files; the one in front is the one being processed
+        self.bookDirJobs = {}
         # list of books with one to start
         self.books = [BookFrame(self)]
         # frame to contain process and add buttons
@@ -44,8 +59,6 @@ class BookWindow:
         # button to add another book
         self.btn_add = ttk.Button(master = self.frm_bottom, text = "Add book", command = self.addBook)
 
-        # a progress bar would be nice here
-
         self.btn_process.grid(row = 0, column = 1, sticky = "e")
         self.btn_add.grid(row = 0, column = 0, sticky = "e")
         for idx, book in enumerate(self.books):
@@ -61,56 +74,64 @@ class BookWindow:
             self.btn_process.config(state = tk.NORMAL)
 
     # process the file(s)
+    # each book is handed to a thread and the window checks on them every pollMs until they're all done
+    # books in the same directory are processed one after the other, and wait with a future that's only there so they can be cancelled
     def process(self):
         self.btn_add.config(state = tk.DISABLED)
         self.btn_process.config(state = tk.DISABLED)
+        jobs = [(book, book.getJob()) for book in self.books]
+        jobs = [(book, job) for book, job in jobs if job]
+        # done before any book is started, and reports any directory it can't recover in run.log without stopping the rest
+        comicSpreadStitch.recoverBookDirs([line for book, (line, over, comp) in jobs])
+        self.bookDirJobs = {}
+        for book, (line, over, comp) in jobs:
+            book.start(Future())
+            self.bookDirJobs.setdefault(comicSpreadStitch.getBookDir(line), []).append((book, line, over, comp))
+        for dirJobs in self.bookDirJobs.values():
+            self.startNext(dirJobs)
+        self.poll()
+
+    # starts the first book in dirJobs that wasn't cancelled while it was waiting
+    def startNext(self, dirJobs):
+        while dirJobs and dirJobs[0][0].future.cancelled():
+            dirJobs.pop(0)
+        if dirJobs:
+            book, line, over, comp = dirJobs[0]
+            book.future = self.executor.submit(self.processBook, book, line, over, comp)
+
+    # runs on one of the executor's threads, so it only talks to the window through self.updates
+    def processBook(self, book, line, over, comp):
+        def progress(done, total):
+            if book.cancelled.is_set():
+                raise bookProgress.Cancelled()
+            self.updates.put((book, done, total))
+        return comicSpreadStitch.processBook(line, overlap=over, compression=comp, progress=progress)
+
+    def poll(self):
+        while not self.updates.empty():
+            book, done, total = self.updates.get_nowait()
+            if book.future:
+                book.showProgress(done, total)
+        for dirJobs in self.bookDirJobs.values():
+            if dirJobs and dirJobs[0][0].future.done():
+                dirJobs.pop(0)
+                self.startNext(dirJobs)
         for book in self.books:
-            book.lbl_results["text"] = "Working..."
-            filepath = book.ent_filepath.get()
-            if not filepath:
-                book.lbl_results["text"] = "No file entered"
-                continue
-            name, ext = os.path.splitext(filepath)
-            # first part of line needs to be directory the book file is in
-            # get this from os.path.split()
-            # second part of line needs to be list of pages
-            line = f"{os.path.split(name)[0]}|{book.ent_pages.get()}"
-            match ext:
-                case ".epub":
-                    line += "|epub"
-                case ".pdf":
-                    line += "|pdf"
-                case ".cbz":
-                    pass
-                case _:
-                    book.lbl_results["text"] = "Unsupported file type"
-                    continue
-            if book.manga.get() == "1":
-                line += "|manga"
-            if book.rightlines.get() == "1":
-                line += "|rightlines"
-            if book.backedup.get() == "1":
-                line += "|backedup"
-            if (not book.ent_comp.get().isdigit()) and (not book.ent_comp.get() == ""):
-                book.lbl_results["text"] = "Compression fuzz should be a non-negative integer"
-                continue
-            else:
-                if book.ent_comp.get() == "":
-                    comp = 75
-                else:
-                    comp = int(book.ent_comp.get())
-            if (not book.ent_overlap.get().isdigit()) and (not book.ent_overlap.get() == ""):
-                book.lbl_results["text"] = "Overlap should be a non-negative integer"
-                continue
-            else:
-                if book.ent_overlap.get() == "":
-                    over = 50
-                else:
-                    over = int(book.ent_overlap.get())
-            result, reason = comicSpreadStitch.processBook(line, overlap=over, compression=comp)
-            book.lbl_results["text"] = reason
-        self.btn_add.config(state = tk.NORMAL)
-        self.btn_process.config(state = tk.NORMAL)
+            if book.future and book.future.done():
+                book.finish()
+        if any(book.future for book in self.books):
+            self.root.after(pollMs, self.poll)
+        else:
+            self.btn_add.config(state = tk.NORMAL)
+            self.btn_process.config(state = tk.NORMAL)
+
+    # books that are being processed are cancelled, and are left as they were
+    def close(self):
+        for book in self.books:
+            if book.future:
+                book.cancel()
+        self.executor.shutdown(wait = False, cancel_futures = True)
+        self.root.destroy()
 
 class BookFrame:
     def __init__(self, window):
@@ -157,6 +178,15 @@ class BookFrame:
         # button to remove this book
         self.btn_remove = ttk.Button(master = self.frm, text = "Remove", command = self.removeBook)
 
+        # row 5
+        # how many of the pages have been done
+        self.progress = ttk.Progressbar(master = self.frm, mode = "determinate")
+        # button to stop processing this book
+        self.btn_cancel = ttk.Button(master = self.frm, text = "Cancel", command = self.cancel, state = tk.DISABLED)
+        # the book being processed, and whether it has been asked to stop
+        self.future = None
+        self.cancelled = threading.Event()
+
         # put widgets into frame
         self.lbl_filepath.grid(row = 0, column = 0, sticky = "e")
         self.ent_filepath.grid(row = 0, column = 1)
@@ -174,6 +204,87 @@ class BookFrame:
         self.lbl_results.config(wraplength = self.cb_manga.winfo_width() + self.ent_pages.winfo_width() - 5)
         self.lbl_results.grid(row = 4, column = 0, columnspan = 2)
         self.btn_remove.grid(row = 4, column = 2, sticky = "es")
+        self.progress.grid(row = 5, column = 0, columnspan = 2, sticky = "we")
+        self.btn_cancel.grid(row = 5, column = 2, sticky = "es")
+
+    # returns the line to process this book with and its overlap and compression fuzz, or None if what was entered isn't valid
+    def getJob(self):
+        filepath = self.ent_filepath.get()
+        if not filepath:
+            self.lbl_results["text"] = "No file entered"
+            return None
+        name, ext = os.path.splitext(filepath)
+        # first part of line needs to be directory the book file is in
+        # get this from os.path.split()
+        # second part of line needs to be list of pages
+        line = f"{os.path.split(name)[0]}|{self.ent_pages.get()}"
+        match ext:
+            case ".epub":
+                line += "|epub"
+            case ".pdf":
+                line += "|pdf"
+            case ".cbz":
+                pass
+            case _:
+                self.lbl_results["text"] = "Unsupported file type"
+                return None
+        if self.manga.get() == "1":
+            line += "|manga"
+        if self.rightlines.get() == "1":
+            line += "|rightlines"
+        if self.backedup.get() == "1":
+            line += "|backedup"
+        if (not self.ent_comp.get().isdigit()) and (not self.ent_comp.get() == ""):
+            self.lbl_results["text"] = "Compression fuzz should be a non-negative integer"
+            return None
+        else:
+            if self.ent_comp.get() == "":
+                comp = 75
+            else:
+                comp = int(self.ent_comp.get())
+        if (not self.ent_overlap.get().isdigit()) and (not self.ent_overlap.get() == ""):
+            self.lbl_results["text"] = "Overlap should be a non-negative integer"
+            return None
+        else:
+            if self.ent_overlap.get() == "":
+                over = 50
+            else:
+                over = int(self.ent_overlap.get())
+        return line, over, comp
+
+    # future is the book being processed, which waits its turn if concurrentBooks others are already being processed
+    # or, until a book in the same directory is done, one that does nothing but let it be cancelled
+    def start(self, future):
+        self.future = future
+        self.cancelled.clear()
+        self.lbl_results["text"] = "Waiting..."
+        self.progress["value"] = 0
+        self.btn_cancel.config(state = tk.NORMAL)
+        self.btn_remove.config(state = tk.DISABLED)
+
+    def showProgress(self, done, total):
+        self.lbl_results["text"] = f"Working... {done} of {total} pages done"
+        self.progress["maximum"] = max(total, 1)
+        self.progress["value"] = done
+
+    # a book that's waiting is never started, and one that's being processed stops after the page it's on
+    def cancel(self):
+        self.cancelled.set()
+        self.btn_cancel.config(state = tk.DISABLED)
+        if not self.future.cancel():
+            self.lbl_results["text"] = "Cancelling..."
+
+    def finish(self):
+        if self.future.cancelled():
+            reason = "Cancelled before it was started."
+        else:
+            result, reason = self.future.result()
+            if result == 0:
+                self.progress["value"] = self.progress["maximum"]
+        self.lbl_results["text"] = reason
+        self.future = None
+        self.btn_cancel.config(state = tk.DISABLED)
+        self.btn_remove.config(state = tk.NORMAL)
 
     # choose file to process
     def browseFiles(self):
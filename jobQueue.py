@@ -0,0 +1,207 @@
+#	Comic Spread Stitch - for making digital comic books easier to read
+#	Copyright (C) 2024 Reed Mauzy
+#
+#	This program is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# A queue of lines waiting to be processed, kept in an SQLite file so that other programs can add to it at any time
+# serve keeps a pool of worker processes running and hands them lines as they're added,
+# so Python, OpenCV, and pypdf are only loaded once for each worker instead of once for each run
+# Lines are in the same format as pagesToProcess.txt, and are all processed with the options serve was started with
+# Only one serve should use a queue at a time, since it takes any lines left running as ones it has to process again
+# Book directories left untidy by a run that was stopped are only recovered for the lines waiting when serve starts
+
+import comicSpreadStitch
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+import sqlite3
+import argparse
+import sys
+import time
+import traceback
+import logging
+
+queueName = "jobQueue.sqlite"
+# how long serve waits before looking for new lines again when it has nothing to do
+pollSeconds = 1.0
+# the state a line is left in by each result of processBook
+statusStates = {0: "processed", 1: "skipped", 2: "error"}
+logger = logging.getLogger(__name__)
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("--queue", default = queueName, help = f"SQLite file the queue is kept in; defaults to {queueName}")
+	commands = parser.add_subparsers(dest = "command", required = True)
+	serveParser = commands.add_parser("serve", help = "process lines as they're added to the queue until stopped with Ctrl+C")
+	comicSpreadStitch.addBookOptions(serveParser)
+	serveParser.add_argument("-w", "--workers", type = int, default = 1, help = "number of books to process at the same time")
+	serveParser.add_argument("--until-empty", action = "store_true", help = "stop once the queue is empty instead of waiting for more lines")
+	submitParser = commands.add_parser("submit", help = "add lines to the queue")
+	submitParser.add_argument("lines", nargs = "*", help = "lines in the format of pagesToProcess.txt")
+	submitParser.add_argument("-i", "--input", help = "file of lines to add, such as pagesToProcess.txt or one written by libraryScan.py, or - to read them from standard input")
+	statusParser = commands.add_parser("status", help = "show how many lines are waiting, being processed, and done")
+	statusParser.add_argument("-a", "--all", action = "store_true", help = "list every line in the queue and what happened to it")
+	commands.add_parser("clear", help = "remove lines that were processed or skipped from the queue, leaving ones that had errors")
+	args = parser.parse_args()
+
+	queue = JobQueue(args.queue)
+	try:
+		if args.command == "serve":
+			logging.basicConfig(filename = "run.log", level = logging.INFO)
+			serve(queue, args.workers, comicSpreadStitch.getBookOptions(args), args.until_empty)
+		elif args.command == "submit":
+			lines = list(args.lines)
+			if args.input == "-":
+				lines += sys.stdin.readlines()
+			elif args.input:
+				with open(args.input, "r") as fp:
+					lines += fp.readlines()
+			print(f"{len(queue.submit(lines))} lines added to {args.queue}")
+		elif args.command == "status":
+			print(queue.report(args.all))
+		elif args.command == "clear":
+			print(f"{queue.clear()} finished lines removed from {args.queue}")
+	finally:
+		queue.close()
+
+class JobQueue:
+	def __init__(self, path = queueName):
+		# transactions are started by hand, so that a line can only be taken by one worker
+		self.db = sqlite3.connect(path, timeout = 30, isolation_level = None)
+		# lets lines be added while serve is reading the queue
+		self.db.execute("PRAGMA journal_mode = WAL")
+		self.db.execute("CREATE TABLE IF NOT EXISTS jobs (id INTEGER PRIMARY KEY, line TEXT NOT NULL, state TEXT NOT NULL, reason TEXT, submitted REAL, started REAL, finished REAL)")
+		self.db.execute("CREATE INDEX IF NOT EXISTS jobsByState ON jobs (state, id)")
+
+	def close(self):
+		self.db.close()
+
+	@contextmanager
+	def transaction(self):
+		self.db.execute("BEGIN IMMEDIATE")
+		try:
+			yield
+		except BaseException:
+			self.db.execute("ROLLBACK")
+			raise
+		self.db.execute("COMMIT")
+
+	# adds lines to the end of the queue, leaving out blank ones, and returns their IDs
+	def submit(self, lines):
+		ids = []
+		now = time.time()
+		with self.transaction():
+			for line in lines:
+				line = line.strip()
+				if line:
+					ids.append(self.db.execute("INSERT INTO jobs (line, state, submitted) VALUES (?, 'queued', ?)", (line, now)).lastrowid)
+		return ids
+
+	# takes the line that has been waiting the longest, returning (ID, line), or None if nothing can be taken
+	# lines for a book directory that a running line is for wait until it's done, since they would write the same files
+	def claim(self):
+		with self.transaction():
+			busy = {comicSpreadStitch.getBookDir(line) for (line,) in self.db.execute("SELECT line FROM jobs WHERE state = 'running'")}
+			job = next((job for job in self.db.execute("SELECT id, line FROM jobs WHERE state = 'queued' ORDER BY id").fetchall() if comicSpreadStitch.getBookDir(job[1]) not in busy), None)
+			if job:
+				self.db.execute("UPDATE jobs SET state = 'running', started = ? WHERE id = ?", (time.time(), job[0]))
+		return job
+
+	# the lines waiting to be processed
+	def queued(self):
+		return [line for (line,) in self.db.execute("SELECT line FROM jobs WHERE state = 'queued' ORDER BY id")]
+
+	def finish(self, jobId, status, reason):
+		self.db.execute("UPDATE jobs SET state = ?, reason = ?, finished = ? WHERE id = ?", (statusStates.get(status, "error"), reason, time.time(), jobId))
+
+	# puts lines that were being processed back in the queue, returning how many there were
+	# with no IDs given, every line that's running is put back, such as the ones a serve that was stopped was in the middle of
+	def requeue(self, ids = None):
+		if ids is None:
+			return self.db.execute("UPDATE jobs SET state = 'queued', started = NULL WHERE state = 'running'").rowcount
+		return sum(self.db.execute("UPDATE jobs SET state = 'queued', started = NULL WHERE id = ? AND state = 'running'", (jobId,)).rowcount for jobId in ids)
+
+	# how many lines are in each state
+	def counts(self):
+		return dict(self.db.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+
+	def report(self, listJobs = False):
+		counts = self.counts()
+		states = ["queued", "running"] + list(statusStates.values())
+		lines = [", ".join(f"{counts.get(state, 0)} {state}" for state in states)]
+		average = self.db.execute("SELECT AVG(finished - started) FROM jobs WHERE state = 'processed'").fetchone()[0]
+		if average is not None:
+			lines.append(f"Processed books took {average:.1f} seconds each on average.")
+		if listJobs:
+			for jobId, line, state, reason in self.db.execute("SELECT id, line, state, reason FROM jobs ORDER BY id"):
+				lines.append(f"{jobId}\t{state}\t{line}" + (f"\n{reason.strip()}" if reason else ""))
+		return "\n".join(lines)
+
+	# removes the lines that were processed or skipped, returning how many there were
+	def clear(self):
+		return self.db.execute("DELETE FROM jobs WHERE state IN ('processed', 'skipped')").rowcount
+
+# processes the lines in queue with workers processes at a time, with options being keyword arguments to processBook
+# runs until stopped, or with untilEmpty, until there's nothing left in the queue
+def serve(queue, workers = 1, options = None, untilEmpty = False):
+	options = options if options else {}
+	requeued = queue.requeue()
+	if requeued:
+		print(f"{requeued} lines that were being processed when the queue was last served are being processed again")
+	# only the directories of lines that are already waiting can be recovered, since lines added later could be for a directory a worker is busy in
+	for message in comicSpreadStitch.recoverBookDirs(queue.queued()):
+		print(message)
+	# the IDs of the lines each worker is processing
+	running = {}
+	executor = ProcessPoolExecutor(max_workers = workers)
+	try:
+		while True:
+			while len(running) < workers:
+				job = queue.claim()
+				if job is None:
+					break
+				jobId, line = job
+				logger.info(f"Processing job {jobId}: {line}")
+				running[executor.submit(comicSpreadStitch.processBook, line, **options)] = jobId
+			if not running:
+				if untilEmpty:
+					return
+				time.sleep(pollSeconds)
+				continue
+
+			done, notDone = wait(running, timeout = pollSeconds, return_when = FIRST_COMPLETED)
+			broken = False
+			for future in done:
+				jobId = running.pop(future)
+				try:
+					status, reason = future.result()
+				except BrokenProcessPool:
+					# there's no telling which line stopped the worker, so none of them are tried again automatically
+					status, reason = 2, f"A worker stopped while processing job {jobId}. Add the line again to try it again."
+					broken = True
+				except Exception:
+					status, reason = 2, f"Error occurred while processing job {jobId}.\n{traceback.format_exc()}"
+				queue.finish(jobId, status, reason)
+				print(reason)
+			if broken:
+				executor.shutdown(wait = False)
+				executor = ProcessPoolExecutor(max_workers = workers)
+	except KeyboardInterrupt:
+		print("Stopping. Lines that were being processed will be processed again next time.")
+	finally:
+		executor.shutdown(wait = False, cancel_futures = True)
+		queue.requeue(running.values())
+
+if __name__ == "__main__":
+	main()
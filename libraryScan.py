@@ -0,0 +1,153 @@
+#	Comic Spread Stitch - for making digital comic books easier to read
+#	Copyright (C) 2024 Reed Mauzy
+#
+#	This program is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Finds the books in a library, such as a Calibre library, and writes a line for each of them in the format of pagesToProcess.txt
+# Directories are read several at a time, and what was found in each one is kept in an index file
+# so that the next scan only reads the directories that have had files added, removed, or renamed since
+
+import resultCache
+import bookBackup
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import json
+import os
+import time
+import logging
+
+indexName = "libraryIndex.json"
+# the flag each kind of book needs on its line, in the order findBookFile looks for them
+bookFlags = {".cbz": "", ".epub": "epub", ".pdf": "pdf"}
+# directories the scripts make inside book directories, which never have books in them
+skipDirs = [resultCache.cachePath, "temp"]
+# a directory changed this recently could change again without its modification time changing, so it's read again next time
+racySeconds = 2
+logger = logging.getLogger(__name__)
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("library", help = "the directory the books are in, which is searched all the way down")
+	parser.add_argument("-i", "--index", help = f"file to keep what was found in each directory in; defaults to {indexName} in the library")
+	parser.add_argument("-t", "--threads", type = int, default = None, help = "number of directories to read at the same time")
+	parser.add_argument("-n", "--new", action = "store_true", help = "only write lines for books in directories that have changed since the last scan")
+	parser.add_argument("--output", help = "file to append the lines to instead of printing them, such as pagesToProcess.txt")
+	args = parser.parse_args()
+
+	lines = []
+	for bookDir, fileNames, changed in scanLibrary(args.library, args.index, args.threads):
+		if changed or not args.new:
+			lines += getJobLines(bookDir, fileNames)
+	if args.output:
+		with open(args.output, "a") as fp:
+			fp.writelines(line + "\n" for line in lines)
+		print(f"{len(lines)} lines written to {args.output}")
+	else:
+		for line in lines:
+			print(line)
+
+# returns (book directory, book file names, whether the directory changed since the last scan) for every directory with books in it
+# the directories are read a level at a time, with every directory on a level read at the same time
+def scanLibrary(library, indexFile = None, threads = None):
+	library = os.path.abspath(library)
+	if indexFile is None:
+		indexFile = os.path.join(library, indexName)
+	known = loadIndex(indexFile)
+	dirs = {}
+	changedDirs = set()
+	level = [os.curdir]
+	with ThreadPoolExecutor(max_workers = threads) as executor:
+		while level:
+			results = executor.map(scanDir, [library] * len(level), level, [known.get(relDir) for relDir in level])
+			nextLevel = []
+			for relDir, (entry, changed) in zip(level, results):
+				if entry is None:
+					continue
+				dirs[relDir] = entry
+				if changed:
+					changedDirs.add(relDir)
+				nextLevel += [os.path.normpath(os.path.join(relDir, subDir)) for subDir in entry["subdirs"]]
+			level = nextLevel
+	logger.info(f"Read {len(changedDirs)} of {len(dirs)} directories in {library}")
+
+	# directories that have gone since the last scan are left out, so they drop out of the index too
+	saveIndex(indexFile, dirs)
+	return [(os.path.normpath(os.path.join(library, relDir)), entry["books"], relDir in changedDirs) for relDir, entry in sorted(dirs.items()) if entry["books"]]
+
+# returns the index entry for a directory and whether it had to be read, or (None, False) if it can't be read
+# a directory whose modification time hasn't changed has the same files in it, so its last entry is used without reading it
+def scanDir(library, relDir, knownEntry = None):
+	path = os.path.join(library, relDir)
+	try:
+		mtime = os.stat(path).st_mtime_ns
+		if knownEntry and knownEntry["mtime"] == mtime:
+			return knownEntry, False
+		subdirs = []
+		books = []
+		with os.scandir(path) as entries:
+			for dirEntry in entries:
+				if dirEntry.is_dir(follow_symlinks = False):
+					if dirEntry.name not in skipDirs:
+						subdirs.append(dirEntry.name)
+				elif isBookFile(dirEntry.name) and dirEntry.is_file():
+					books.append(dirEntry.name)
+	except OSError as err:
+		logger.warning(f"Could not read {path}: {err}")
+		return None, False
+	if time.time_ns() - mtime < racySeconds * 1000000000:
+		mtime = None
+	return {"mtime": mtime, "subdirs": sorted(subdirs), "books": sorted(books)}, True
+
+# CBZ, ePub, and PDF files and their backups, matching the extensions the same way findBookFile does
+def isBookFile(fileName):
+	ext = os.path.splitext(fileName)[1]
+	for suffix in bookBackup.backupSuffixes:
+		if ext.endswith(suffix):
+			ext = ext[:-len(suffix)]
+	return ext in bookFlags
+
+# returns a line for each kind of book in the directory, with no pages yet and the flags it needs
+# books with a backup get the backedup flag, since they would be skipped without it
+# an ePub that already has a CBZ of the same name next to it is left out, since converting it again would replace that CBZ with no backup
+def getJobLines(bookDir, fileNames):
+	exts = {os.path.splitext(fileName)[1] for fileName in fileNames}
+	lines = []
+	for ext, flag in bookFlags.items():
+		if ext not in exts:
+			continue
+		if ext == ".epub" and all(os.path.splitext(fileName)[0] + ".cbz" in fileNames for fileName in fileNames if os.path.splitext(fileName)[1] == ext):
+			continue
+		flags = [flag] if flag else []
+		if any(ext + suffix in exts for suffix in bookBackup.backupSuffixes):
+			flags.append("backedup")
+		lines.append("|".join([bookDir, ""] + flags))
+	return lines
+
+def loadIndex(indexFile):
+	if not os.path.isfile(indexFile):
+		return {}
+	try:
+		with open(indexFile, "r") as fp:
+			return json.load(fp)["dirs"]
+	except (ValueError, KeyError):
+		logger.warning(f"{indexFile} could not be read, so every directory will be read again")
+		return {}
+
+def saveIndex(indexFile, dirs):
+	with open(indexFile + ".tmp", "w") as fp:
+		json.dump({"dirs": dirs}, fp)
+	os.replace(indexFile + ".tmp", indexFile)
+
+if __name__ == "__main__":
+	main()
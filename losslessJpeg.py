@@ -0,0 +1,185 @@
+#	Comic Spread Stitch - for making digital comic books easier to read
+#	Copyright (C) 2024 Reed Mauzy
+#
+#	This program is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Changes to JPEG files that don't need the image to be decoded and re-encoded
+# Every function here returns None if it can't make the change, so the caller can fall back to decoding the image
+
+import shutil
+import struct
+import subprocess
+import logging
+
+logger = logging.getLogger(__name__)
+
+# how many degrees clockwise each EXIF orientation value turns the image when it's shown
+# the mirrored orientations are left out, since they can't be made by rotating
+orientationRotations = {1: 0, 6: 90, 3: 180, 8: 270}
+orientationTag = 0x0112
+
+def isJpeg(data):
+	return data[:2] == b"\xff\xd8"
+
+# returns where the APP1 segment holding the EXIF data starts and where its TIFF header starts, or (-1, -1) if there isn't one
+def findExif(data):
+	pos = 2
+	while pos + 4 <= len(data):
+		if data[pos] != 0xff:
+			break
+		marker = data[pos + 1]
+		# fill bytes
+		if marker == 0xff:
+			pos += 1
+			continue
+		# start of scan or end of image, so there are no more headers
+		if marker in [0xda, 0xd9]:
+			break
+		length = struct.unpack(">H", data[pos + 2:pos + 4])[0]
+		if marker == 0xe1 and data[pos + 4:pos + 10] == b"Exif\x00\x00":
+			return pos, pos + 10
+		pos += 2 + length
+	return -1, -1
+
+# returns where the value of the orientation tag in the first IFD is and the byte order it's in, or (-1, "") if there isn't one
+def findOrientation(data, tiffStart):
+	byteOrder = data[tiffStart:tiffStart + 2]
+	if byteOrder == b"II":
+		endian = "<"
+	elif byteOrder == b"MM":
+		endian = ">"
+	else:
+		return -1, ""
+	try:
+		ifd = tiffStart + struct.unpack(endian + "I", data[tiffStart + 4:tiffStart + 8])[0]
+		entries = struct.unpack(endian + "H", data[ifd:ifd + 2])[0]
+		for i in range(entries):
+			entry = ifd + 2 + 12 * i
+			tag, tagType = struct.unpack(endian + "HH", data[entry:entry + 4])
+			# orientation should always be a single SHORT
+			if tag == orientationTag and tagType == 3:
+				return entry + 8, endian
+	except struct.error:
+		pass
+	return -1, ""
+
+# returns the EXIF orientation of a JPEG, which is 1 if it doesn't have one
+def getOrientation(data):
+	segmentStart, tiffStart = findExif(data)
+	if tiffStart == -1:
+		return 1
+	valuePos, endian = findOrientation(data, tiffStart)
+	if valuePos == -1:
+		return 1
+	return struct.unpack(endian + "H", data[valuePos:valuePos + 2])[0]
+
+# rotates a JPEG 90 degrees by changing its EXIF orientation, leaving the image data alone
+# only works if the reader respects EXIF orientation, which most comic readers and OpenCV do
+def rotateExif(data, clockwise):
+	if not isJpeg(data):
+		return None
+	segmentStart, tiffStart = findExif(data)
+	if tiffStart == -1:
+		return insertOrientation(data, rotationToOrientation(90 if clockwise else 270))
+
+	valuePos, endian = findOrientation(data, tiffStart)
+	# adding a tag to existing EXIF data would mean moving everything after it, so the EXIF data is swapped for just an orientation
+	# that loses no more than decoding and re-encoding the image would, since OpenCV doesn't write EXIF data either
+	if valuePos == -1:
+		segmentEnd = segmentStart + 2 + struct.unpack(">H", data[segmentStart + 2:segmentStart + 4])[0]
+		return data[:segmentStart] + orientationSegment(rotationToOrientation(90 if clockwise else 270)) + data[segmentEnd:]
+	orientation = struct.unpack(endian + "H", data[valuePos:valuePos + 2])[0]
+	if orientation not in orientationRotations:
+		return None
+	newOrientation = rotationToOrientation(orientationRotations[orientation] + (90 if clockwise else 270))
+	return data[:valuePos] + struct.pack(endian + "H", newOrientation) + data[valuePos + 2:]
+
+def rotationToOrientation(degrees):
+	degrees %= 360
+	for orientation, rotation in orientationRotations.items():
+		if rotation == degrees:
+			return orientation
+
+# adds an APP1 segment that only holds an orientation tag to a JPEG without any EXIF data
+# it goes after the JFIF APP0 segment if there is one, since that has to come first
+def insertOrientation(data, orientation):
+	pos = 2
+	if data[2:4] == b"\xff\xe0":
+		pos += 2 + struct.unpack(">H", data[4:6])[0]
+	return data[:pos] + orientationSegment(orientation) + data[pos:]
+
+# big-endian TIFF header, then an IFD with just the orientation tag and no next IFD
+def orientationSegment(orientation):
+	exif = b"Exif\x00\x00" + b"MM\x00\x2a" + struct.pack(">I", 8) + struct.pack(">HHHIHHI", 1, orientationTag, 3, 1, orientation, 0, 0)
+	return b"\xff\xe1" + struct.pack(">H", len(exif) + 2) + exif
+
+# rotates a JPEG 90 degrees by rearranging its DCT blocks with jpegtran, so no quality is lost
+# jpegtran has to be on the PATH, and images whose size isn't a multiple of the block size are left to the fallback
+# so that the edge of the image isn't cut off or left unrotated
+def rotateLossless(data, clockwise):
+	if not isJpeg(data):
+		return None
+	# jpegtran rotates the stored image, so an EXIF orientation would be applied on top of that
+	if getOrientation(data) != 1:
+		return None
+	jpegtran = shutil.which("jpegtran")
+	if not jpegtran:
+		logger.debug("jpegtran not found")
+		return None
+	result = subprocess.run([jpegtran, "-rotate", "90" if clockwise else "270", "-perfect", "-copy", "all"], input = data, capture_output = True)
+	if result.returncode != 0 or not result.stdout:
+		logger.debug(f"jpegtran could not rotate image: {result.stderr.decode(errors = 'replace').strip()}")
+		return None
+	return result.stdout
+
+# returns the width and height of a JPEG from its start of frame header, or None if it doesn't have one
+def getSize(data):
+	pos = 2
+	while pos + 4 <= len(data):
+		if data[pos] != 0xff:
+			break
+		marker = data[pos + 1]
+		if marker == 0xff:
+			pos += 1
+			continue
+		if marker in [0xda, 0xd9]:
+			break
+		length = struct.unpack(">H", data[pos + 2:pos + 4])[0]
+		# every SOFn marker except DHT, JPG, and DAC, which share the range
+		if 0xc0 <= marker <= 0xcf and marker not in [0xc4, 0xc8, 0xcc]:
+			height, width = struct.unpack(">HH", data[pos + 5:pos + 9])
+			return width, height
+		pos += 2 + length
+	return None
+
+# cuts columns off the right edge of a JPEG with jpegtran without re-encoding it
+# keeping the top left corner where it is means the crop always lines up with the JPEG's blocks
+def cropRight(data, columns):
+	if not isJpeg(data):
+		return None
+	# the stored right edge is only the shown right edge if the image isn't rotated or flipped
+	if getOrientation(data) != 1:
+		return None
+	size = getSize(data)
+	if not size or size[0] <= columns:
+		return None
+	jpegtran = shutil.which("jpegtran")
+	if not jpegtran:
+		logger.debug("jpegtran not found")
+		return None
+	result = subprocess.run([jpegtran, "-crop", f"{size[0] - columns}x{size[1]}+0+0", "-copy", "all"], input = data, capture_output = True)
+	if result.returncode != 0 or not result.stdout:
+		logger.debug(f"jpegtran could not crop image: {result.stderr.decode(errors = 'replace').strip()}")
+		return None
+	return result.stdout
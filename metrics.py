@@ -0,0 +1,167 @@
+#	Comic Spread Stitch - for making digital comic books easier to read
+#	Copyright (C) 2024 Reed Mauzy
+#
+#	This program is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Records how long each stage of processing a book takes and how many bytes it handles
+# Stages are only recorded while a book is being measured on the same thread, so the rest of the time they cost next to nothing
+
+import json
+import sys
+import threading
+import time
+try:
+	import resource
+except ImportError:
+	# Windows doesn't have the resource module, so peak memory use isn't reported there
+	resource = None
+
+# stages that mostly wait on the disk rather than the CPU
+ioStages = ["read", "write", "copy", "extract", "cleanup", "replace"]
+
+local = threading.local()
+
+# the most memory this process has used so far in bytes, or None if that can't be found out
+def peakMemory():
+	if resource is None:
+		return None
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	# macOS gives bytes and Linux gives kilobytes
+	return peak if sys.platform == "darwin" else peak * 1024
+
+# the timings of one book, split up by stage and by page
+class BookMetrics:
+	def __init__(self, line):
+		self.line = line
+		self.status = None
+		self.seconds = 0.0
+		# peak memory use of the process by the time the book was done, which includes any books it processed before this one
+		self.peakMemory = None
+		# the most bytes of decoded images held at once while stitching any one spread
+		self.stitchMemory = None
+		self.stages = {}
+		self.pages = []
+		# pages can be handled by several threads at once
+		self.lock = threading.Lock()
+
+	def add(self, stage, seconds, size = 0, page = None):
+		with self.lock:
+			totals = self.stages.setdefault(stage, {"seconds": 0.0, "bytes": 0, "count": 0})
+			totals["seconds"] += seconds
+			totals["bytes"] += size
+			totals["count"] += 1
+			if page is not None:
+				self.pages.append({"page": page, "stage": stage, "seconds": seconds, "bytes": size})
+
+	def toDict(self):
+		return {"line": self.line.strip(), "status": self.status, "seconds": self.seconds, "peakMemory": self.peakMemory, "stitchMemory": self.stitchMemory, "stages": self.stages, "pages": self.pages}
+
+# the book being measured on this thread, if any
+def current():
+	return getattr(local, "book", None)
+
+# measures everything done on this thread inside the with block as one book
+class measureBook:
+	def __init__(self, line):
+		self.book = BookMetrics(line)
+
+	def __enter__(self):
+		self.previous = current()
+		local.book = self.book
+		self.start = time.perf_counter()
+		return self.book
+
+	def __exit__(self, excType, excValue, traceback):
+		self.book.seconds = time.perf_counter() - self.start
+		self.book.peakMemory = peakMemory()
+		local.book = self.previous
+
+# times the with block as one stage of the current book
+# the number of bytes handled can be passed in or set on the returned object inside the block
+class stage:
+	def __init__(self, name, page = None, size = 0):
+		self.name = name
+		self.page = page
+		self.size = size
+
+	def __enter__(self):
+		self.start = time.perf_counter()
+		return self
+
+	def __exit__(self, excType, excValue, traceback):
+		book = current()
+		if book is not None:
+			book.add(self.name, time.perf_counter() - self.start, self.size, self.page)
+
+# records how many bytes of decoded images stitching a spread held at once, keeping the largest for the current book
+def recordStitchMemory(size):
+	book = current()
+	if book is not None:
+		with book.lock:
+			book.stitchMemory = max(book.stitchMemory or 0, size)
+
+# returns a version of function that records its stages against the book being measured on the calling thread
+# for handing work to a thread pool
+def bindCurrent(function):
+	book = current()
+	def bound(*args):
+		previous = current()
+		local.book = book
+		try:
+			return function(*args)
+		finally:
+			local.book = previous
+	return bound
+
+# adds up the timings of every book in a run, writing each book's timings to metricsFile as a line of JSON
+class Summary:
+	def __init__(self, metricsFile = None):
+		self.metricsFile = metricsFile
+		self.books = 0
+		self.seconds = 0.0
+		self.peakMemory = None
+		self.stitchMemory = None
+		self.stages = {}
+
+	def add(self, bookMetrics):
+		self.books += 1
+		self.seconds += bookMetrics["seconds"]
+		if bookMetrics.get("peakMemory") is not None:
+			self.peakMemory = max(self.peakMemory or 0, bookMetrics["peakMemory"])
+		if bookMetrics.get("stitchMemory") is not None:
+			self.stitchMemory = max(self.stitchMemory or 0, bookMetrics["stitchMemory"])
+		for name, totals in bookMetrics["stages"].items():
+			summed = self.stages.setdefault(name, {"seconds": 0.0, "bytes": 0, "count": 0})
+			for key in summed:
+				summed[key] += totals[key]
+		if self.metricsFile:
+			with open(self.metricsFile, "a") as fp:
+				fp.write(json.dumps(bookMetrics) + "\n")
+
+	def report(self):
+		lines = [f"Timings for {self.books} books, {self.seconds:.2f} seconds in total:"]
+		ioSeconds = 0.0
+		cpuSeconds = 0.0
+		for name, totals in sorted(self.stages.items(), key = lambda item: item[1]["seconds"], reverse = True):
+			lines.append(f"  {name}: {totals['seconds']:.2f} seconds, {totals['bytes'] / 1000000:.1f} MB, {totals['count']} times")
+			if name in ioStages:
+				ioSeconds += totals["seconds"]
+			else:
+				cpuSeconds += totals["seconds"]
+		lines.append(f"{ioSeconds:.2f} seconds were spent on disk I/O and {cpuSeconds:.2f} seconds on image work.")
+		if self.peakMemory is not None:
+			lines.append(f"Peak memory use of any one process was {self.peakMemory / 1000000:.0f} MB.")
+		if self.stitchMemory is not None:
+			lines.append(f"Stitching any one spread held at most {self.stitchMemory / 1000000:.0f} MB of images at once.")
+		return "\n".join(lines)
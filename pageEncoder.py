@@ -0,0 +1,90 @@
+#	Comic Spread Stitch - for making digital comic books easier to read
+#	Copyright (C) 2024 Reed Mauzy
+#
+#	This program is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Turns changed pages back into image files, in the format and at the quality asked for
+# With threads, pages are encoded in a pool of threads so that the next spread can be worked on while the last one is encoded
+
+import metrics
+from concurrent.futures import ThreadPoolExecutor, Future
+import os
+
+# same keeps each page in the format it came in
+outputFormats = ["same", ".jpg", ".png", ".webp"]
+jpegExts = [".jpg", ".jpeg"]
+
+class PageEncoder:
+	# quality is for JPEG and WebP pages from 0 to 100, and pngCompression is for PNG pages from 0 to 9
+	# None leaves them at OpenCV's defaults
+	# threads is the number of pages to encode at the same time; 0 encodes each page as soon as it's written
+	def __init__(self, imgFormat = "same", quality = None, pngCompression = None, threads = 0):
+		self.imgFormat = imgFormat
+		self.quality = quality
+		self.pngCompression = pngCompression
+		# OpenCV lets go of the GIL while it works on a page, so threads are enough for pages to really be worked on at the same time
+		self.executor = ThreadPoolExecutor(max_workers = threads) if threads is None or threads > 0 else None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, excType, excValue, traceback):
+		self.close()
+
+	# waits for any pages still being encoded
+	def close(self):
+		if self.executor:
+			self.executor.shutdown()
+
+	# everything that changes what a page is encoded as, for the stitched page cache
+	def settings(self):
+		return [self.imgFormat, self.quality, self.pngCompression]
+
+	# the name a page is saved under once it's encoded, which only changes if it's being converted to another format
+	def outputName(self, img):
+		root, ext = os.path.splitext(img)
+		if self.imgFormat == "same" or (self.imgFormat in jpegExts and ext.lower() in jpegExts):
+			return img
+		return root + self.imgFormat
+
+	def params(self, ext):
+		import cv2
+		ext = ext.lower()
+		if ext in jpegExts and self.quality is not None:
+			return [cv2.IMWRITE_JPEG_QUALITY, self.quality]
+		if ext == ".webp" and self.quality is not None:
+			return [cv2.IMWRITE_WEBP_QUALITY, self.quality]
+		if ext == ".png" and self.pngCompression is not None:
+			return [cv2.IMWRITE_PNG_COMPRESSION, self.pngCompression]
+		return []
+
+	def encode(self, img, page):
+		import cv2
+		ext = os.path.splitext(self.outputName(img))[1]
+		with metrics.stage("encode", img) as encodeStage:
+			success, data = cv2.imencode(ext, page, self.params(ext))
+			if not success:
+				raise ValueError(f"Could not encode {img}")
+			encodeStage.size = len(data)
+		return data.tobytes()
+
+	# returns a Future of the encoded page if there are threads to encode it in, otherwise the encoded page itself
+	def submit(self, img, page):
+		if self.executor is None:
+			return self.encode(img, page)
+		return self.executor.submit(metrics.bindCurrent(self.encode), img, page)
+
+# the bytes of a page from submit, waiting for it to be encoded if it hasn't been yet
+def result(data):
+	return data.result() if isinstance(data, Future) else data
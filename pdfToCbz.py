@@ -16,61 +16,110 @@
 
 from pypdf import PdfReader
 from zipfile import ZipFile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import zipUtils
+import atomicFile
 import argparse
 import os
 import math
-import shutil
 
-tempPath = "temp"
-newPath = "new"
+# images compressed with these filters are complete image files already, so they're copied out of the PDF as they are
+rawFilterExts = {"/DCTDecode": ".jpg", "/JPXDecode": ".jp2"}
 
 def main():
 	# parse arguments
 	parser = argparse.ArgumentParser()
 	parser.add_argument("book", help = "The absolute file path of the PDF you want to convert to CBZ")
+	parser.add_argument("-j", "--jobs", type = int, default = 1, help = "number of processes to extract pages with")
 	args = parser.parse_args()
-	convertPdfToCbz(args.book)
+	status, reason = convertPdfToCbz(args.book, args.jobs)
+	print(reason)
 
 # This function grabs the first image from each page of the PDF
 # and puts it into a CBZ archive
 # As PDFs are black magic, this may not get the desired result
-def convertPdfToCbz(book):
+# with more than one job, the pages are split up between a pool of worker processes, each with its own copy of the PDF open
+# the images go straight into the CBZ in page order without being written anywhere else first
+def convertPdfToCbz(book, jobs = 1):
 	[root, ext] = os.path.splitext(book)
 	if ext.lower() != ".pdf":
-		sys.exit("Provided file is not a PDF.")
-	
-	bookDir = os.path.dirname(book)
+		return 1, "Provided file is not a PDF."
+
 	bookPdf = os.path.basename(book)
-	os.chdir(bookDir)
-	
-	reader = PdfReader(bookPdf)
-	count = 0
-	numDigits = math.ceil(math.log(len(reader.pages), 10))
-	cbzFileName = os.path.basename(root) + ".cbz"
-	
-	try:
-		os.mkdir(tempPath)
-	except FileExistsError as err:
-		print(tempPath + " directory already exists")
-	
-	# The reason for the line image_file_object = page.images[count] is that
-	# the PDF I first tried this on seemed to have all the images repeated in each page
-	for page in reader.pages:
-		# for image_file_object in page.images:
-		image_file_object = page.images[count]
-		with open(os.path.join(tempPath, ("{:0" + str(numDigits) + "d}").format(count) + os.path.splitext(image_file_object.name)[1]), "wb") as fp:
-			fp.write(image_file_object.data)
-			count += 1
-	
-	imgs = os.listdir(tempPath)
-	with ZipFile(cbzFileName, "w") as cbz:
-		for img in imgs:
-			cbz.write(os.path.join(tempPath, img), arcname = img)
-	
-	# clean up
-	shutil.rmtree(tempPath)
-	
-	print("{} converted to CBZ.".format(bookPdf))
+	with open(book, "rb") as fp:
+		pageCount = len(PdfReader(fp).pages)
+	if pageCount == 0:
+		return 1, f"{bookPdf} has no pages to convert."
+	numDigits = math.ceil(math.log(pageCount, 10))
+	cbzFile = root + ".cbz"
+
+	# several chunks for each job, so that a job that gets the slow pages doesn't hold up the rest for long
+	chunkSize = max(1, math.ceil(pageCount / (max(jobs, 1) * 4)))
+	chunks = [range(start, min(start + chunkSize, pageCount)) for start in range(0, pageCount, chunkSize)]
+
+	missing = 0
+	with atomicFile.tempFile(cbzFile) as newCbzFile:
+		with ZipFile(newCbzFile, "w") as cbz:
+			if jobs <= 1:
+				results = map(extractPages, repeat(book), chunks)
+				missing = writePages(cbz, results, numDigits)
+			else:
+				with ProcessPoolExecutor(max_workers = jobs) as executor:
+					results = executor.map(extractPages, repeat(book), chunks)
+					missing = writePages(cbz, results, numDigits)
+		# an empty CBZ isn't worth having, and would take the place of one that's already there
+		if missing == pageCount:
+			return 1, f"None of the pages of {bookPdf} have images, so it was not converted to CBZ."
+		atomicFile.replaceFile(newCbzFile, cbzFile)
+
+	if missing:
+		return 0, f"{bookPdf} converted to CBZ. {missing} pages had no images and were left out."
+	return 0, f"{bookPdf} converted to CBZ."
+
+# writes the pages from each chunk into cbz as the chunks come in, returning how many pages had no image
+def writePages(cbz, results, numDigits):
+	missing = 0
+	for chunk in results:
+		for count, imgExt, data in chunk:
+			if data is None:
+				missing += 1
+				continue
+			zipUtils.writeMember(cbz, ("{:0" + str(numDigits) + "d}").format(count) + imgExt, data)
+	return missing
+
+# returns (page number, extension, image bytes) for each page in pageNums
+# the PDF is opened again here so that this can run in a process of its own
+def extractPages(book, pageNums):
+	with open(book, "rb") as fp:
+		reader = PdfReader(fp)
+		return [(count,) + extractPage(reader.pages[count], count) for count in pageNums]
+
+# returns the extension and bytes of the image for a page, or ("", None) if it has no images
+def extractPage(page, count):
+	keys = page.images.keys()
+	if not keys:
+		return "", None
+	# the PDF I first tried this on seemed to have all the images repeated in each page, so page n takes image n when it has one
+	key = keys[count] if count < len(keys) else keys[0]
+
+	xobject = getImageObject(page, key)
+	filters = xobject.get("/Filter", [])
+	if not isinstance(filters, list):
+		filters = [filters]
+	# masks and decode arrays change how the image looks, so images with them are left to pypdf to convert
+	if len(filters) == 1 and filters[0] in rawFilterExts and not any(entry in xobject for entry in ["/SMask", "/Mask", "/Decode"]):
+		return rawFilterExts[filters[0]], xobject._data
+
+	image = page.images[key]
+	return os.path.splitext(image.name)[1], image.data
+
+# finds the image XObject that page.images lists under key, which is a list of names if the image is inside a form
+def getImageObject(page, key):
+	obj = page
+	for name in key if isinstance(key, list) else [key]:
+		obj = obj["/Resources"]["/XObject"][name]
+	return obj
 
 if __name__ == "__main__":
 	main()
@@ -15,15 +15,23 @@
 #	along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 from pypdf import PdfReader, PdfWriter, Transformation
-from pypdf.generic import RectangleObject
+from pypdf.generic import RectangleObject, NullObject, StreamObject, DictionaryObject, ArrayObject, IndirectObject
+from io import BytesIO
 import argparse
+import hashlib
 import ast
-import os
 import logging
 import traceback
 import datetime
+import metrics
+import atomicFile
+import bookProgress
 
 logger = logging.getLogger(__name__)
+# the private parts of PdfWriter that sharing images and writing a page at a time use, since pypdf has no public way of doing either
+# they're checked for rather than relied on, in case another version of pypdf changes them; the readme has the version they were tested with
+dedupeInternals = ["_objects", "_id_translated"]
+streamInternals = dedupeInternals + ["_resolve_links", "_write_xref_table", "_write_trailer"]
 
 def main():
 	# parse arguments
@@ -32,6 +40,7 @@ def main():
 	parser.add_argument("pageList", help = "The list of pages you want to process and what you want to do with them; should look like a Python list")
 	parser.add_argument("-m", "--manga", dest = "manga", action = "store_true", help = "Add this switch if the book is read from right to left")
 	parser.add_argument("-b", "--backedup", dest = "backedup", action = "store_true", help = "Add this switch if the book already has a backup")
+	parser.add_argument("-l", "--lowmemory", dest = "lowMemory", action = "store_true", help = "Add this switch to write the book to the disk a page at a time instead of keeping all of it in memory")
 	args = parser.parse_args()
 	logging.basicConfig(filename = "run.log", level = logging.INFO)
 	logger.info(f"Running at {datetime.datetime.now()}")
@@ -39,8 +48,9 @@ def main():
 	logger.info(f"Page list is {pageList}")
 	logger.info(f"manga = {args.manga}")
 	logger.info(f"backedup = {args.backedup}")
+	logger.info(f"lowMemory = {args.lowMemory}")
 	try:
-		status, reason = processPdf(args.book, pageList, args.manga, args.backedup)
+		status, reason = processPdf(args.book, pageList, args.manga, args.backedup, args.lowMemory)
 		if not status:
 			logger.info("Processing complete")
 			print(f"{args.book} successfully processed.")
@@ -52,101 +62,266 @@ def main():
 		logger.error(out)
 		print(out)
 
-def processPdf(book, pageList, manga, backedup):
-	# read source PDF
-	reader = PdfReader(book)
-	logger.info("Opened PDF file")
-	
-	# check whether reader.pages is long enough to cover the last page in pagesList
-	if (pageList[-1][1] in ["l", "r", "d"] and len(reader.pages) < pageList[-1][0]) or (not (pageList[-1][1] in ["l", "r", "d"]) and len(reader.pages) < pageList[-1][0] + 1):
-		return 1, f"{book} skipped because the last page to process is past the end of the book."
-	
-	#check whether back cover needs to be altered
-	backcover = False
-	if pageList[0][0] == 0:
-		backcover = True
-		del pageList[0]
-	logger.debug(f"backcover = {backcover}")
+# with lowMemory, the destination PDF is written to the disk a page at a time instead of all at once at the end
+# so that books bigger than the memory available can be processed
+# either way, the new PDF is written next to the old one and only replaces it once it's complete, see atomicFile
+# progress is called as the pages of the new PDF are made, see bookProgress
+def processPdf(book, pageList, manga, backedup, lowMemory = False, progress = None):
+	with atomicFile.tempFile(book) as newBook:
+		# pypdf reads the whole file into memory if it's given a path, but only reads what it needs from an open file
+		with open(book, "rb") as bookFp:
+			# read source PDF
+			reader = PdfReader(bookFp)
+			logger.info("Opened PDF file")
+			
+			# check whether reader.pages is long enough to cover the last page in pagesList
+			if (pageList[-1][1] in ["l", "r", "d"] and len(reader.pages) < pageList[-1][0]) or (not (pageList[-1][1] in ["l", "r", "d"]) and len(reader.pages) < pageList[-1][0] + 1):
+				return 1, f"{book} skipped because the last page to process is past the end of the book."
+			
+			# create destination PDF
+			if lowMemory and not hasInternals(PdfWriter(), streamInternals):
+				logger.warning("This version of pypdf can't be used to write a page at a time, so the whole book is being kept in memory")
+				lowMemory = False
+			if lowMemory:
+				with open(newBook, "wb") as fp:
+					writer = StreamingPdfWriter(fp, reader.pdf_header)
+					logger.info("Created streaming PDF writer")
+					assemblePdf(reader, writer, pageList, manga, lowMemory, progress)
+					writer.finish()
+			else:
+				writer = DedupingPdfWriter()
+				logger.info("Created PDF writer")
+				assemblePdf(reader, writer, pageList, manga, progress = progress)
+			logger.info(f"Shared {writer.dedupedImages} repeated images, saving {writer.savedBytes} bytes")
+		
+		# write file
+		if not lowMemory:
+			with open(newBook, "wb") as fp:
+				writer.write(fp)
+		logger.info("PDF written to disk")
+		
+		# keep the old file as the backup and put the new one in its place
+		try:
+			atomicFile.replaceBook(book, newBook, backedup)
+		except PermissionError as permErr:
+			logger.error("Book not replaced because the source file could not be renamed")
+			return 1, f"{book} is open in another program. Close it and run the script again."
+	
+	peak = metrics.peakMemory()
+	if peak is not None:
+		logger.info(f"Peak memory use so far is {peak / 1000000:.0f} MB")
+	
+	return 0, ""
+
+# adds the pages of reader to writer as pageList says to
+# with releasePages, each page is written out and forgotten by both the reader and the writer as soon as it's done
+def assemblePdf(reader, writer, pageList, manga, releasePages = False, progress = None):
+	plan = planPdf(pageList, len(reader.pages))
+	logger.debug(f"plan = {plan}")
+	bookProgress.report(progress, 0, len(plan))
+	for planIndex, (pageNum, op) in enumerate(plan):
+		# no processing needed
+		if op is None:
+			writer.add_page(reader.pages[pageNum])
+			logger.debug(f"Added page {pageNum + 1} unaltered")
+		elif pageNum == -1:
+			stitchPages(reader, writer, -1, manga)
+			logger.info("Stitched back cover to front cover")
+		else:
+			processPage(reader, writer, pageNum, op, manga)
+		with metrics.stage("dedupe") as dedupeStage:
+			dedupeStage.size = writer.dedupeImages()
+		if releasePages:
+			writer.flush()
+			reader.resolved_objects.clear()
+		bookProgress.report(progress, planIndex + 1, len(plan))
+	
+	# set right-to-left reading direction if manga
+	if manga:
+		writer.create_viewer_preferences()
+		writer.viewer_preferences.direction = "/R2L"
+		logger.debug("Set view direction to right-to-left")
+
+# a PdfWriter that keeps only one copy of each image, since some PDFs have a separate copy of the same image on every page it's used on
+class DedupingPdfWriter(PdfWriter):
+	def __init__(self):
+		super().__init__()
+		# the image each hash was first seen in
+		self.imageHashes = {}
+		self.dedupedUpTo = 0
+		self.dedupedImages = 0
+		self.savedBytes = 0
+	
+	# swaps every image added since the last call that's the same as one already in the PDF for that one
+	# returns the number of bytes saved
+	# does nothing if this version of pypdf doesn't keep its objects the way this expects
+	def dedupeImages(self):
+		if not hasInternals(self, dedupeInternals):
+			return 0
+		newObjects = range(self.dedupedUpTo + 1, len(self._objects) + 1)
+		self.dedupedUpTo = len(self._objects)
+		duplicates = {}
+		savedBytes = 0
+		# an image's soft mask is cloned after the image, so going backwards means the mask has been swapped before the image is hashed
+		for idnum in reversed(newObjects):
+			obj = self._objects[idnum - 1]
+			if not isinstance(obj, StreamObject) or obj.get("/Subtype") != "/Image":
+				continue
+			replaceReferences(obj, duplicates)
+			imageHash = hashImage(obj)
+			if imageHash in self.imageHashes:
+				duplicates[idnum] = self.imageHashes[imageHash]
+				self._objects[idnum - 1] = None
+				savedBytes += len(obj._data)
+			else:
+				self.imageHashes[imageHash] = obj.indirect_reference
+		if not duplicates:
+			return 0
+		
+		for idnum in newObjects:
+			if self._objects[idnum - 1] is not None:
+				replaceReferences(self._objects[idnum - 1], duplicates)
+		# source objects that were cloned into a duplicate have to point to the image that was kept, so that they aren't cloned again
+		for translated in self._id_translated.values():
+			for sourceIdnum, idnum in translated.items():
+				if idnum in duplicates:
+					translated[sourceIdnum] = duplicates[idnum].idnum
+		self.dedupedImages += len(duplicates)
+		self.savedBytes += savedBytes
+		return savedBytes
+
+def hasInternals(writer, names):
+	return all(hasattr(writer, name) for name in names)
+
+# points every reference in obj to an object numbered in duplicates at the object it's a duplicate of
+def replaceReferences(obj, duplicates):
+	if isinstance(obj, DictionaryObject):
+		items = list(obj.items())
+	elif isinstance(obj, ArrayObject):
+		items = list(enumerate(obj))
+	else:
+		return
+	for key, value in items:
+		if isinstance(value, IndirectObject):
+			if value.idnum in duplicates:
+				obj[key] = duplicates[value.idnum]
+		else:
+			replaceReferences(value, duplicates)
+
+# identifies an image by its data and its dictionary, so that two images are only the same if they'd be drawn the same way
+def hashImage(obj):
+	sha = hashlib.sha256()
+	for key in sorted(obj.keys()):
+		value = BytesIO()
+		obj[key].write_to_stream(value)
+		sha.update(key.encode() + b" " + value.getvalue() + b"\n")
+	sha.update(obj._data)
+	return sha.hexdigest()
+
+# stands in for an object that has already been written to the file, so that it can still be referred to
+class FlushedObject(NullObject):
+	def __init__(self, indirectReference):
+		self.indirect_reference = indirectReference
+
+# a PdfWriter that writes the streams of each page, which hold the images and most of the rest of the data, to the file as soon as flush is called
+# instead of keeping the whole book in memory until the end
+# pypdf has no public way of doing this, so objects are written the same way PdfWriter.write writes them
+class StreamingPdfWriter(DedupingPdfWriter):
+	def __init__(self, fp, pdfHeader):
+		super().__init__()
+		self.fp = fp
+		# the header has to be written before any pages are added, so it's taken from the source PDF
+		self.pdf_header = pdfHeader
+		self.positions = {}
+		self.flushedUpTo = 0
+		fp.write(self.pdf_header.encode() + b"\n")
+		fp.write(b"%\xE2\xE3\xCF\xD3\n")
 	
-	# create destination PDF
-	writer = PdfWriter()
-	logger.info("Created PDF writer")
+	def writeObject(self, idnum, obj):
+		position = self.fp.tell()
+		self.fp.write(f"{idnum} 0 obj\n".encode())
+		obj.write_to_stream(self.fp)
+		self.fp.write(b"\nendobj\n")
+		return position
 	
-	# split pageList into its columns
-	pagesList = [item[0] for item in pageList]
-	opsList = [item[1] for item in pageList]
-	logger.debug(f"pagesList = {pagesList}")
-	logger.debug(f"opsList = {opsList}")
+	# writes the streams added since the last flush to the file and lets go of them
+	# pages only change the dictionaries that point to their streams after being added, so streams are finished by the time they're flushed
+	def flush(self):
+		for idnum in range(self.flushedUpTo + 1, len(self._objects) + 1):
+			obj = self._objects[idnum - 1]
+			if isinstance(obj, StreamObject):
+				self.positions[idnum] = self.writeObject(idnum, obj)
+				self._objects[idnum - 1] = FlushedObject(obj.indirect_reference)
+		self.flushedUpTo = len(self._objects)
+	
+	# writes everything that hasn't been flushed yet, then the cross-reference table and trailer
+	def finish(self):
+		self._resolve_links()
+		positions = []
+		freeObjects = []
+		for idnum, obj in enumerate(self._objects, start = 1):
+			if idnum in self.positions:
+				positions.append(self.positions[idnum])
+			elif obj is not None:
+				positions.append(self.writeObject(idnum, obj))
+			else:
+				positions.append(-1)
+				freeObjects.append(idnum)
+		freeObjects.append(0)
+		xrefLocation = self._write_xref_table(self.fp, positions, freeObjects)
+		self._write_trailer(self.fp, xrefLocation)
+
+# works out what happens to each page of the source PDF before any of them are touched, so that it takes one pass over the book
+# returns a list of (page index, op) pairs in the order the pages go into the destination PDF
+# an op of None means the page is added unaltered, and a page index of -1 means the back cover is stitched to the front cover
+def planPdf(pageList, pageCount):
+	# page 0 means the back cover is stitched to the front cover
+	backcover = pageList[0][0] == 0
+	logger.debug(f"backcover = {backcover}")
+	
+	# the op for each page number, so that looking a page up doesn't mean searching the page list
+	# the first op given for a page wins
+	ops = {}
+	for page, op in pageList[1:] if backcover else pageList:
+		ops.setdefault(page, op)
 	
 	# For each page in the source PDF except the back cover:
 	# If neither that page nor the previous one is in the list, add it to the destination PDF
 	# If that page is in the list, process it and the next page
 	# If the previous page is in the list, check how it was transformed to see whether anything should be done with this one
-	for i in range(len(reader.pages) - 1):
+	# page numbers in the list start at 1, so page i in the list is index i - 1 and the page before index i is i in the list
+	plan = []
+	for i in range(pageCount - 1):
 		# no processing needed
-		if i + 1 not in pagesList and i not in pagesList:
-			writer.add_page(reader.pages[i])
-			logger.debug(f"Added page {i + 1} unaltered")
+		if i + 1 not in ops and i not in ops:
+			plan.append((i, None))
 		
 		# maybe processing needed because previous page was processed
-		elif i in pagesList:
-			p = pagesList.index(i)
-			prevOp = opsList[p]
-			# if statement necessary in case i is the last page of the source PDF
-			if p + 1 < len(opsList):
-				currOp = opsList[p + 1]
-			if prevOp in ['d', 'l', 'r']:
-				if i + 1 not in pagesList:
-					writer.add_page(reader.pages[i])
-					logger.debug(f"Added page {i + 1} unaltered")
-				else:
-					processPage(reader, writer, i, currOp, manga)
+		# if the previous page was stitched, this page is already part of it
+		elif i in ops:
+			if ops[i] in ["d", "l", "r"]:
+				plan.append((i, ops.get(i + 1)))
 		
 		# yes processing needed
 		else:
-			p = pagesList.index(i + 1)
-			processPage(reader, writer, i, opsList[p], manga)
+			plan.append((i, ops[i + 1]))
 	
 	# handle back cover
 	if backcover:
-		stitchPages(reader, writer, -1, manga)
-		logger.info("Stitched back cover to front cover")
-	# don't add back cover if it was supposed to be deleted or stitched to the previous page
-	elif len(reader.pages) - 1 in pagesList and opsList[pagesList.index(len(reader.pages) - 1)] in ["", "m", "s"]:
+		plan.append((-1, ""))
+	# don't add back cover if it was supposed to be stitched to the previous page
+	elif ops.get(pageCount - 1) in ["", "m", "s"]:
 		logger.debug("Did not add back cover because it was stitched to the previous page")
-	elif len(reader.pages) in pagesList and opsList[pagesList.index(len(reader.pages))] == "d":
+	elif ops.get(pageCount) == "d":
 		logger.info("Deleted back cover")
 	# rotate back cover if needed
-	elif len(reader.pages) in pagesList and opsList[pagesList.index(len(reader.pages))] in ["l", "r"]:
-		processPage(reader, writer, len(reader.pages) - 1, opsList[pagesList.index(len(reader.pages))], manga)
+	elif ops.get(pageCount) in ["l", "r"]:
+		plan.append((pageCount - 1, ops[pageCount]))
 	# add back cover unchanged if no other operations on it
 	else:
-		writer.add_page(reader.pages[-1])
-		logger.debug("Added back cover unaltered")
-	
-	# set right-to-left reading direction if manga
-	if manga:
-		writer.create_viewer_preferences()
-		writer.viewer_preferences.direction = "/R2L"
-		logger.debug("Set view direction to right-to-left")
-	
-	# rename old file
-	if not backedup:
-		try:
-			os.rename(book, book + "_old")
-			logger.debug("Backup created")
-		except PermissionError as permErr:
-			logger.error("Backup not created because source file could not be renamed")
-			return 1, f"{book} is open in another program. Close it and run the script again."
-	else:
-		logger.debug("Backup not created because a backup already exists")
-	
-	# write file
-	with open(book, "wb") as fp:
-		writer.write(fp)
-	logger.info("PDF written to disk")
+		plan.append((pageCount - 1, None))
 	
-	return 0, ""
+	return plan
 
 def processPage(reader, writer, pageNum, op, manga):
 	# delete page by not adding it to the destination PDF
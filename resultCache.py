@@ -0,0 +1,125 @@
+#	Comic Spread Stitch - for making digital comic books easier to read
+#	Copyright (C) 2024 Reed Mauzy
+#
+#	This program is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Remembers which job produced the book currently in a book directory, and the stitched pages it made along the way
+# Files are recognised by their size and modification time, so checking whether a job has already been done doesn't read the book
+# Everything is kept in a directory next to the book, like temp and run.log
+
+import hashlib
+import json
+import os
+import logging
+
+cachePath = "stitchCache"
+indexName = "index.json"
+logger = logging.getLogger(__name__)
+
+# size and modification time, which change whenever the file is rewritten
+def fileStat(path):
+	stat = os.stat(path)
+	return [stat.st_size, stat.st_mtime_ns]
+
+def hashFile(path):
+	sha = hashlib.sha256()
+	with open(path, "rb") as fp:
+		for chunk in iter(lambda: fp.read(1 << 20), b""):
+			sha.update(chunk)
+	return sha.hexdigest()
+
+class ResultCache:
+	def __init__(self, bookDir):
+		self.bookDir = bookDir
+		self.cacheDir = os.path.join(bookDir, cachePath)
+		self.index = {"results": {}, "hashes": {}}
+		indexFile = os.path.join(self.cacheDir, indexName)
+		if os.path.isfile(indexFile):
+			try:
+				with open(indexFile, "r") as fp:
+					self.index = json.load(fp)
+			except ValueError:
+				logger.warning(f"{indexFile} could not be read, so the cache is starting over")
+		# the stitched pages used by this run, so that the rest can be thrown away once it's done
+		self.usedPages = set()
+
+	# returns the name of the book with ext that a cached job produced and the job, if the book hasn't changed since
+	def findResult(self, ext):
+		for outputName, entry in self.index["results"].items():
+			outputFile = os.path.join(self.bookDir, outputName)
+			if os.path.splitext(outputName)[1] == ext and os.path.isfile(outputFile) and fileStat(outputFile) == entry["stat"]:
+				return outputName, entry
+		return None, None
+
+	# the hash of a file in the book directory, which is only worked out again if the file has changed
+	def sourceHash(self, sourceName):
+		if not sourceName:
+			return None
+		sourceFile = os.path.join(self.bookDir, sourceName)
+		if not os.path.isfile(sourceFile):
+			return None
+		stat = fileStat(sourceFile)
+		known = self.index["hashes"].get(sourceName)
+		if known and known["stat"] == stat:
+			return known["hash"]
+		sourceHash = hashFile(sourceFile)
+		self.index["hashes"][sourceName] = {"stat": stat, "hash": sourceHash}
+		return sourceHash
+
+	# whether a cached job was run on the same source with the same pages and options as job
+	def isSameJob(self, entry, job):
+		return entry["job"] == dict(job, source = self.sourceHash(entry["source"]))
+
+	# whether the source a cached job was run on is still there as it was
+	def sourceIsUnchanged(self, entry):
+		return entry["source"] is not None and self.sourceHash(entry["source"]) == entry["job"]["source"]
+
+	# remembers that job turned sourceName into outputName, and throws away stitched pages this run didn't use
+	def addResult(self, outputName, sourceName, job):
+		self.index["results"] = {outputName: {
+			"stat": fileStat(os.path.join(self.bookDir, outputName)),
+			"source": sourceName,
+			"job": dict(job, source = self.sourceHash(sourceName)),
+		}}
+		self.index["hashes"] = {name: known for name, known in self.index["hashes"].items() if name == sourceName}
+		os.makedirs(self.cacheDir, exist_ok = True)
+		for fileName in os.listdir(self.cacheDir):
+			if fileName != indexName and fileName not in self.usedPages:
+				os.remove(os.path.join(self.cacheDir, fileName))
+		self.save()
+
+	def save(self):
+		indexFile = os.path.join(self.cacheDir, indexName)
+		with open(indexFile + ".tmp", "w") as fp:
+			json.dump(self.index, fp)
+		os.replace(indexFile + ".tmp", indexFile)
+
+	# a stitched page depends on the two pages that went into it and everything that changes how they're put together
+	def stitchKey(self, *parts):
+		return hashlib.sha256(json.dumps(parts).encode()).hexdigest()
+
+	# returns the encoded stitched page saved under key, or None if there isn't one
+	def getPage(self, key):
+		pageFile = os.path.join(self.cacheDir, key)
+		if not os.path.isfile(pageFile):
+			return None
+		self.usedPages.add(key)
+		with open(pageFile, "rb") as fp:
+			return fp.read()
+
+	def putPage(self, key, data):
+		os.makedirs(self.cacheDir, exist_ok = True)
+		with open(os.path.join(self.cacheDir, key), "wb") as fp:
+			fp.write(data)
+		self.usedPages.add(key)
@@ -0,0 +1,98 @@
+#	Comic Spread Stitch - for making digital comic books easier to read
+#	Copyright (C) 2024 Reed Mauzy
+#
+#	This program is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Keeps track of which lines of a run are finished, so that a run that was stopped part way through can carry on where it left off
+# Each line is added to the journal as a line of JSON and flushed to the disk as soon as its book is done
+# The first line of the journal is the options the run was started with, and a journal from a run with different options isn't resumed
+# The journal is deleted once every line of the run is finished
+# comicSpreadStitch.py only keeps a journal when it's run with -R, so a run has to have been started with -R for it to be resumed
+
+import json
+import os
+import threading
+import logging
+
+journalName = "pagesToProcess.journal"
+# lines that were processed or skipped are finished, while lines that had an error are tried again
+finishedStatuses = [0, 1]
+logger = logging.getLogger(__name__)
+
+class RunJournal:
+	# options is anything that changes what processing a line does, and has to be the same as the journal's for it to be resumed
+	def __init__(self, path = journalName, options = None, resume = False):
+		self.path = path
+		self.options = options
+		self.finished = self.load() if resume else set()
+		# books being processed at the same time can finish at the same time
+		self.lock = threading.Lock()
+		if self.finished:
+			self.fp = open(path, "a")
+			# a record cut short by the run being stopped would swallow the next one, so it's ended first
+			if not self.endsWithNewline():
+				self.fp.write("\n")
+		else:
+			self.fp = open(path, "w")
+			self.append({"options": options})
+
+	# the lines a journal from a run with the same options says are finished
+	def load(self):
+		if not os.path.isfile(self.path):
+			return set()
+		finished = set()
+		with open(self.path, "r") as fp:
+			try:
+				header = json.loads(fp.readline())
+			except ValueError:
+				header = None
+			if not header or header.get("options") != self.options:
+				logger.warning(f"{self.path} is from a run with different options, so it's being started over")
+				return set()
+			for record in fp:
+				try:
+					entry = json.loads(record)
+				except ValueError:
+					# the last record is cut short if the run was stopped while writing it
+					continue
+				if entry["status"] in finishedStatuses:
+					finished.add(entry["line"])
+		return finished
+
+	def endsWithNewline(self):
+		with open(self.path, "rb") as fp:
+			fp.seek(-1, os.SEEK_END)
+			return fp.read(1) == b"\n"
+
+	def isFinished(self, line):
+		return line.strip() in self.finished
+
+	def record(self, line, status):
+		with self.lock:
+			self.append({"line": line.strip(), "status": status})
+			if status in finishedStatuses:
+				self.finished.add(line.strip())
+
+	def append(self, entry):
+		self.fp.write(json.dumps(entry) + "\n")
+		self.fp.flush()
+		os.fsync(self.fp.fileno())
+
+	def close(self):
+		self.fp.close()
+
+	# the run got through every line, so there's nothing left to resume
+	def finish(self):
+		self.close()
+		os.remove(self.path)
@@ -0,0 +1,201 @@
+#	Comic Spread Stitch - for making digital comic books easier to read
+#	Copyright (C) 2024 Reed Mauzy
+#
+#	This program is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+# Guesses which pages of a book are halves of a spread, so that page lists don't have to be worked out by hand
+# Every page is decoded as a small thumbnail, and only the columns at its edges are kept
+# The halves of a spread carry on from each other where they meet, while a page next to an unrelated page doesn't,
+# and pages with a plain margin down the edge are never taken for halves of a spread
+# The page lists still need checking, since a page whose art runs off the edge can look like half of a spread
+
+import comicSpreadStitch
+import epubToCbz
+import cv2
+import numpy as np
+from zipfile import ZipFile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import argparse
+import os
+import posixpath
+import traceback
+import logging
+
+# every page is scaled to this many rows, so pages of different sizes can be compared and every comparison costs the same
+thumbHeight = 128
+# how far the edges are moved against each other to see how different two unrelated edges are
+shiftRows = thumbHeight // 4
+# how much an edge has to vary to be art running off the page rather than a margin
+minContrast = 8.0
+# 1 is a perfect join and 0 is no better than two unrelated edges
+minScore = 0.6
+# the page modifiers for a spread and a single page that are turned each way
+rotateModifiers = {"left": ("m", "l"), "right": ("s", "r")}
+logger = logging.getLogger(__name__)
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument("books", nargs = "*", help = "book directories or CBZ or ePub files to look for spreads in")
+	parser.add_argument("-i", "--input", help = "file of lines in the format of pagesToProcess.txt, such as one written by libraryScan.py; lines with no pages have them filled in")
+	parser.add_argument("--manga", action = "store_true", help = "the books given on the command line are read right-to-left")
+	parser.add_argument("-r", "--rotate", choices = list(rotateModifiers), help = "turn landscape spreads and pages this way so they fit a portrait screen")
+	parser.add_argument("-s", "--min-score", type = float, default = minScore, help = "how well the edges of two pages have to join for them to be taken for a spread, from 0 to 1")
+	parser.add_argument("-j", "--jobs", type = int, default = 1, help = "number of books to look at at the same time")
+	parser.add_argument("--output", help = "file to append the lines to instead of printing them, such as pagesToProcess.txt")
+	args = parser.parse_args()
+
+	lines = [bookLine(book, args.manga) for book in args.books]
+	if args.input:
+		with open(args.input, "r") as fp:
+			lines += [line.rstrip("\n") for line in fp if line.strip()]
+
+	results = []
+	for status, result in detectBooks(lines, args.rotate, args.min_score, args.jobs):
+		if status == 2:
+			print(result)
+		else:
+			results.append(result)
+	if args.output:
+		with open(args.output, "a") as fp:
+			fp.writelines(line + "\n" for line in results)
+		print(f"{len(results)} lines written to {args.output}")
+	else:
+		for line in results:
+			print(line)
+
+# a line for a book given on the command line, with no pages yet
+def bookLine(book, manga = False):
+	flags = ["manga"] if manga else []
+	if os.path.isfile(book):
+		if os.path.splitext(book)[1].lower() == ".epub":
+			flags.append("epub")
+		book = os.path.dirname(os.path.abspath(book))
+	return "|".join([book, ""] + flags)
+
+# proposes a page list for each line with detectLine, giving back its (status, line) in the order the lines came in
+# books are only read here, so with more than one job, lines for the same directory can be looked at by different workers at once
+def detectBooks(lines, rotate = None, minScore = minScore, jobs = 1):
+	if jobs <= 1:
+		yield from map(detectLine, lines, repeat(rotate), repeat(minScore))
+	else:
+		with ProcessPoolExecutor(max_workers = jobs) as executor:
+			yield from executor.map(detectLine, lines, repeat(rotate), repeat(minScore))
+
+# fills in the page list of a line that doesn't have one, returning (status, line)
+# lines that already have pages, PDFs, and lines that can't be read are given back as they are with a status of 1,
+# and a line that causes an error is given back with the traceback instead and a status of 2
+def detectLine(line, rotate = None, minScore = minScore):
+	parts = line.split("|")
+	bookDir = parts[0]
+	try:
+		manga, backedup, epub, pdf, rightlines, unknownFlag = comicSpreadStitch.getBookFlags(parts[2:])
+		if (len(parts) >= 2 and parts[1].strip()) or pdf or unknownFlag or not os.path.isdir(bookDir):
+			return 1, line
+		validBookFile, bookFileName = comicSpreadStitch.findBookFile(backedup, epub, pdf, bookDir)
+		if not validBookFile:
+			return 1, line
+		pageList = proposePageList(detectSpreads(os.path.join(bookDir, bookFileName), manga, minScore), rotate)
+		logger.info(f"Proposed {pageList!r} for {bookDir}")
+		return 0, "|".join([bookDir, pageList] + parts[2:])
+	except Exception:
+		return 2, f"Error occurred while looking for spreads in {bookDir}.\n{traceback.format_exc()}"
+
+# returns the aspect ratio of every page and the pages that look like the first half of a spread,
+# as (page number, score) with page numbers counted from 1 the same way they are in page lists
+# in manga the first half of a spread is on the right, so it's the left edge of the page that has to join the next page
+def detectSpreads(bookFile, manga = False, minScore = minScore):
+	with ZipFile(bookFile, "r") as zipf:
+		imgList = getBookImgs(zipf, os.path.splitext(bookFile)[1].lower() == ".epub")
+		thumbs = [decodeThumbnail(zipf.read(img)) for img in imgList]
+	aspects = np.array([thumb[0] if thumb else 0.0 for thumb in thumbs])
+	if len(thumbs) < 2:
+		return aspects, []
+
+	# every page's edges in one array, so that every pair of pages is scored at once
+	blank = np.zeros((thumbHeight, 3), np.float32)
+	leftEdges = np.stack([thumb[1] if thumb else blank for thumb in thumbs])
+	rightEdges = np.stack([thumb[2] if thumb else blank for thumb in thumbs])
+	if manga:
+		scores = scoreJoins(rightEdges[1:], leftEdges[:-1])
+	else:
+		scores = scoreJoins(rightEdges[:-1], leftEdges[1:])
+	readable = np.array([thumb is not None for thumb in thumbs])
+	scores[~(readable[:-1] & readable[1:])] = 0.0
+	return aspects, pickSpreads(scores, minScore)
+
+# the pages of a CBZ in the order comicSpreadStitch numbers them, or the pages of an ePub in spine order
+def getBookImgs(zipf, epub = False):
+	if not epub:
+		return comicSpreadStitch.getZipImgs(zipf)
+	docDir, opfFile = epubToCbz.findOpfInZip(zipf)
+	if not opfFile:
+		raise ValueError(docDir)
+	manifest, spine = epubToCbz.getManifestAndSpine(posixpath.join(docDir, opfFile), zipf)
+	return [posixpath.join(docDir, img) for img in epubToCbz.getImageFilenames(manifest, spine, docDir, zipf)]
+
+# returns the width over the height of the page, and its leftmost and rightmost columns scaled to thumbHeight rows as float32
+# JPEG pages are decoded at an eighth of their size, which skips most of the work of decoding them
+# returns None if the page can't be decoded
+def decodeThumbnail(data):
+	img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_REDUCED_COLOR_8)
+	if img is None or img.shape[0] == 0 or img.shape[1] < 2:
+		return None
+	aspect = img.shape[1] / img.shape[0]
+	edges = cv2.resize(img[:, [0, -1]], (2, thumbHeight), interpolation = cv2.INTER_AREA).astype(np.float32)
+	return aspect, edges[:, 0], edges[:, 1]
+
+# scores how well each edge in leftEdges carries on into the edge at the same place in rightEdges
+# the difference across the join is compared to the difference between the same edges moved shiftRows rows against each other,
+# which is roughly how different two edges that have nothing to do with each other are
+# edges too plain to tell anything from score 0
+def scoreJoins(leftEdges, rightEdges):
+	joinDiff = np.abs(leftEdges - rightEdges).mean(axis = (1, 2))
+	shiftedDiff = np.abs(leftEdges - np.roll(rightEdges, shiftRows, axis = 1)).mean(axis = (1, 2))
+	scores = 1.0 - joinDiff / np.maximum(shiftedDiff, 1e-6)
+	contrast = np.minimum(leftEdges.std(axis = 1).mean(axis = 1), rightEdges.std(axis = 1).mean(axis = 1))
+	scores[contrast < minContrast] = 0.0
+	return np.clip(scores, 0.0, 1.0)
+
+# returns the best joins as (page number, score), leaving out any that would share a page with a better one
+def pickSpreads(scores, minScore = minScore):
+	taken = set()
+	spreads = []
+	for index in np.argsort(-scores, kind = "stable"):
+		if scores[index] < minScore:
+			break
+		if index in taken or index + 1 in taken:
+			continue
+		taken.update([index, index + 1])
+		spreads.append((int(index) + 1, float(scores[index])))
+	return sorted(spreads)
+
+# turns detectSpreads' output into a page list, such as "3, 7m, 12l"
+# with rotate, spreads and single pages that are wider than they are tall, in a book whose pages mostly aren't, are turned that way
+def proposePageList(detected, rotate = None):
+	aspects, spreads = detected
+	spreadModifier, pageModifier = rotateModifiers[rotate] if rotate else ("", "")
+	portraitBook = aspects.size > 0 and np.median(aspects) < 1
+	pageList = []
+	spreadPages = set()
+	for pageNum, score in spreads:
+		spreadPages.update([pageNum, pageNum + 1])
+		landscape = aspects[pageNum - 1] + aspects[pageNum] > 1
+		pageList.append([pageNum, spreadModifier if portraitBook and landscape else ""])
+	if pageModifier and portraitBook:
+		pageList += [[pageNum, pageModifier] for pageNum in range(1, aspects.size + 1) if aspects[pageNum - 1] > 1 and pageNum not in spreadPages]
+	return ", ".join(f"{pageNum}{modifier}" for pageNum, modifier in sorted(pageList))
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,105 @@
+#	Comic Spread Stitch - for making digital comic books easier to read
+#	Copyright (C) 2024 Reed Mauzy
+#
+#	This program is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import unittest
+import atomicFile
+import os
+import tempfile
+
+class TestAtomicFile(unittest.TestCase):
+	def setUp(self):
+		self.tempDir = tempfile.TemporaryDirectory()
+		self.bookDir = self.tempDir.name
+		self.book = self.path("Book.cbz")
+		self.writeFile("Book.cbz", b"old")
+
+	def tearDown(self):
+		self.tempDir.cleanup()
+
+	def path(self, name):
+		return os.path.join(self.bookDir, name)
+
+	def writeFile(self, name, data):
+		with open(self.path(name), "wb") as fp:
+			fp.write(data)
+
+	def readFile(self, name):
+		with open(self.path(name), "rb") as fp:
+			return fp.read()
+
+	# The old book becomes the backup and the new one takes its name
+	def test_replaceBook_sanity(self):
+		with atomicFile.tempFile(self.book) as newBook:
+			with open(newBook, "wb") as fp:
+				fp.write(b"new")
+			atomicFile.replaceBook(self.book, newBook)
+
+		self.assertEqual(self.readFile("Book.cbz"), b"new")
+		self.assertEqual(self.readFile("Book.cbz_old"), b"old")
+		self.assertEqual(sorted(os.listdir(self.bookDir)), ["Book.cbz", "Book.cbz_old"], "Temporary file was left behind")
+
+	# An existing backup is left alone
+	def test_replaceBook_backedup(self):
+		self.writeFile("Book.cbz_old", b"original")
+		self.writeFile("Book.cbz.tmp", b"new")
+		atomicFile.replaceBook(self.book, self.book + ".tmp", True)
+
+		self.assertEqual(self.readFile("Book.cbz"), b"new")
+		self.assertEqual(self.readFile("Book.cbz_old"), b"original")
+
+	# If the new book can't be put in place, the old book is left as it was with no backup
+	def test_replaceBook_failed(self):
+		with self.assertRaises(FileNotFoundError):
+			atomicFile.replaceBook(self.book, self.book + ".tmp")
+
+		self.assertEqual(os.listdir(self.bookDir), ["Book.cbz"])
+
+	# A temporary file is deleted if writing it fails
+	def test_tempFile_error(self):
+		with self.assertRaises(ValueError):
+			with atomicFile.tempFile(self.book) as newBook:
+				with open(newBook, "wb") as fp:
+					fp.write(b"half")
+				raise ValueError()
+
+		self.assertEqual(os.listdir(self.bookDir), ["Book.cbz"])
+
+	# A run stopped after the backup was made but before the new book took its place leaves the book as it was
+	def test_recoverBookDir_linkedBackup(self):
+		os.link(self.book, self.book + "_old")
+		self.writeFile("Book.cbz.tmp", b"half")
+
+		self.assertEqual(len(atomicFile.recoverBookDir(self.bookDir)), 2)
+		self.assertEqual(os.listdir(self.bookDir), ["Book.cbz"])
+
+	# A run stopped after the old book was renamed puts it back
+	def test_recoverBookDir_renamedBackup(self):
+		os.rename(self.book, self.book + "_old")
+		atomicFile.recoverBookDir(self.bookDir)
+
+		self.assertEqual(os.listdir(self.bookDir), ["Book.cbz"])
+		self.assertEqual(self.readFile("Book.cbz"), b"old")
+
+	# A finished run's backup and files that aren't books are left alone
+	def test_recoverBookDir_nothingToDo(self):
+		self.writeFile("Book.cbz_old", b"original")
+		self.writeFile("notes.txt.tmp", b"notes")
+
+		self.assertEqual(atomicFile.recoverBookDir(self.bookDir), [])
+		self.assertEqual(sorted(os.listdir(self.bookDir)), ["Book.cbz", "Book.cbz_old", "notes.txt.tmp"])
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,52 @@
+#	Comic Spread Stitch - for making digital comic books easier to read
+#	Copyright (C) 2024 Reed Mauzy
+#
+#	This program is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import unittest
+import benchmark
+import fakeBooks
+import comicSpreadStitch
+import posixpath
+import tempfile
+from zipfile import ZipFile
+
+class TestMakeBooks(unittest.TestCase):
+	# made-up spreads overlap by the number of columns asked for
+	def test_makeSpread_overlap(self):
+		left, right = fakeBooks.makeSpread(200, 100, 10, 0)
+		self.assertEqual(comicSpreadStitch.findOverlap(left, right, 50, 1), 10, "Spread should overlap by 10 columns")
+	
+	# made-up ePub can be read the same way a real one is
+	def test_makeEpub_sanity(self):
+		with tempfile.TemporaryDirectory() as bookDir:
+			book = benchmark.makeEpub(bookDir, 5, 40, 60, ".png", 10)
+			with ZipFile(book, "r") as epub:
+				docDir, opfFile = benchmark.epubToCbz.findOpfInZip(epub)
+				manifest, spine = benchmark.epubToCbz.getManifestAndSpine(posixpath.join(docDir, opfFile), epub)
+				imgs = benchmark.epubToCbz.getImageFilenames(manifest, spine, docDir, epub)
+			self.assertEqual(imgs, [f"images/page{i}.png" for i in range(5)], "Image list is not what was expected")
+	
+
+class TestRunBenchmark(unittest.TestCase):
+	# every benchmark runs on a tiny book and reports its times
+	def test_runBenchmark_all(self):
+		for name in benchmark.benchmarks:
+			result = benchmark.runBenchmark(name, pages = 8, width = 60, height = 80, repeat = 2)
+			self.assertEqual(result["benchmark"], name, "Result should name its benchmark")
+			self.assertEqual(len(result["times"]), 2, f"{name} should have been timed twice")
+			self.assertLessEqual(result["min"], result["median"], f"{name} minimum should not be more than the median")
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,107 @@
+#	Comic Spread Stitch - for making digital comic books easier to read
+#	Copyright (C) 2024 Reed Mauzy
+#
+#	This program is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import unittest
+import bookBackup
+import comicSpreadStitch
+import os
+import shutil
+import tempfile
+from zipfile import ZipFile
+
+class TestBookBackup(unittest.TestCase):
+	def setUp(self):
+		self.tempDir = tempfile.TemporaryDirectory()
+		self.bookDir = self.tempDir.name
+		self.book = os.path.join(self.bookDir, "Test.cbz")
+		shutil.copy(os.path.join(os.path.dirname(__file__), "test-resources", "cbz", "Test.cbz"), self.book)
+		self.original = self.readFile(self.book)
+
+	def tearDown(self):
+		self.tempDir.cleanup()
+
+	def readFile(self, path):
+		with open(path, "rb") as fp:
+			return fp.read()
+
+	def process(self, line):
+		result, reason = comicSpreadStitch.processBook(f"{self.bookDir}|{line}", backupMode = "delta")
+		self.assertEqual(result, 0, reason)
+
+	# A delta only keeps the changed pages, and the original is rebuilt from it byte for byte
+	def test_delta_restore(self):
+		self.process("2r")
+
+		self.assertEqual(sorted(os.listdir(self.bookDir)), ["Test.cbz", "Test.cbz_delta", "run.log"])
+		self.assertLess(os.path.getsize(self.book + "_delta"), len(self.original) / 2, "Delta should be much smaller than the book")
+		self.assertEqual(bookBackup.restoreBook(self.book), (0, "Test.cbz restored."))
+		self.assertEqual(self.readFile(self.book), self.original)
+		self.assertFalse(os.path.exists(self.book + "_delta"), "Delta should be gone once it's restored")
+
+	# Processing a book with a delta again remakes the delta against the new book
+	def test_delta_processedAgain(self):
+		self.process("1")
+		self.process("1r|backedup")
+
+		self.assertFalse(os.path.exists(self.book + "_old"), "Full backup should only be kept until the new book is in place")
+		bookBackup.restoreBook(self.book)
+		self.assertEqual(self.readFile(self.book), self.original)
+
+	# A delta doesn't restore onto a book that has been changed since
+	def test_restoreBook_bookChanged(self):
+		self.process("2r")
+		with ZipFile(self.book, "w") as zipf:
+			zipf.writestr("0.png", b"other")
+		changed = self.readFile(self.book)
+
+		self.assertEqual(bookBackup.restoreBook(self.book)[0], 2)
+		self.assertEqual(self.readFile(self.book), changed, "Book should have been left alone")
+		self.assertTrue(os.path.exists(self.book + "_delta"), "Delta should have been kept")
+
+	# A full backup is put back in place of the book
+	def test_restoreBook_full(self):
+		comicSpreadStitch.processBook(f"{self.bookDir}|2r")
+		bookBackup.restoreBook(self.book)
+
+		self.assertEqual(self.readFile(self.book), self.original)
+		self.assertEqual(bookBackup.restoreBook(self.book)[0], 1, "There should be no backup left")
+
+	# PDFs always get a full backup
+	def test_replaceBook_pdf(self):
+		pdf = os.path.join(self.bookDir, "Test.pdf")
+		for path, data in [(pdf, b"old"), (pdf + ".tmp", b"new")]:
+			with open(path, "wb") as fp:
+				fp.write(data)
+		bookBackup.replaceBook(pdf, pdf + ".tmp", mode = "delta")
+
+		self.assertEqual(self.readFile(pdf + "_old"), b"old")
+
+	# A delta made for a book that never took the original's place is thrown away, and so is one next to a full backup
+	def test_recoverBookDir(self):
+		shutil.copy(self.book, self.book + ".tmp")
+		bookBackup.writeDelta(self.book, self.book + ".tmp", self.book + "_delta")
+		os.remove(self.book + ".tmp")
+
+		self.assertEqual(len(bookBackup.recoverBookDir(self.bookDir)), 1)
+		self.assertEqual(os.listdir(self.bookDir), ["Test.cbz"])
+
+		self.process("2r")
+		shutil.copy(self.book, self.book + "_old")
+		bookBackup.recoverBookDir(self.bookDir)
+		self.assertEqual(sorted(os.listdir(self.bookDir)), ["Test.cbz", "Test.cbz_old", "run.log"])
+
+if __name__ == "__main__":
+	unittest.main()
@@ -16,11 +16,21 @@
 
 import unittest
 import comicSpreadStitch
+import runJournal
+import bookProgress
+import losslessJpeg
+import fakeBooks
+import metrics
+import json
 import os
 import io
 import sys
+import subprocess
 import numpy as np
 import cv2
+import shutil
+import tempfile
+from zipfile import ZipFile
 
 class TestGetResultString(unittest.TestCase):
 	# Back cover only
@@ -516,6 +526,410 @@ class TestStitchPages(unittest.TestCase):
 		combImg = comicSpreadStitch.stitchPages(left, right, 50, 75)
 		
 		self.assertTrue(combImg.shape == baboon.shape and not(np.bitwise_xor(combImg, baboon).any()), "Output image is incorrect")
+	
+	# Overlap found in a greyscale image
+	def test_findOverlap_greyscale(self):
+		left = np.arange(40, dtype = np.uint8).reshape(4, 10)
+		right = np.hstack([left[:, 6:7], np.zeros((4, 5), dtype = np.uint8)])
+		
+		self.assertEqual(comicSpreadStitch.findOverlap(left, right, 5, 1), 4, "Overlap should be 4 columns from the right edge")
+	
+	# No overlap within the columns checked
+	def test_findOverlap_outsideColumns(self):
+		left = np.arange(40, dtype = np.uint8).reshape(4, 10)
+		right = np.hstack([left[:, 2:3], np.zeros((4, 5), dtype = np.uint8)])
+		
+		self.assertEqual(comicSpreadStitch.findOverlap(left, right, 5, 1), 0, "Column outside the checked range should not count as overlap")
+	
+	# Column that only stops matching in a later block of rows should not be picked
+	def test_findOverlap_laterBlockMismatch(self):
+		left = np.zeros((6, 8, 3), dtype = np.uint8)
+		left[5, 7] = 200
+		right = np.zeros((6, 4, 3), dtype = np.uint8)
+		
+		self.assertEqual(comicSpreadStitch.findOverlap(left, right, 4, 75, blockRows = 2), 2, "Closest matching column to the right edge should be picked")
+
+	# Wide windows are searched on scaled down pages, and still find the exact overlap after JPEG compression
+	def test_findOverlap_wideWindow(self):
+		left, right = fakeBooks.makeSpread(600, 400, 150, 1)
+		left = cv2.imdecode(cv2.imencode(".jpg", left)[1], cv2.IMREAD_COLOR)
+		right = cv2.imdecode(cv2.imencode(".jpg", right)[1], cv2.IMREAD_COLOR)
+
+		self.assertEqual(comicSpreadStitch.findOverlap(left, right, 400, 75), 150, "Overlap should be 150 columns from the right edge")
+		self.assertEqual(comicSpreadStitch.findOverlap(left, right, 100, 75), 0, "Overlap wider than the window should not be found")
+
+	# A stray pixel doesn't spoil a match in a wide window
+	def test_findOverlap_wideWindowStrayPixel(self):
+		left, right = fakeBooks.makeSpread(600, 400, 70, 2)
+		right[200, 0] = 255 - right[200, 0]
+
+		self.assertEqual(comicSpreadStitch.findOverlap(left, right, 100, 75), 70, "Overlap should be 70 columns from the right edge")
+
+	# Greyscale pages with nothing in common don't overlap
+	def test_findOverlap_wideWindowNoOverlap(self):
+		left = cv2.cvtColor(fakeBooks.makePage(300, 400, 3), cv2.COLOR_BGR2GRAY)
+		right = cv2.cvtColor(fakeBooks.makePage(300, 400, 4), cv2.COLOR_BGR2GRAY)
+
+		self.assertEqual(comicSpreadStitch.findOverlap(left, right, 200, 75), 0, "Unrelated pages should not overlap")
+
+	# Plain margins that match at every overlap only lose a column, the same as with a narrow window
+	def test_findOverlap_wideWindowBlankMargins(self):
+		rng = np.random.default_rng(1)
+		left = np.full((400, 600, 3), 255, np.uint8)
+		right = left.copy()
+		left[:, :500] = rng.integers(0, 255, (400, 500, 3))
+		right[:, 100:] = rng.integers(0, 255, (400, 500, 3))
+
+		for columns in [64, 200, 400]:
+			self.assertEqual(comicSpreadStitch.findOverlap(left, right, columns, 75), 1, f"Margins should only overlap by a column with a {columns} column window")
+
+
+class TestStitchPagesLowMemory(unittest.TestCase):
+	def setUp(self):
+		self.left, self.right = fakeBooks.makeSpread(300, 200, 20, 1)
+	
+	def stitchBoth(self, ext, manga, rotate):
+		pages = {"a" + ext: cv2.imencode(ext, self.right if manga else self.left)[1].tobytes(), "b" + ext: cv2.imencode(ext, self.left if manga else self.right)[1].tobytes()}
+		results = []
+		for lowMemory in [False, True]:
+			pageStore = comicSpreadStitch.ZipPages(None)
+			for name, data in pages.items():
+				pageStore.writeBytes(name, data)
+			comicSpreadStitch.processPages(["a" + ext, "b" + ext], [[1, rotate]], manga, 50, 75, pageStore, lowMemory = lowMemory)
+			results.append(comicSpreadStitch.decodePage(pageStore.readBytes("a" + ext)))
+		return results
+	
+	# Stitching into one buffer gives exactly the same page as stitching the usual way, however the page is turned
+	def test_stitchPagesLowMemory_sameResult(self):
+		for ext in [".png", ".jpg"]:
+			for manga in [False, True]:
+				for rotate in ["", "m", "s"]:
+					with self.subTest(ext = ext, manga = manga, rotate = rotate):
+						usual, lowMemory = self.stitchBoth(ext, manga, rotate)
+						self.assertEqual(usual.shape, lowMemory.shape, "Stitched page is the wrong size")
+						self.assertFalse(np.bitwise_xor(usual, lowMemory).any(), "Stitched page is different")
+	
+	# The most memory held is the stitched page and one of its halves
+	def test_stitchPagesLowMemory_memory(self):
+		pageStore = comicSpreadStitch.ZipPages(None)
+		pageStore.writeBytes("a.png", cv2.imencode(".png", self.left)[1].tobytes())
+		pageStore.writeBytes("b.png", cv2.imencode(".png", self.right)[1].tobytes())
+		with metrics.measureBook("book|1") as book:
+			stitched = comicSpreadStitch.stitchPagesLowMemory(pageStore, "a.png", "b.png", 50, 75, "s")
+		
+		self.assertEqual(stitched.shape, (580, 200, 3), "Stitched page is the wrong size")
+		self.assertEqual(book.stitchMemory, 600 * 200 * 3 + 300 * 200 * 3, "Memory held is incorrect")
+	
+	# Pages whose size can't be read from their header are left to be stitched the usual way
+	def test_stitchPagesLowMemory_unknownSize(self):
+		pageStore = comicSpreadStitch.ZipPages(None)
+		pageStore.writeBytes("a.bmp", cv2.imencode(".bmp", self.left)[1].tobytes())
+		pageStore.writeBytes("b.bmp", cv2.imencode(".bmp", self.right)[1].tobytes())
+		
+		self.assertIsNone(comicSpreadStitch.stitchPagesLowMemory(pageStore, "a.bmp", "b.bmp", 50, 75))
+	
+	# Sizes are read from PNG and JPEG headers, taking the EXIF orientation into account
+	def test_getImageSize(self):
+		jpeg = cv2.imencode(".jpg", self.left)[1].tobytes()
+		
+		self.assertEqual(comicSpreadStitch.getImageSize(cv2.imencode(".png", self.left)[1].tobytes()), (300, 200))
+		self.assertEqual(comicSpreadStitch.getImageSize(jpeg), (300, 200))
+		self.assertEqual(comicSpreadStitch.getImageSize(losslessJpeg.rotateExif(jpeg, True)), (200, 300))
+		self.assertIsNone(comicSpreadStitch.getImageSize(b"not an image"))
+
+
+class TestProcessBook(unittest.TestCase):
+	def setUp(self):
+		self.tempDir = tempfile.TemporaryDirectory()
+		self.bookDirs = []
+		for name in ["first", "second"]:
+			bookDir = os.path.join(self.tempDir.name, name)
+			os.mkdir(bookDir)
+			shutil.copy(os.path.join(os.path.dirname(__file__), "test-resources", "cbz", "Test.cbz"), bookDir)
+			self.bookDirs.append(bookDir)
+		self.cwd = os.getcwd()
+	
+	def tearDown(self):
+		os.chdir(self.cwd)
+		self.tempDir.cleanup()
+	
+	# Stitch one spread without changing the working directory
+	def test_processBook_stitchNoChdir(self):
+		result, reason = comicSpreadStitch.processBook(f"{self.bookDirs[0]}|1")
+		
+		self.assertEqual(result, 0, reason)
+		self.assertEqual(os.getcwd(), self.cwd, "Working directory should not have changed")
+		self.assertTrue(os.path.isfile(os.path.join(self.bookDirs[0], "Test.cbz_old")), "Backup was not created")
+		self.assertTrue(os.path.isfile(os.path.join(self.bookDirs[0], "run.log")), "Log was not written to the book directory")
+		self.assertFalse(os.path.exists(os.path.join(self.bookDirs[0], "temp")), "temp directory was not deleted")
+		with ZipFile(os.path.join(self.bookDirs[0], "Test.cbz"), "r") as zipf:
+			self.assertEqual(len(zipf.namelist()), 5, "Stitched book should have one page fewer")
+	
+	# Pages that aren't touched are copied into the new archive unchanged
+	def test_processBook_untouchedPagesCopied(self):
+		with ZipFile(os.path.join(self.bookDirs[0], "Test.cbz"), "r") as zipf:
+			original = {name: zipf.read(name) for name in zipf.namelist()}
+		
+		result, reason = comicSpreadStitch.processBook(f"{self.bookDirs[0]}|2r")
+		
+		self.assertEqual(result, 0, reason)
+		self.assertEqual(os.listdir(self.bookDirs[0]).count("Test.cbz.tmp"), 0, "Temporary archive was left behind")
+		with ZipFile(os.path.join(self.bookDirs[0], "Test.cbz"), "r") as zipf:
+			self.assertEqual(zipf.namelist(), list(original.keys()), "Archive members should be unchanged")
+			for name in zipf.namelist():
+				if name == "baboonccw.png":
+					rotated = cv2.imdecode(np.frombuffer(zipf.read(name), np.uint8), cv2.IMREAD_COLOR)
+					expected = cv2.rotate(cv2.imdecode(np.frombuffer(original[name], np.uint8), cv2.IMREAD_COLOR), cv2.ROTATE_90_CLOCKWISE)
+					self.assertFalse(np.bitwise_xor(rotated, expected).any(), "Page 2 was not rotated")
+				else:
+					self.assertEqual(zipf.read(name), original[name], f"{name} should not have changed")
+	
+	# Changed pages are saved in the format asked for, encoded in a thread pool, and the rest are left as they were
+	def test_processBook_outputFormat(self):
+		with ZipFile(os.path.join(self.bookDirs[0], "Test.cbz"), "r") as zipf:
+			original = zipf.namelist()
+		
+		result, reason = comicSpreadStitch.processBook(f"{self.bookDirs[0]}|2r", encoding = {"imgFormat": ".webp", "quality": 80, "threads": 2})
+		
+		self.assertEqual(result, 0, reason)
+		with ZipFile(os.path.join(self.bookDirs[0], "Test.cbz"), "r") as zipf:
+			self.assertEqual(zipf.namelist(), [name.replace("baboonccw.png", "baboonccw.webp") for name in original], "Only the rotated page should have been renamed")
+			self.assertEqual(zipf.read("baboonccw.webp")[8:12], b"WEBP", "Rotated page should be a WebP")
+	
+	# A converted page keeps its name if a page with its new name is already in the archive
+	def test_processBook_outputFormatNameTaken(self):
+		with ZipFile(os.path.join(self.bookDirs[0], "Test.cbz"), "a") as zipf:
+			zipf.writestr("baboonccw.webp", zipf.read("baboonccw.png"))
+		with ZipFile(os.path.join(self.bookDirs[0], "Test.cbz"), "r") as zipf:
+			original = zipf.namelist()
+			taken = zipf.read("baboonccw.webp")
+		
+		result, reason = comicSpreadStitch.processBook(f"{self.bookDirs[0]}|2r", encoding = {"imgFormat": ".webp", "quality": 80, "threads": 2})
+		
+		self.assertEqual(result, 0, reason)
+		with ZipFile(os.path.join(self.bookDirs[0], "Test.cbz"), "r") as zipf:
+			self.assertEqual(zipf.namelist(), original, "No page should have been renamed")
+			self.assertEqual(zipf.read("baboonccw.png")[8:12], b"WEBP", "Rotated page should be a WebP")
+			self.assertEqual(zipf.read("baboonccw.webp"), taken, "Page that already had the new name should not have changed")
+	
+	# JPEG pages are re-encoded instead of being cropped losslessly when they're being converted to another format
+	def test_processBook_rightlinesOutputFormat(self):
+		with open(os.path.join(os.path.dirname(__file__), "test-resources", "img", "leftbaboon.jpg"), "rb") as fp:
+			jpeg = fp.read()
+		with ZipFile(os.path.join(self.bookDirs[1], "Test.cbz"), "a") as zipf:
+			zipf.writestr("zzz.jpg", jpeg)
+		
+		# stands in for jpegtran, which isn't always installed, so that the JPEG would be cropped losslessly if that were allowed
+		cropRight = losslessJpeg.cropRight
+		losslessJpeg.cropRight = lambda data, columns: data
+		try:
+			result, reason = comicSpreadStitch.processBook(f"{self.bookDirs[1]}||rightlines", encoding = {"imgFormat": ".webp", "quality": 80, "threads": 2})
+		finally:
+			losslessJpeg.cropRight = cropRight
+		
+		self.assertEqual(result, 0, reason)
+		with ZipFile(os.path.join(self.bookDirs[1], "Test.cbz"), "r") as zipf:
+			imgs = comicSpreadStitch.getZipImgs(zipf)
+			self.assertIn("zzz.webp", imgs, "JPEG page should have been converted")
+			for name in imgs:
+				self.assertEqual(zipf.read(name)[8:12], b"WEBP", f"{name} should be a WebP")
+	
+	# JPEG pages rotated by changing their EXIF orientation aren't re-encoded
+	def test_processBook_exifRotation(self):
+		with open(os.path.join(os.path.dirname(__file__), "test-resources", "img", "leftbaboon.jpg"), "rb") as fp:
+			jpeg = fp.read()
+		with ZipFile(os.path.join(self.bookDirs[1], "Test.cbz"), "a") as zipf:
+			zipf.writestr("zzz.jpg", jpeg)
+		
+		result, reason = comicSpreadStitch.processBook(f"{self.bookDirs[1]}|2r, 7l", rotation = "exif")
+		
+		self.assertEqual(result, 0, reason)
+		with ZipFile(os.path.join(self.bookDirs[1], "Test.cbz"), "r") as zipf:
+			rotated = zipf.read("zzz.jpg")
+			self.assertEqual(losslessJpeg.getOrientation(rotated), 8, "JPEG should have been rotated counterclockwise")
+			self.assertEqual(rotated[-1000:], jpeg[-1000:], "Image data of the JPEG should not have changed")
+	
+	# Only removing right lines
+	def test_processBook_rightlinesOnly(self):
+		result, reason = comicSpreadStitch.processBook(f"{self.bookDirs[0]}||rightlines")
+		
+		self.assertEqual(result, 0, reason)
+		with ZipFile(os.path.join(self.bookDirs[0], "Test.cbz_old"), "r") as oldZip, ZipFile(os.path.join(self.bookDirs[0], "Test.cbz"), "r") as newZip:
+			for name in oldZip.namelist():
+				oldPage = cv2.imdecode(np.frombuffer(oldZip.read(name), np.uint8), cv2.IMREAD_COLOR)
+				newPage = cv2.imdecode(np.frombuffer(newZip.read(name), np.uint8), cv2.IMREAD_COLOR)
+				self.assertEqual(newPage.shape[1], oldPage.shape[1] - 1, f"{name} should be one column narrower")
+	
+	# ePub pages are processed into a CBZ next to the ePub, which is left alone
+	def test_processBook_epub(self):
+		shutil.copy(os.path.join(os.path.dirname(__file__), "test-resources", "epub", "Test ePub.epub"), self.bookDirs[1])
+		os.remove(os.path.join(self.bookDirs[1], "Test.cbz"))
+		
+		result, reason = comicSpreadStitch.processBook(f"{self.bookDirs[1]}|1, 6d|epub")
+		
+		self.assertEqual(result, 0, reason)
+		self.assertEqual(sorted(os.listdir(self.bookDirs[1])), ["Test ePub.cbz", "Test ePub.epub", "run.log"], "Directory should only gain the CBZ and the log")
+		with ZipFile(os.path.join(self.bookDirs[1], "Test ePub.cbz"), "r") as cbz, ZipFile(os.path.join(os.path.dirname(__file__), "test-resources", "cbz-from-epub", "Test ePub.cbz"), "r") as expected:
+			self.assertIsNone(cbz.testzip(), "CBZ should not be corrupt")
+			self.assertEqual(cbz.namelist(), ["0.png", "1.png", "2.png", "3.png"], "CBZ should have 4 pages")
+			self.assertEqual(cbz.read("1.png"), expected.read("2.png"), "Untouched pages should be copied as they are")
+	
+	# Results come back in the same order as the lines when using more than one job
+	def test_processBooks_jobsKeepOrder(self):
+		lines = [f"{self.bookDirs[0]}|1", "", f"{self.bookDirs[1]}|2d"]
+		results = list(comicSpreadStitch.processBooks(lines, jobs = 2))
+		
+		self.assertEqual([result for result, reason in results], [0, 1, 0], "Results are not in input order")
+		self.assertEqual(results[1][1], "No book directory on this line. Check your input.", "Reason for empty line is incorrect")
+		self.assertEqual(results[2][1], "Test.cbz has had 1 pages deleted.", "Reason for second book is incorrect")
+		for bookDir in self.bookDirs:
+			self.assertTrue(os.path.isfile(os.path.join(bookDir, "run.log")), f"Log was not written to {bookDir}")
+	
+	# Lines for the same book directory are processed one after the other, the same as with one job
+	def test_processBooks_jobsSameBookDir(self):
+		lines = [f"{self.bookDirs[0]}|1", f"{self.bookDirs[1]}|2d", f"{self.bookDirs[0]}|3r"]
+		results = list(comicSpreadStitch.processBooks(lines, jobs = 2))
+		
+		self.assertEqual([result for result, reason in results], [0, 0, 1], "Second line for the same book should have been skipped")
+		self.assertIn("backup", results[2][1], "Second line should have been skipped because of the first line's backup")
+		self.assertEqual(sorted(os.listdir(self.bookDirs[0])), ["Test.cbz", "Test.cbz_old", "run.log"])
+	
+	# Every line is recorded in the journal, even when books are processed at the same time
+	def test_processBooks_journal(self):
+		lines = [f"{self.bookDirs[0]}|1", f"{self.bookDirs[1]}|2d", f"{self.bookDirs[1]}|9"]
+		journalFile = os.path.join(self.tempDir.name, runJournal.journalName)
+		for jobs in [1, 2]:
+			with self.subTest(jobs = jobs):
+				journal = runJournal.RunJournal(journalFile)
+				list(comicSpreadStitch.processBooks(lines, jobs = jobs, journal = journal))
+				journal.close()
+				
+				self.assertEqual(runJournal.RunJournal(journalFile, resume = True).finished, set(lines))
+	
+	# A book left with a backup by a run that was stopped before the new book was put in place is processed again once its directory is recovered
+	def test_processBook_interruptedRun(self):
+		book = os.path.join(self.bookDirs[0], "Test.cbz")
+		os.link(book, book + "_old")
+		with open(book + ".tmp", "wb") as fp:
+			fp.write(b"half")
+		line = f"{self.bookDirs[0]}|1"
+		
+		self.assertEqual(len(comicSpreadStitch.recoverBookDirs([line, line, "missing|1", "\n"])), 2, "Each directory should only have been recovered once")
+		result, reason = comicSpreadStitch.processBook(line)
+		
+		self.assertEqual(result, 0, reason)
+		self.assertFalse(os.path.exists(book + ".tmp"), "Unfinished book was left behind")
+		with ZipFile(book, "r") as zipf, ZipFile(book + "_old", "r") as oldZip:
+			self.assertEqual(len(zipf.namelist()), len(oldZip.namelist()) - 1, "Book should have been stitched from the original")
+	
+	# A directory that can't be recovered is reported without stopping the others from being recovered
+	def test_recoverBookDirs_error(self):
+		book = os.path.join(self.bookDirs[1], "Test.cbz")
+		with open(book + "_delta", "wb") as fp:
+			fp.write(b"not a delta")
+		os.link(os.path.join(self.bookDirs[0], "Test.cbz"), os.path.join(self.bookDirs[0], "Test.cbz_old"))
+		
+		recovered = comicSpreadStitch.recoverBookDirs([f"{self.bookDirs[1]}|1", f"{self.bookDirs[0]}|1"])
+		
+		self.assertEqual(len(recovered), 2)
+		self.assertTrue(recovered[0].startswith(f"Could not recover {self.bookDirs[1]}"), recovered[0])
+		self.assertFalse(os.path.exists(os.path.join(self.bookDirs[0], "Test.cbz_old")), "Second directory should still have been recovered")
+	
+	# Progress is reported for each page in the page list
+	def test_processBook_progress(self):
+		updates = []
+		result, reason = comicSpreadStitch.processBook(f"{self.bookDirs[0]}|1, 3r", progress = lambda done, total: updates.append((done, total)))
+		
+		self.assertEqual(result, 0, reason)
+		self.assertEqual(updates, [(0, 2), (1, 2), (2, 2)])
+	
+	# A book cancelled part way through is left as it was
+	def test_processBook_cancelled(self):
+		book = os.path.join(self.bookDirs[0], "Test.cbz")
+		with open(book, "rb") as fp:
+			original = fp.read()
+		def cancel(done, total):
+			if done == 1:
+				raise bookProgress.Cancelled()
+		
+		result, reason = comicSpreadStitch.processBook(f"{self.bookDirs[0]}|1, 3r", progress = cancel)
+		
+		self.assertEqual(result, 1, reason)
+		self.assertEqual(sorted(os.listdir(self.bookDirs[0])), ["Test.cbz", "run.log"], "Nothing but the log should have been written")
+		with open(book, "rb") as fp:
+			self.assertEqual(fp.read(), original, "Book should not have changed")
+	
+	# Books that only have their right lines removed or are only converted from ePub can be cancelled too
+	def test_processBook_cancelledWithoutPages(self):
+		shutil.copy(os.path.join(os.path.dirname(__file__), "test-resources", "epub", "Test ePub.epub"), self.bookDirs[1])
+		def cancel(done, total):
+			if done == 1:
+				raise bookProgress.Cancelled()
+		
+		for bookDir, flag, files in [(self.bookDirs[0], "rightlines", ["Test.cbz", "run.log"]), (self.bookDirs[1], "epub", ["Test ePub.epub", "Test.cbz", "run.log"])]:
+			with self.subTest(flag = flag):
+				result, reason = comicSpreadStitch.processBook(f"{bookDir}||{flag}", progress = cancel)
+				
+				self.assertEqual(result, 1, reason)
+				self.assertIn("cancelled", reason)
+				self.assertEqual(sorted(os.listdir(bookDir)), files, "Nothing but the log should have been written")
+	
+	# Running the same line again with the cache skips the book without touching it
+	def test_processBook_cacheSkipsSameJob(self):
+		line = f"{self.bookDirs[0]}|1"
+		result, reason = comicSpreadStitch.processBook(line, cache = True)
+		self.assertEqual(result, 0, reason)
+		with open(os.path.join(self.bookDirs[0], "Test.cbz"), "rb") as fp:
+			processed = fp.read()
+		
+		result, reason = comicSpreadStitch.processBook(line, cache = True)
+		
+		self.assertEqual(result, 1, "Book should have been skipped")
+		self.assertEqual(reason, "Test.cbz has already been processed with the same pages and options. Skipping.", "Reason is incorrect")
+		with open(os.path.join(self.bookDirs[0], "Test.cbz"), "rb") as fp:
+			self.assertEqual(fp.read(), processed, "Book should not have changed")
+	
+	# Changing the page list processes the book again from its backup, reusing the pages that were already stitched
+	def test_processBook_cacheReusesStitchedPages(self):
+		result, reason = comicSpreadStitch.processBook(f"{self.bookDirs[0]}|1", cache = True)
+		self.assertEqual(result, 0, reason)
+		with ZipFile(os.path.join(self.bookDirs[0], "Test.cbz"), "r") as zipf:
+			stitched = zipf.read(zipf.namelist()[0])
+		
+		result, reason = comicSpreadStitch.processBook(f"{self.bookDirs[0]}|1, 4d", cache = True)
+		
+		self.assertEqual(result, 0, reason)
+		with ZipFile(os.path.join(self.bookDirs[0], "Test.cbz"), "r") as zipf:
+			self.assertEqual(len(zipf.namelist()), 4, "Book should have been processed from its backup")
+			self.assertEqual(zipf.read(zipf.namelist()[0]), stitched, "Stitched page should have been reused")
+		with open(os.path.join(self.bookDirs[0], "run.log")) as fp:
+			self.assertIn("Reused stitched pages 1 and 2 from the cache", fp.read(), "Stitched page was not taken from the cache")
+		with ZipFile(os.path.join(self.bookDirs[0], "Test.cbz_old"), "r") as zipf:
+			self.assertEqual(len(zipf.namelist()), 6, "Backup should not have changed")
+	
+	# Timings of each book are written to the metrics file in input order
+	def test_processBooks_metrics(self):
+		metricsFile = os.path.join(self.tempDir.name, "metrics.jsonl")
+		summary = metrics.Summary(metricsFile)
+		lines = [f"{self.bookDirs[0]}|1", f"{self.bookDirs[1]}|2r"]
+		results = list(comicSpreadStitch.processBooks(lines, jobs = 2, summary = summary))
+		
+		self.assertEqual([result for result, reason in results], [0, 0], "Books were not processed")
+		with open(metricsFile) as fp:
+			records = [json.loads(line) for line in fp]
+		self.assertEqual([record["line"] for record in records], lines, "Metrics are not in input order")
+		self.assertIn("overlap", records[0]["stages"], "Overlap search was not timed")
+		self.assertIn("rotate", records[1]["stages"], "Rotation was not timed")
+		self.assertIn("copy", records[1]["stages"], "Copying untouched pages was not timed")
+		self.assertEqual(summary.books, 2, "Summary should count both books")
+		self.assertIn("read", summary.report(), "Report should list the read stage")
+
+class TestStartup(unittest.TestCase):
+	# OpenCV, NumPy, and pypdf are only loaded once a book needs them
+	def test_import_noHeavyModules(self):
+		loaded = subprocess.run([sys.executable, "-c", "import comicSpreadStitch, gui, jobQueue, sys; print(sorted(name for name in ['cv2', 'numpy', 'pypdf'] if name in sys.modules))"],
+								cwd = os.path.dirname(os.path.abspath(__file__)), capture_output = True, text = True, check = True).stdout.strip()
+		self.assertEqual(loaded, "[]", "Heavy modules were loaded at startup")
 
 if __name__ == "__main__":
 	unittest.main()
@@ -21,6 +21,7 @@ from zipfile import ZipFile
 import shutil
 import io
 import sys
+import posixpath
 
 # this function was written because filecmp.cmp() could get awfully picky about whether .zip files counted as equal
 # so this function checks only the name lists and the underlying files, which is all I really care about
@@ -52,6 +53,13 @@ class TestConvertEpubToCbz(unittest.TestCase):
 		self.assertEqual(reason, f"{self.bookFile} converted to CBZ.",
 						 f'Reason should be "{self.bookFile} converted to CBZ."')
 
+	# the images are copied straight out of the ePub, so the CBZ is the only thing written to the book directory
+	def test_convertEpubToCbz_noExtraction(self):
+		before = set(os.listdir(self.bookDir))
+		result, reason = epubToCbz.convertEpubToCbz(os.path.join(self.bookDir, self.bookFile))
+		self.assertEqual(result, 0, "Result should be 0")
+		self.assertEqual(set(os.listdir(self.bookDir)) - before, {f"{os.path.splitext(self.bookFile)[0]}.cbz"})
+
 	# book is not an ePub
 	def test_convertEpubToCbz_notEpub(self):
 		book = os.path.join(os.path.split(self.bookDir)[0], "cbz", "Test.cbz")
@@ -65,34 +73,6 @@ class TestConvertEpubToCbz(unittest.TestCase):
 			os.remove(f"{os.path.splitext(self.bookFile)[0]}.cbz")
 
 
-class TestGetDocDir(unittest.TestCase):
-	# no document directory
-	def test_getDocDir_noDocDir(self):
-		yesCBZOLD = os.path.join(os.path.dirname(__file__), "test-resources", "cbz-old")
-		os.chdir(yesCBZOLD)
-		self.assertFalse(epubToCbz.getDocDir(), "cbz-old should not contain a document directory.")
-	
-	# yes document directory
-	def test_getDocDir_yesDocDir(self):
-		extEpub = os.path.join(os.path.dirname(__file__), "test-resources", "extracted-epub")
-		os.chdir(extEpub)
-		self.assertEqual(epubToCbz.getDocDir(), "OEBPS", "extracted-epub should contain a document directory called OEBPS.")
-	
-
-class TestFindOpfFile(unittest.TestCase):
-	# no OPF file
-	def test_findOpfFile_noOpfFile(self):
-		imageDir = os.path.join(os.path.dirname(__file__), "test-resources", "extracted-epub", "OEBPS", "images")
-		os.chdir(imageDir)
-		self.assertFalse(epubToCbz.findOpfFile(), "images should not contain an OPF file.")
-	
-	# yes OPF file
-	def test_findOpfFile_yesOpfFile(self):
-		docDir = os.path.join(os.path.dirname(__file__), "test-resources", "extracted-epub", "OEBPS")
-		os.chdir(docDir)
-		self.assertEqual(epubToCbz.findOpfFile(), "content.opf", "OEBPS should contain an OPF file called content.opf.")
-	
-
 class TestGetManifestAndSpine(unittest.TestCase):
 	# basic sanity test
 	def test_getManifestAndSpine_sanity(self):
@@ -100,7 +80,8 @@ class TestGetManifestAndSpine(unittest.TestCase):
 		os.chdir(docDir)
 		opfFile = "content.opf"
 		manifest, spine = epubToCbz.getManifestAndSpine(opfFile)
-		expectedManifest = {'ncx': 'toc.ncx', 'css_styles': 'styles.css', 'coverstyle': 'coverstyle.css', 'xpgt_styles': 'styles.xpgt', 'cap01': 'baboon.xhtml', 'cap02': 'baboonccw.xhtml', 'cap03': 'babooncw.xhtml', 'cap04': 'boat.xhtml', 'cap05': 'boatccw.xhtml', 'cap06': 'boatcw.xhtml', 'p16': 'images/p16.jpg', 'p216': 'images/p216.jpg', 'p223': 'images/p223.jpg', 'p224': 'images/p224.jpg', 'p5': 'images/p5.jpg', 'id': 'images/baboon.png', 'id1': 'images/baboonccw.png', 'id2': 'images/babooncw.png', 'id3': 'images/boat.png', 'id4': 'images/boatccw.png', 'id5': 'images/boatcw.png', 'cover': 'OEBPS/cover.jpg'}
+		# the items that are commented out in the OPF file are left out
+		expectedManifest = {'ncx': 'toc.ncx', 'css_styles': 'styles.css', 'coverstyle': 'coverstyle.css', 'xpgt_styles': 'styles.xpgt', 'cap01': 'baboon.xhtml', 'cap02': 'baboonccw.xhtml', 'cap03': 'babooncw.xhtml', 'cap04': 'boat.xhtml', 'cap05': 'boatccw.xhtml', 'cap06': 'boatcw.xhtml', 'id': 'images/baboon.png', 'id1': 'images/baboonccw.png', 'id2': 'images/babooncw.png', 'id3': 'images/boat.png', 'id4': 'images/boatccw.png', 'id5': 'images/boatcw.png', 'cover': 'OEBPS/cover.jpg'}
 		expectedSpine = ['cap01', 'cap02', 'cap03', 'cap04', 'cap05', 'cap06']
 		self.assertEqual(manifest, expectedManifest, "Manifest is not what was expected")
 		self.assertEqual(spine, expectedSpine, "Spine is not what was expected")
@@ -117,6 +98,56 @@ class TestGetImageFilenames(unittest.TestCase):
 		expectedImgs = ['images/baboon.png', 'images/baboonccw.png', 'images/babooncw.png', 'images/boat.png', 'images/boatccw.png', 'images/boatcw.png']
 		self.assertEqual(imgs, expectedImgs, "Image list is not what was expected.")
 	
+	# reading straight out of the ePub gives the same images as reading it extracted
+	def test_getImageFilenames_fromZip(self):
+		book = os.path.join(os.path.dirname(__file__), "test-resources", "epub", "Test ePub.epub")
+		with ZipFile(book, "r") as epubZip:
+			docDir, opfFile = epubToCbz.findOpfInZip(epubZip)
+			manifest, spine = epubToCbz.getManifestAndSpine(posixpath.join(docDir, opfFile), epubZip)
+			imgs = epubToCbz.getImageFilenames(manifest, spine, docDir, epubZip)
+		self.assertEqual((docDir, opfFile), ("OEBPS", "content.opf"), "OPF file should be the one container.xml points to")
+		self.assertEqual(imgs, ['images/baboon.png', 'images/baboonccw.png', 'images/babooncw.png', 'images/boat.png', 'images/boatccw.png', 'images/boatcw.png'], "Image list is not what was expected.")
+	
+
+class TestReadFirstImage(unittest.TestCase):
+	# counts how many times it's read from
+	class CountingReader(io.BytesIO):
+		reads = 0
+		
+		def read(self, size = -1):
+			self.reads += 1
+			return super().read(size)
+	
+	def readFirstImage(self, body):
+		return epubToCbz.readFirstImage(io.BytesIO(f'<?xml version="1.0" encoding="utf-8"?>\n<html xmlns="http://www.w3.org/1999/xhtml" xmlns:xlink="http://www.w3.org/1999/xlink"><body>{body}</body></html>'.encode()))
+	
+	# an img tag split over several lines
+	def test_readFirstImage_multiLine(self):
+		self.assertEqual(self.readFirstImage('<div>\n<img\n alt="Page"\n src="images/p1.jpg"/>\n</div>'), "images/p1.jpg", "Image was not found")
+	
+	# only the first of several images on one line
+	def test_readFirstImage_sameLine(self):
+		self.assertEqual(self.readFirstImage('<img src="first.jpg"/><img src="second.jpg"/>'), "first.jpg", "First image was not returned")
+	
+	# an image inside an SVG, which is common in fixed-layout comics
+	def test_readFirstImage_svg(self):
+		self.assertEqual(self.readFirstImage('<svg xmlns="http://www.w3.org/2000/svg"><image width="10" height="10" xlink:href="../images/p1.jpg"/></svg>'), "../images/p1.jpg", "SVG image was not found")
+	
+	# no image at all
+	def test_readFirstImage_noImage(self):
+		self.assertIsNone(self.readFirstImage('<p>Text only</p>'), "No image should be found")
+	
+	# HTML entities that aren't defined in XML fall back to searching the text
+	def test_readFirstImage_htmlEntity(self):
+		self.assertEqual(self.readFirstImage('<p>&nbsp;</p><img src="a&amp;b.jpg"/>'), "a&b.jpg", "Image was not found in file that isn't valid XML")
+	
+	# reading stops once the first image has been found
+	def test_readFirstImage_stopsReading(self):
+		xhtml = self.CountingReader(b'<html><body><img src="p1.jpg"/>' + b"<p>filler</p>" * (epubToCbz.xmlReadSize // 4) + b"</body></html>")
+		
+		self.assertEqual(epubToCbz.readFirstImage(xhtml), "p1.jpg", "Image was not found")
+		self.assertEqual(xhtml.reads, 1, "Only the first chunk should have been read")
+	
 
 class TestBuildCbzFile(unittest.TestCase):
 	# basic sanity
@@ -148,63 +179,6 @@ class TestBuildCbzFile(unittest.TestCase):
 			os.remove(os.path.join("From ePub.cbz"))
 
 
-class TestFindHtmlAttributeValue(unittest.TestCase):
-	# no negative tests, since I didn't put in any validation for this function
-	
-	# double quotes
-	def test_getHtmlAttributeValue_doubleQuotes(self):
-		tag = '<img src="images/cover.jpg" alt="image"/>'
-		attr = 'src'
-		self.assertEqual(epubToCbz.getHtmlAttributeValue(tag, attr), 'images/cover.jpg', 'Return value should be "images/cover.jpg".')
-	
-	# single quotes
-	def test_getHtmlAttributeValue_singleQuotes(self):
-		tag = "<img src='images/cover.jpg' alt='image'/>"
-		attr = "src"
-		self.assertEqual(epubToCbz.getHtmlAttributeValue(tag, attr), "images/cover.jpg", 'Return value should be "images/cover.jpg".')
-	
-
-class TestFindOpfEnterDoc(unittest.TestCase):
-	# setup
-	def setUp(self):
-		self.bookDir = os.path.join(os.path.dirname(__file__), "test-resources")
-		self.tempPath = "temp"
-		os.chdir(self.bookDir)
-
-	# no document directory
-	def test_findOpfEnterDoc_noDocDir(self):
-		if not os.path.exists(self.tempPath):
-			os.mkdir(self.tempPath)
-		os.chdir(os.path.join(self.bookDir, "cbz"))
-		docDir, opfFile = epubToCbz.findOpfEnterDoc(self.bookDir, self.tempPath)
-		self.assertEqual(docDir, "Provided ePub has no document directory.", "docDir should be \"Provided ePub has no document directory.\".")
-		self.assertFalse(opfFile, "opfFile should be False.")
-		self.assertFalse(self.tempPath in os.listdir(), "test-resources should no longer contain the temp directory.")
-	
-	# no OPF file
-	def test_findOpfEnterDoc_noOpfFile(self):
-		if not os.path.exists(self.tempPath):
-			os.mkdir(self.tempPath)
-		docDir, opfFile = epubToCbz.findOpfEnterDoc(self.bookDir, self.tempPath)
-		self.assertEqual(docDir, "Provided ePub has no OPF file.", "docDir should be \"Provided ePub has no OPF file.\".")
-		self.assertFalse(opfFile, "opfFile should be False.")
-		self.assertFalse(self.tempPath in os.listdir(), "test-resources should no longer contain the temp directory.")
-	
-	# OPF file in top-level directory
-	def test_findOpfEnterDoc_opfFileInTop(self):
-		os.chdir(os.path.join(self.bookDir, "extracted-epub", "OEBPS"))
-		docDir, opfFile = epubToCbz.findOpfEnterDoc(self.bookDir, self.tempPath)
-		self.assertEqual(docDir, "", "docDir should be an empty string.")
-		self.assertEqual(opfFile, "content.opf", "opfFile should be content.opf.")
-	
-	# OPF file one level down from top-level directory
-	def test_findOpfEnterDoc_opfFileOneDown(self):
-		os.chdir(os.path.join(self.bookDir, "extracted-epub"))
-		docDir, opfFile = epubToCbz.findOpfEnterDoc(self.bookDir, self.tempPath)
-		self.assertEqual(docDir, "OEBPS", "docDir should be OEBPS.")
-		self.assertEqual(opfFile, "content.opf", "opfFile should be content.opf.")
-
-
 class TestGetInnerTagContent(unittest.TestCase):
 	# basic sanity to make sure it's working
 	def test_getInnerTagContent_sanity1(self):
@@ -0,0 +1,93 @@
+#	Comic Spread Stitch - for making digital comic books easier to read
+#	Copyright (C) 2024 Reed Mauzy
+#
+#	This program is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import unittest
+import jobQueue
+import os
+import shutil
+import tempfile
+from zipfile import ZipFile
+
+class TestJobQueue(unittest.TestCase):
+	def setUp(self):
+		self.tempDir = tempfile.TemporaryDirectory()
+		self.queue = jobQueue.JobQueue(os.path.join(self.tempDir.name, jobQueue.queueName))
+
+	def tearDown(self):
+		self.queue.close()
+		self.tempDir.cleanup()
+
+	# Lines are taken in the order they were added, and each is only taken once
+	def test_claim_order(self):
+		ids = self.queue.submit(["D:\\First|1\n", "\n", "D:\\Second|2"])
+
+		self.assertEqual(len(ids), 2, "Blank line should have been left out")
+		self.assertEqual(self.queue.claim(), (ids[0], "D:\\First|1"))
+		self.assertEqual(self.queue.claim(), (ids[1], "D:\\Second|2"))
+		self.assertIsNone(self.queue.claim())
+		self.queue.finish(ids[0], 0, "done")
+		self.assertEqual(self.queue.counts(), {"processed": 1, "running": 1})
+
+	# A line isn't taken while another line for the same book directory is running
+	def test_claim_sameBookDir(self):
+		ids = self.queue.submit(["D:\\First|1", "D:\\First|2", "D:\\Second|1"])
+		
+		self.assertEqual(self.queue.claim(), (ids[0], "D:\\First|1"))
+		self.assertEqual(self.queue.claim(), (ids[2], "D:\\Second|1"), "Line for a directory that's busy should have been passed over")
+		self.assertIsNone(self.queue.claim())
+		self.queue.finish(ids[0], 0, "done")
+		self.assertEqual(self.queue.claim(), (ids[1], "D:\\First|2"))
+
+	# Lines left running by a queue that was stopped are taken again, and another connection sees them
+	def test_requeue(self):
+		jobId = self.queue.submit(["D:\\First|1"])[0]
+		self.queue.claim()
+		other = jobQueue.JobQueue(os.path.join(self.tempDir.name, jobQueue.queueName))
+
+		self.assertEqual(other.requeue(), 1)
+		self.assertEqual(other.claim(), (jobId, "D:\\First|1"))
+		other.close()
+
+	# Finished lines are removed, but ones with errors are kept
+	def test_clear(self):
+		ids = self.queue.submit(["a", "b", "c"])
+		for jobId, status in zip(ids, [0, 1, 2]):
+			self.queue.claim()
+			self.queue.finish(jobId, status, "")
+
+		self.assertEqual(self.queue.clear(), 2)
+		self.assertEqual(self.queue.counts(), {"error": 1})
+
+	# serve processes everything in the queue with the options it's given
+	def test_serve(self):
+		bookDirs = []
+		for name in ["first", "second"]:
+			bookDir = os.path.join(self.tempDir.name, name)
+			os.mkdir(bookDir)
+			shutil.copy(os.path.join(os.path.dirname(__file__), "test-resources", "cbz", "Test.cbz"), bookDir)
+			bookDirs.append(bookDir)
+		self.queue.submit([f"{bookDirs[0]}|1", f"{bookDirs[1]}|2d", os.path.join(self.tempDir.name, "missing") + "|1"])
+
+		jobQueue.serve(self.queue, 2, {"backupMode": "delta"}, True)
+
+		self.assertEqual(self.queue.counts(), {"processed": 2, "skipped": 1})
+		self.assertTrue(os.path.isfile(os.path.join(bookDirs[0], "Test.cbz_delta")), "Options should have been passed to processBook")
+		with ZipFile(os.path.join(bookDirs[1], "Test.cbz"), "r") as zipf:
+			self.assertEqual(len(zipf.namelist()), 5, "Page should have been deleted")
+		self.assertIn("2 processed", self.queue.report())
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,122 @@
+#	Comic Spread Stitch - for making digital comic books easier to read
+#	Copyright (C) 2024 Reed Mauzy
+#
+#	This program is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import unittest
+import libraryScan
+import os
+import tempfile
+
+class TestScanLibrary(unittest.TestCase):
+	def setUp(self):
+		self.tempDir = tempfile.TemporaryDirectory()
+		self.library = self.tempDir.name
+		self.writeFile(os.path.join("Author", "Comic (1)"), "Comic.cbz")
+		self.writeFile(os.path.join("Author", "Comic (1)"), "cover.jpg")
+		self.writeFile(os.path.join("Author", "Manga (2)"), "Manga.epub")
+		self.writeFile(os.path.join("Author", "Manga (2)"), "Manga.cbz")
+		self.writeFile(os.path.join("Other", "Done (3)"), "Done.pdf")
+		self.writeFile(os.path.join("Other", "Done (3)"), "Done.pdf_old")
+		self.writeFile(os.path.join("Other", "Done (3)", "stitchCache"), "Hidden.cbz")
+		self.makeOld()
+
+	def tearDown(self):
+		self.tempDir.cleanup()
+
+	def writeFile(self, relDir, name):
+		os.makedirs(os.path.join(self.library, relDir), exist_ok = True)
+		with open(os.path.join(self.library, relDir, name), "wb") as fp:
+			fp.write(b"book")
+
+	# directories changed just now are always read again, so the tests move every modification time back a minute
+	def makeOld(self):
+		for dirPath, dirNames, fileNames in os.walk(self.library):
+			stat = os.stat(dirPath)
+			os.utime(dirPath, ns = (stat.st_atime_ns, stat.st_mtime_ns - 60000000000))
+
+	def bookDir(self, *parts):
+		return os.path.join(os.path.abspath(self.library), *parts)
+
+	# Every book directory is found, and nothing in directories the scripts make
+	def test_scanLibrary_findsBooks(self):
+		result = libraryScan.scanLibrary(self.library, threads = 2)
+
+		self.assertEqual(result, [
+			(self.bookDir("Author", "Comic (1)"), ["Comic.cbz"], True),
+			(self.bookDir("Author", "Manga (2)"), ["Manga.cbz", "Manga.epub"], True),
+			(self.bookDir("Other", "Done (3)"), ["Done.pdf", "Done.pdf_old"], True),
+		])
+		self.assertTrue(os.path.isfile(os.path.join(self.library, libraryScan.indexName)), "Index should be saved in the library")
+
+	# A directory whose modification time hasn't changed isn't read again
+	def test_scanLibrary_unchangedDirNotRead(self):
+		libraryScan.scanLibrary(self.library)
+		comicDir = os.path.join(self.library, "Author", "Comic (1)")
+		stat = os.stat(comicDir)
+		self.writeFile(os.path.join("Author", "Comic (1)"), "Comic.pdf")
+		os.utime(comicDir, ns = (stat.st_atime_ns, stat.st_mtime_ns))
+
+		result = libraryScan.scanLibrary(self.library)
+
+		self.assertIn((self.bookDir("Author", "Comic (1)"), ["Comic.cbz"], False), result)
+		self.assertIn((self.bookDir("Other", "Done (3)"), ["Done.pdf", "Done.pdf_old"], False), result)
+
+	# A directory with a new file in it is read again, and only that one is marked as changed
+	def test_scanLibrary_changedDirRead(self):
+		libraryScan.scanLibrary(self.library)
+		self.writeFile(os.path.join("Author", "Comic (1)"), "Comic.cbz_old")
+		self.writeFile(os.path.join("Author", "New (4)"), "New.cbz")
+
+		result = libraryScan.scanLibrary(self.library)
+
+		self.assertEqual(result, [
+			(self.bookDir("Author", "Comic (1)"), ["Comic.cbz", "Comic.cbz_old"], True),
+			(self.bookDir("Author", "Manga (2)"), ["Manga.cbz", "Manga.epub"], False),
+			(self.bookDir("Author", "New (4)"), ["New.cbz"], True),
+			(self.bookDir("Other", "Done (3)"), ["Done.pdf", "Done.pdf_old"], False),
+		])
+
+	# Directories that have gone are dropped from the index
+	def test_scanLibrary_removedDir(self):
+		indexFile = os.path.join(self.library, "index.json")
+		libraryScan.scanLibrary(self.library, indexFile)
+		os.remove(os.path.join(self.library, "Author", "Comic (1)", "Comic.cbz"))
+		os.remove(os.path.join(self.library, "Author", "Comic (1)", "cover.jpg"))
+		os.rmdir(os.path.join(self.library, "Author", "Comic (1)"))
+
+		result = libraryScan.scanLibrary(self.library, indexFile)
+
+		self.assertNotIn(os.path.join("Author", "Comic (1)"), libraryScan.loadIndex(indexFile))
+		self.assertEqual([bookDir for bookDir, fileNames, changed in result], [self.bookDir("Author", "Manga (2)"), self.bookDir("Other", "Done (3)")])
+
+class TestGetJobLines(unittest.TestCase):
+	# CBZ lines have no flags, and the other kinds of book get theirs
+	def test_getJobLines_flags(self):
+		self.assertEqual(libraryScan.getJobLines("D:\\Book", ["Book.cbz", "Other.epub", "Book.pdf"]), ["D:\\Book|", "D:\\Book||epub", "D:\\Book||pdf"])
+
+	# An ePub that has already been converted isn't converted again over its CBZ
+	def test_getJobLines_convertedEpub(self):
+		self.assertEqual(libraryScan.getJobLines("D:\\Manga", ["Manga.cbz", "Manga.epub"]), ["D:\\Manga|"])
+
+	# A book with a backup is marked as backed up
+	def test_getJobLines_backedup(self):
+		self.assertEqual(libraryScan.getJobLines("D:\\Book", ["Book.cbz", "Book.cbz_old"]), ["D:\\Book||backedup"])
+
+	# A backup on its own isn't a book to process
+	def test_getJobLines_onlyBackup(self):
+		self.assertEqual(libraryScan.getJobLines("D:\\Book", ["Book.pdf_old"]), [])
+
+if __name__ == "__main__":
+	unittest.main()
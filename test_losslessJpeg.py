@@ -0,0 +1,113 @@
+#	Comic Spread Stitch - for making digital comic books easier to read
+#	Copyright (C) 2024 Reed Mauzy
+#
+#	This program is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import unittest
+import losslessJpeg
+import os
+import shutil
+import numpy as np
+import cv2
+
+def decode(data):
+	return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+class TestRotateExif(unittest.TestCase):
+	def setUp(self):
+		with open(os.path.join(os.path.dirname(__file__), "test-resources", "img", "leftbaboon.jpg"), "rb") as fp:
+			self.jpeg = fp.read()
+		with open(os.path.join(os.path.dirname(__file__), "test-resources", "img", "leftbaboon.png"), "rb") as fp:
+			self.png = fp.read()
+	
+	# rotate right
+	def test_rotateExif_clockwise(self):
+		rotated = losslessJpeg.rotateExif(self.jpeg, True)
+		self.assertEqual(losslessJpeg.getOrientation(rotated), 6, "Orientation should be 6")
+		expected = cv2.rotate(decode(self.jpeg), cv2.ROTATE_90_CLOCKWISE)
+		self.assertTrue(not(np.bitwise_xor(decode(rotated), expected).any()), "Image should be shown rotated clockwise")
+	
+	# rotate left
+	def test_rotateExif_counterclockwise(self):
+		rotated = losslessJpeg.rotateExif(self.jpeg, False)
+		self.assertEqual(losslessJpeg.getOrientation(rotated), 8, "Orientation should be 8")
+		expected = cv2.rotate(decode(self.jpeg), cv2.ROTATE_90_COUNTERCLOCKWISE)
+		self.assertTrue(not(np.bitwise_xor(decode(rotated), expected).any()), "Image should be shown rotated counterclockwise")
+	
+	# rotations add up on an image that already has an orientation
+	def test_rotateExif_existingOrientation(self):
+		rotated = losslessJpeg.rotateExif(losslessJpeg.rotateExif(self.jpeg, True), True)
+		self.assertEqual(losslessJpeg.getOrientation(rotated), 3, "Orientation should be 3 after two clockwise rotations")
+		rotated = losslessJpeg.rotateExif(losslessJpeg.rotateExif(rotated, False), False)
+		self.assertEqual(losslessJpeg.getOrientation(rotated), 1, "Orientation should be back to 1")
+	
+	# image without any EXIF data
+	def test_rotateExif_noExif(self):
+		start, tiffStart = losslessJpeg.findExif(self.jpeg)
+		length = int.from_bytes(self.jpeg[start + 2:start + 4], "big")
+		noExif = self.jpeg[:start] + self.jpeg[start + 2 + length:]
+		self.assertEqual(losslessJpeg.findExif(noExif), (-1, -1), "Test image should no longer have EXIF data")
+		rotated = losslessJpeg.rotateExif(noExif, True)
+		self.assertEqual(losslessJpeg.getOrientation(rotated), 6, "Orientation should be 6")
+		self.assertEqual(rotated[2:4], b"\xff\xe0", "JFIF segment should still come first")
+	
+	# PNGs are left to the fallback
+	def test_rotateExif_png(self):
+		self.assertIsNone(losslessJpeg.rotateExif(self.png, True), "PNG should not be rotated")
+	
+
+class TestRotateLossless(unittest.TestCase):
+	# PNGs are left to the fallback
+	def test_rotateLossless_png(self):
+		with open(os.path.join(os.path.dirname(__file__), "test-resources", "img", "leftbaboon.png"), "rb") as fp:
+			self.assertIsNone(losslessJpeg.rotateLossless(fp.read(), True), "PNG should not be rotated")
+	
+	# only runs where jpegtran is installed
+	@unittest.skipUnless(shutil.which("jpegtran"), "jpegtran is not installed")
+	def test_rotateLossless_sanity(self):
+		with open(os.path.join(os.path.dirname(__file__), "test-resources", "img", "leftbaboon.jpg"), "rb") as fp:
+			jpeg = fp.read()
+		rotated = losslessJpeg.rotateLossless(jpeg, True)
+		# the test image is 512 pixels wide, so only a perfect rotation can come back
+		if rotated is not None:
+			self.assertEqual(decode(rotated).shape, cv2.rotate(decode(jpeg), cv2.ROTATE_90_CLOCKWISE).shape, "Rotated image is the wrong shape")
+
+class TestCropRight(unittest.TestCase):
+	def setUp(self):
+		with open(os.path.join(os.path.dirname(__file__), "test-resources", "img", "leftbaboon.jpg"), "rb") as fp:
+			self.jpeg = fp.read()
+	
+	# size comes from the start of frame header
+	def test_getSize_sanity(self):
+		height, width = decode(self.jpeg).shape[:2]
+		self.assertEqual(losslessJpeg.getSize(self.jpeg), (width, height), "Size is incorrect")
+	
+	# PNGs are left to the fallback
+	def test_cropRight_png(self):
+		with open(os.path.join(os.path.dirname(__file__), "test-resources", "img", "leftbaboon.png"), "rb") as fp:
+			self.assertIsNone(losslessJpeg.cropRight(fp.read(), 1), "PNG should not be cropped")
+	
+	# rotated JPEGs are left to the fallback, since their shown right edge isn't their stored one
+	def test_cropRight_rotated(self):
+		self.assertIsNone(losslessJpeg.cropRight(losslessJpeg.rotateExif(self.jpeg, True), 1), "Rotated JPEG should not be cropped")
+	
+	# only runs where jpegtran is installed
+	@unittest.skipUnless(shutil.which("jpegtran"), "jpegtran is not installed")
+	def test_cropRight_sanity(self):
+		cropped = losslessJpeg.cropRight(self.jpeg, 1)
+		width, height = losslessJpeg.getSize(self.jpeg)
+		self.assertEqual(losslessJpeg.getSize(cropped), (width - 1, height), "Cropped image should be one column narrower")
+
+if __name__ == "__main__":
+	unittest.main()
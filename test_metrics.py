@@ -0,0 +1,100 @@
+#	Comic Spread Stitch - for making digital comic books easier to read
+#	Copyright (C) 2024 Reed Mauzy
+#
+#	This program is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import unittest
+import metrics
+from concurrent.futures import ThreadPoolExecutor
+
+class TestStage(unittest.TestCase):
+	# Stages outside of a measured book are not recorded anywhere
+	def test_stage_notMeasured(self):
+		with metrics.stage("read", "page.jpg", 10):
+			pass
+		
+		self.assertIsNone(metrics.current(), "No book should be measured")
+	
+	# Stages add up by name and pages are listed one by one
+	def test_stage_measured(self):
+		with metrics.measureBook("book|1") as book:
+			with metrics.stage("read", "page.jpg", 10):
+				pass
+			with metrics.stage("read", "page2.jpg") as readStage:
+				readStage.size = 5
+			with metrics.stage("overlap"):
+				pass
+		
+		self.assertIsNone(metrics.current(), "Book should no longer be measured")
+		self.assertEqual(book.stages["read"]["bytes"], 15, "Bytes read are incorrect")
+		self.assertEqual(book.stages["read"]["count"], 2, "Number of reads is incorrect")
+		self.assertEqual([page["page"] for page in book.pages], ["page.jpg", "page2.jpg"], "Pages are incorrect")
+		self.assertGreaterEqual(book.seconds, book.stages["overlap"]["seconds"], "Book should take at least as long as its stages")
+	
+	# Stages run in a thread pool are recorded against the book that started them
+	def test_bindCurrent(self):
+		def crop(size):
+			with metrics.stage("crop", size = size):
+				pass
+		
+		with metrics.measureBook("book|1") as book:
+			with ThreadPoolExecutor(max_workers = 2) as executor:
+				list(executor.map(metrics.bindCurrent(crop), [1, 2, 3]))
+		
+		self.assertEqual(book.stages["crop"]["count"], 3, "Stages from the thread pool were not recorded")
+		self.assertEqual(book.stages["crop"]["bytes"], 6, "Bytes from the thread pool are incorrect")
+
+class TestSummary(unittest.TestCase):
+	# Stages are split into disk I/O and image work
+	def test_summary_report(self):
+		summary = metrics.Summary()
+		summary.add({"line": "a", "status": 0, "seconds": 3.0, "pages": [], "stages": {"read": {"seconds": 1.0, "bytes": 2000000, "count": 2}, "overlap": {"seconds": 2.0, "bytes": 0, "count": 1}}})
+		summary.add({"line": "b", "status": 0, "seconds": 1.0, "pages": [], "stages": {"read": {"seconds": 1.0, "bytes": 0, "count": 1}}})
+		report = summary.report()
+		
+		self.assertEqual(summary.stages["read"], {"seconds": 2.0, "bytes": 2000000, "count": 3}, "Stages were not added up")
+		self.assertIn("Timings for 2 books, 4.00 seconds in total:", report, "Report header is incorrect")
+		self.assertIn("2.00 seconds were spent on disk I/O and 2.00 seconds on image work.", report, "I/O split is incorrect")
+	
+	# The highest peak memory use of any book is reported
+	def test_summary_peakMemory(self):
+		summary = metrics.Summary()
+		summary.add({"line": "a", "status": 0, "seconds": 1.0, "peakMemory": 300000000, "pages": [], "stages": {}})
+		summary.add({"line": "b", "status": 0, "seconds": 1.0, "peakMemory": 200000000, "pages": [], "stages": {}})
+		
+		self.assertIn("Peak memory use of any one process was 300 MB.", summary.report(), "Peak memory is incorrect")
+	
+	# The most memory stitching any one spread held is kept for each book and reported
+	def test_recordStitchMemory(self):
+		with metrics.measureBook("book|1") as book:
+			metrics.recordStitchMemory(2000000)
+			metrics.recordStitchMemory(1000000)
+		summary = metrics.Summary()
+		summary.add(book.toDict())
+		
+		self.assertEqual(book.stitchMemory, 2000000, "Largest stitch should be kept")
+		self.assertIn("Stitching any one spread held at most 2 MB of images at once.", summary.report(), "Stitch memory is incorrect")
+	
+	# Peak memory use is recorded for a measured book where it can be found out
+	def test_measureBook_peakMemory(self):
+		with metrics.measureBook("book|1") as book:
+			pass
+		
+		if metrics.resource:
+			self.assertGreater(book.peakMemory, 0, "Peak memory was not recorded")
+		else:
+			self.assertIsNone(book.peakMemory, "Peak memory can't be found out without the resource module")
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,72 @@
+#	Comic Spread Stitch - for making digital comic books easier to read
+#	Copyright (C) 2024 Reed Mauzy
+#
+#	This program is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import unittest
+import pageEncoder
+import comicSpreadStitch
+import fakeBooks
+import os
+import tempfile
+from concurrent.futures import Future
+
+class TestPageEncoder(unittest.TestCase):
+	def setUp(self):
+		self.page = fakeBooks.makePage(200, 300, 0)
+	
+	# Pages only get a new extension when they're converted to another format
+	def test_outputName(self):
+		self.assertEqual(pageEncoder.PageEncoder().outputName("001.png"), "001.png")
+		self.assertEqual(pageEncoder.PageEncoder(".webp").outputName("001.png"), "001.webp")
+		self.assertEqual(pageEncoder.PageEncoder(".jpg").outputName("001.JPEG"), "001.JPEG", "JPEG pages are already JPEGs")
+	
+	# Lower quality makes smaller JPEGs, and higher compression makes smaller PNGs
+	def test_encode_quality(self):
+		self.assertLess(len(pageEncoder.PageEncoder(quality = 30).encode("001.jpg", self.page)), len(pageEncoder.PageEncoder(quality = 95).encode("001.jpg", self.page)))
+		self.assertLess(len(pageEncoder.PageEncoder(pngCompression = 9).encode("001.png", self.page)), len(pageEncoder.PageEncoder(pngCompression = 0).encode("001.png", self.page)))
+	
+	# With threads, pages are encoded in the background
+	def test_submit_threads(self):
+		with pageEncoder.PageEncoder(".png", threads = 2) as encoder:
+			data = encoder.submit("001.jpg", self.page)
+			self.assertIsInstance(data, Future, "Page should be encoded in the background")
+			self.assertEqual(pageEncoder.result(data)[:4], b"\x89PNG", "Page should be encoded as a PNG")
+		self.assertEqual(pageEncoder.PageEncoder(".png").submit("001.jpg", self.page)[:4], b"\x89PNG", "Page should be encoded straight away without threads")
+
+class TestDirPagesFormat(unittest.TestCase):
+	# A page converted to another format replaces its file and can still be found under its old name
+	def test_dirPages_convert(self):
+		with tempfile.TemporaryDirectory() as imgDir:
+			pageStore = comicSpreadStitch.DirPages(imgDir, pageEncoder.PageEncoder(".webp"))
+			comicSpreadStitch.DirPages(imgDir).write("001.png", fakeBooks.makePage(200, 300, 0))
+			pageStore.write("001.png", pageStore.read("001.png"))
+			
+			self.assertEqual(os.listdir(imgDir), ["001.webp"])
+			self.assertEqual(pageStore.read("001.png").shape, (300, 200, 3))
+	
+	# A converted page keeps its name instead of overwriting a page that already has its new name
+	def test_dirPages_convertNameTaken(self):
+		with tempfile.TemporaryDirectory() as imgDir:
+			pageStore = comicSpreadStitch.DirPages(imgDir, pageEncoder.PageEncoder(".webp"))
+			comicSpreadStitch.DirPages(imgDir).write("001.png", fakeBooks.makePage(200, 300, 0))
+			comicSpreadStitch.DirPages(imgDir).write("001.webp", fakeBooks.makePage(100, 150, 1))
+			pageStore.write("001.png", pageStore.read("001.png"))
+			
+			self.assertEqual(sorted(os.listdir(imgDir)), ["001.png", "001.webp"])
+			self.assertEqual(pageStore.readBytes("001.png")[8:12], b"WEBP")
+			self.assertEqual(pageStore.read("001.webp").shape, (150, 100, 3))
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,106 @@
+#	Comic Spread Stitch - for making digital comic books easier to read
+#	Copyright (C) 2024 Reed Mauzy
+#
+#	This program is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import unittest
+import pdfToCbz
+import os
+import shutil
+import tempfile
+import numpy as np
+from PIL import Image
+from pypdf import PdfReader, PdfWriter
+from zipfile import ZipFile, ZIP_STORED
+
+class TestConvertPdfToCbz(unittest.TestCase):
+	def setUp(self):
+		self.tempDir = tempfile.TemporaryDirectory()
+		self.book = os.path.join(self.tempDir.name, "Test.pdf")
+		self.cbzFile = os.path.join(self.tempDir.name, "Test.cbz")
+		rng = np.random.default_rng(0)
+		imgs = [Image.fromarray(rng.integers(0, 255, (80, 60, 3), dtype = np.uint8)) for i in range(11)]
+		imgs[0].save(self.book, save_all = True, append_images = imgs[1:])
+		# the JPEG streams exactly as Pillow stored them in the PDF
+		reader = PdfReader(self.book)
+		self.streams = [page["/Resources"]["/XObject"][page.images.keys()[0]]._data for page in reader.pages]
+		self.cwd = os.getcwd()
+	
+	def tearDown(self):
+		self.tempDir.cleanup()
+	
+	def checkCbz(self):
+		with ZipFile(self.cbzFile, "r") as cbz:
+			names = cbz.namelist()
+			self.assertEqual(names, [f"{i:02d}.jpg" for i in range(11)], "Pages are not named in order")
+			for name, stream in zip(names, self.streams):
+				self.assertEqual(cbz.read(name), stream, f"{name} was not copied out of the PDF as it was stored")
+				self.assertEqual(cbz.getinfo(name).compress_type, ZIP_STORED, f"{name} should be stored without compression")
+	
+	# JPEG pages are copied into the CBZ without being re-encoded or written anywhere else
+	def test_convertPdfToCbz_rawJpegs(self):
+		status, reason = pdfToCbz.convertPdfToCbz(self.book)
+		
+		self.assertEqual(status, 0, reason)
+		self.assertEqual(reason, "Test.pdf converted to CBZ.", "Reason is incorrect")
+		self.assertEqual(os.getcwd(), self.cwd, "Working directory should not have changed")
+		self.assertEqual(sorted(os.listdir(self.tempDir.name)), ["Test.cbz", "Test.pdf"], "Nothing else should be left in the book directory")
+		self.checkCbz()
+	
+	# several processes give the same CBZ, still in page order
+	def test_convertPdfToCbz_jobs(self):
+		status, reason = pdfToCbz.convertPdfToCbz(self.book, jobs = 2)
+		
+		self.assertEqual(status, 0, reason)
+		self.checkCbz()
+	
+	# files that aren't PDFs are skipped
+	def test_convertPdfToCbz_notPdf(self):
+		self.assertEqual(pdfToCbz.convertPdfToCbz(self.cbzFile), (1, "Provided file is not a PDF."), "Non-PDF should be skipped")
+
+	# a PDF with no images is skipped rather than replacing the CBZ that's already there with an empty one
+	def test_convertPdfToCbz_noImages(self):
+		book = os.path.join(self.tempDir.name, "10page.pdf")
+		shutil.copy(os.path.join(os.path.dirname(__file__), "test-resources", "pdf", "10page.pdf"), book)
+		with open(os.path.join(self.tempDir.name, "10page.cbz"), "wb") as fp:
+			fp.write(b"existing")
+		
+		self.assertEqual(pdfToCbz.convertPdfToCbz(book)[0], 1, "PDF with no images should be skipped")
+		with open(os.path.join(self.tempDir.name, "10page.cbz"), "rb") as fp:
+			self.assertEqual(fp.read(), b"existing", "Existing CBZ should have been left alone")
+		self.assertFalse(os.path.exists(os.path.join(self.tempDir.name, "10page.cbz.tmp")), "Nothing should be left behind")
+
+	# a PDF with no pages is skipped
+	def test_convertPdfToCbz_noPages(self):
+		PdfWriter().write(self.book)
+		
+		self.assertEqual(pdfToCbz.convertPdfToCbz(self.book), (1, "Test.pdf has no pages to convert."))
+		self.assertFalse(os.path.exists(self.cbzFile), "No CBZ should have been made")
+
+class TestExtractPage(unittest.TestCase):
+	# images that pypdf has to convert, like ASCIIHex-encoded ones, come out as whatever pypdf makes of them
+	def test_extractPage_converted(self):
+		with tempfile.TemporaryDirectory() as tempDir:
+			book = os.path.join(tempDir, "Test.pdf")
+			# Pillow stores palette images as ASCIIHex-encoded data
+			Image.new("P", (60, 80)).save(book)
+			with open(book, "rb") as fp:
+				page = PdfReader(fp).pages[0]
+				imgExt, data = pdfToCbz.extractPage(page, 0)
+		
+		self.assertEqual(imgExt, ".png", "Converted image should be a PNG")
+		self.assertEqual(data[:8], b"\x89PNG\r\n\x1a\n", "Converted image should be a PNG")
+
+if __name__ == "__main__":
+	unittest.main()
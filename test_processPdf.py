@@ -16,7 +16,11 @@
 
 import unittest
 import processPdf
+import bookProgress
 import os
+import tempfile
+import numpy as np
+from PIL import Image
 from pypdf import PdfReader
 
 class TestProcessPdf(unittest.TestCase):
@@ -76,6 +80,143 @@ class TestProcessPdf(unittest.TestCase):
 		oldRead = PdfReader(self.book + "_old")
 		newRead = PdfReader(self.book)
 		self.assertEqual(len(oldRead.pages) - 1, len(newRead.pages), "Backup file should have 1 page more than processed file")
+	
+	# low memory tests
+	
+	# covers stitched together while writing a page at a time
+	def test_processPdf_lowMemoryCoversStitched(self):
+		status, reason = processPdf.processPdf(self.book, [[0, ""]], False, False, True)
+		self.assertEqual(status, 0, reason)
+		oldRead = PdfReader(self.book + "_old")
+		newRead = PdfReader(self.book, strict = True)
+		self.assertEqual(len(oldRead.pages), len(newRead.pages), "Backup file and processed file should have same number of pages")
+		self.assertFalse(os.path.isfile(self.book + ".tmp"), "Temporary file was left behind")
+	
+	# progress is reported for every page of the new PDF, and raising Cancelled from it stops the book without touching it
+	def test_processPdf_progress(self):
+		updates = []
+		processPdf.processPdf(self.book, [[1, ""]], False, False, progress = lambda done, total: updates.append((done, total)))
+		self.assertEqual(updates, [(0, 2), (1, 2), (2, 2)])
+		os.remove(self.book)
+		os.rename(self.book + "_old", self.book)
+		
+		def cancel(done, total):
+			if done == 1:
+				raise bookProgress.Cancelled()
+		with self.assertRaises(bookProgress.Cancelled):
+			processPdf.processPdf(self.book, [[1, ""]], False, False, True, cancel)
+		self.assertFalse(os.path.isfile(self.book + "_old"), "Backup should not have been made")
+		self.assertFalse(os.path.isfile(self.book + ".tmp"), "Temporary file was left behind")
+	
+	# pages stitched, rotated, and deleted while writing a page at a time give the same pages as writing all at once
+	def test_processPdf_lowMemoryMatches(self):
+		pageList = [[1, "s"], [3, "d"]]
+		processPdf.processPdf(self.book, [page[:] for page in pageList], True, False)
+		expected = [(page.mediabox.width, page.rotation) for page in PdfReader(self.book).pages]
+		os.remove(self.book)
+		os.rename(self.book + "_old", self.book)
+		
+		processPdf.processPdf(self.book, pageList, True, False, True)
+		newRead = PdfReader(self.book, strict = True)
+		
+		self.assertEqual([(page.mediabox.width, page.rotation) for page in newRead.pages], expected, "Pages should be the same as when writing all at once")
+		self.assertEqual(newRead.viewer_preferences.direction, "/R2L", "Reading direction should be right to left")
+
+class TestDedupeImages(unittest.TestCase):
+	def setUp(self):
+		self.tempDir = tempfile.TemporaryDirectory()
+		self.book = os.path.join(self.tempDir.name, "Repeated.pdf")
+		# Pillow gives each page its own copy of its image, even if it's the same as another page's
+		rng = np.random.default_rng(0)
+		first, second = [Image.fromarray(rng.integers(0, 255, (80, 60, 3), dtype = np.uint8)) for i in range(2)]
+		imgs = [first, second] * 4
+		imgs[0].save(self.book, save_all = True, append_images = imgs[1:])
+		self.images = [np.asarray(page.images[0].image).tobytes() for page in PdfReader(self.book).pages]
+	
+	def tearDown(self):
+		self.tempDir.cleanup()
+	
+	def checkDeduped(self, lowMemory):
+		oldSize = os.path.getsize(self.book)
+		status, reason = processPdf.processPdf(self.book, [[3, ""], [8, "r"]], False, False, lowMemory)
+		self.assertEqual(status, 0, reason)
+		newRead = PdfReader(self.book, strict = True)
+		images = [[np.asarray(img.image).tobytes() for img in page.images] for page in newRead.pages]
+		
+		self.assertEqual(images, [[self.images[0]], [self.images[1]], [self.images[2], self.images[3]], [self.images[4]], [self.images[5]], [self.images[6]], [self.images[7]]], "Pages should show the same images as before")
+		self.assertLess(os.path.getsize(self.book), oldSize / 3, "Repeated images should only be stored once")
+	
+	# repeated images are only stored once
+	def test_processPdf_dedupeImages(self):
+		self.checkDeduped(False)
+	
+	# repeated images are only stored once while writing a page at a time
+	def test_processPdf_lowMemoryDedupeImages(self):
+		self.checkDeduped(True)
+	
+	# a version of pypdf without the private parts of PdfWriter that are used still gives the same pages, just without sharing images
+	def test_processPdf_missingInternals(self):
+		dedupeInternals, streamInternals = processPdf.dedupeInternals, processPdf.streamInternals
+		processPdf.dedupeInternals = processPdf.streamInternals = ["_notInPypdf"]
+		try:
+			for lowMemory in [False, True]:
+				with self.subTest(lowMemory = lowMemory):
+					status, reason = processPdf.processPdf(self.book, [[3, ""]], False, False, lowMemory)
+					
+					self.assertEqual(status, 0, reason)
+					newRead = PdfReader(self.book, strict = True)
+					self.assertEqual([[np.asarray(img.image).tobytes() for img in page.images] for page in newRead.pages][2], [self.images[2], self.images[3]], "Pages should have been stitched")
+					os.remove(self.book)
+					os.rename(self.book + "_old", self.book)
+		finally:
+			processPdf.dedupeInternals, processPdf.streamInternals = dedupeInternals, streamInternals
+	
+	# the bytes saved are counted
+	def test_dedupeImages_savedBytes(self):
+		reader = PdfReader(self.book)
+		writer = processPdf.DedupingPdfWriter()
+		for page in reader.pages:
+			writer.add_page(page)
+		
+		self.assertGreater(writer.dedupeImages(), 0, "Bytes saved should be returned")
+		self.assertEqual(writer.dedupedImages, 6, "All but one copy of each image should be removed")
+		self.assertEqual(writer.dedupeImages(), 0, "Nothing new to dedupe")
+
+class TestPlanPdf(unittest.TestCase):
+	# pages that aren't in the list are added unaltered
+	def test_planPdf_untouched(self):
+		self.assertEqual(processPdf.planPdf([[2, "r"]], 4), [(0, None), (1, "r"), (2, None), (3, None)], "Plan is incorrect")
+	
+	# the second page of a spread isn't added on its own
+	def test_planPdf_stitched(self):
+		self.assertEqual(processPdf.planPdf([[1, "m"], [3, ""]], 4), [(0, "m"), (2, "")], "Plan is incorrect")
+	
+	# the page after a deleted or rotated page can still be processed
+	def test_planPdf_afterDeleted(self):
+		self.assertEqual(processPdf.planPdf([[1, "d"], [2, "l"], [3, ""]], 5), [(0, "d"), (1, "l"), (2, ""), (4, None)], "Plan is incorrect")
+	
+	# covers stitched together
+	def test_planPdf_coversStitched(self):
+		self.assertEqual(processPdf.planPdf([[0, ""]], 3), [(0, None), (1, None), (-1, "")], "Plan is incorrect")
+	
+	# a deleted back cover is left out of the plan
+	def test_planPdf_lastPageDeleted(self):
+		self.assertEqual(processPdf.planPdf([[3, "d"]], 3), [(0, None), (1, None)], "Plan is incorrect")
+	
+	# a long range of deleted pages is planned in one pass
+	def test_planPdf_deletedRange(self):
+		pageList = [[page, "d"] for page in range(57, 4001)]
+		plan = processPdf.planPdf(pageList, 5000)
+		
+		self.assertEqual(len(plan), 5000, "Every page should be in the plan")
+		self.assertEqual(sum(1 for pageNum, op in plan if op == "d"), 3944, "Every deleted page should be in the plan")
+		self.assertEqual(plan[-1], (4999, None), "Back cover should be added unaltered")
+	
+	# the page list passed in isn't changed
+	def test_planPdf_pageListUnchanged(self):
+		pageList = [[0, ""], [2, "d"]]
+		processPdf.planPdf(pageList, 3)
+		self.assertEqual(pageList, [[0, ""], [2, "d"]], "Page list should not have changed")
 
 if __name__ == "__main__":
 	unittest.main()
@@ -0,0 +1,79 @@
+#	Comic Spread Stitch - for making digital comic books easier to read
+#	Copyright (C) 2024 Reed Mauzy
+#
+#	This program is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import unittest
+import resultCache
+import os
+import tempfile
+
+class TestResultCache(unittest.TestCase):
+	def setUp(self):
+		self.tempDir = tempfile.TemporaryDirectory()
+		self.bookDir = self.tempDir.name
+		self.writeFile("Book.cbz_old", b"source")
+		self.writeFile("Book.cbz", b"output")
+		self.job = {"pages": "1", "manga": False, "overlap": 50}
+	
+	def tearDown(self):
+		self.tempDir.cleanup()
+	
+	def writeFile(self, name, data):
+		with open(os.path.join(self.bookDir, name), "wb") as fp:
+			fp.write(data)
+	
+	# A result is found again by a new cache for the same directory
+	def test_addResult_found(self):
+		resultCache.ResultCache(self.bookDir).addResult("Book.cbz", "Book.cbz_old", self.job)
+		cache = resultCache.ResultCache(self.bookDir)
+		outputName, entry = cache.findResult(".cbz")
+		
+		self.assertEqual(outputName, "Book.cbz", "Output name is incorrect")
+		self.assertTrue(cache.isSameJob(entry, self.job), "Job should be the same")
+		self.assertFalse(cache.isSameJob(entry, dict(self.job, pages = "2")), "Job with different pages should not be the same")
+		self.assertTrue(cache.sourceIsUnchanged(entry), "Source should be unchanged")
+		self.assertEqual(cache.findResult(".pdf"), (None, None), "No PDF was processed")
+	
+	# A result is forgotten once the output is changed by something else
+	def test_findResult_outputChanged(self):
+		resultCache.ResultCache(self.bookDir).addResult("Book.cbz", "Book.cbz_old", self.job)
+		self.writeFile("Book.cbz", b"changed output")
+		
+		self.assertEqual(resultCache.ResultCache(self.bookDir).findResult(".cbz"), (None, None), "Changed output should not be found")
+	
+	# Changing the source means the job is no longer the same
+	def test_isSameJob_sourceChanged(self):
+		resultCache.ResultCache(self.bookDir).addResult("Book.cbz", "Book.cbz_old", self.job)
+		self.writeFile("Book.cbz_old", b"new source")
+		cache = resultCache.ResultCache(self.bookDir)
+		outputName, entry = cache.findResult(".cbz")
+		
+		self.assertFalse(cache.isSameJob(entry, self.job), "Job on a changed source should not be the same")
+		self.assertFalse(cache.sourceIsUnchanged(entry), "Source should have changed")
+	
+	# Stitched pages that weren't used by the latest run are thrown away
+	def test_addResult_prunesPages(self):
+		cache = resultCache.ResultCache(self.bookDir)
+		cache.putPage("old", b"old page")
+		cache.addResult("Book.cbz", "Book.cbz_old", self.job)
+		cache = resultCache.ResultCache(self.bookDir)
+		cache.putPage("new", b"new page")
+		cache.addResult("Book.cbz", "Book.cbz_old", self.job)
+		
+		self.assertIsNone(cache.getPage("old"), "Unused page should have been thrown away")
+		self.assertEqual(cache.getPage("new"), b"new page", "Used page should have been kept")
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,77 @@
+#	Comic Spread Stitch - for making digital comic books easier to read
+#	Copyright (C) 2024 Reed Mauzy
+#
+#	This program is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import unittest
+import runJournal
+import os
+import tempfile
+
+class TestRunJournal(unittest.TestCase):
+	def setUp(self):
+		self.tempDir = tempfile.TemporaryDirectory()
+		self.path = os.path.join(self.tempDir.name, runJournal.journalName)
+		self.options = {"overlap": 50}
+
+	def tearDown(self):
+		self.tempDir.cleanup()
+
+	def stoppedRun(self):
+		journal = runJournal.RunJournal(self.path, self.options)
+		journal.record("D:\\Done|1\n", 0)
+		journal.record("D:\\Skipped|", 1)
+		journal.record("D:\\Error|2", 2)
+		journal.close()
+
+	# Lines that were processed or skipped are finished, and lines with errors are tried again
+	def test_resume_sanity(self):
+		self.stoppedRun()
+		journal = runJournal.RunJournal(self.path, self.options, True)
+
+		self.assertTrue(journal.isFinished("D:\\Done|1"))
+		self.assertTrue(journal.isFinished("D:\\Skipped|\n"))
+		self.assertFalse(journal.isFinished("D:\\Error|2"))
+		self.assertFalse(journal.isFinished("D:\\New|3"))
+		journal.record("D:\\Error|2", 0)
+		journal.close()
+		self.assertTrue(runJournal.RunJournal(self.path, self.options, True).isFinished("D:\\Error|2"), "Lines from the resumed run should have been added")
+
+	# Without resume, or with different options, the journal starts over
+	def test_resume_startsOver(self):
+		self.stoppedRun()
+		self.assertFalse(runJournal.RunJournal(self.path, {"overlap": 0}, True).finished)
+		self.assertFalse(runJournal.RunJournal(self.path, self.options).finished)
+		self.assertFalse(runJournal.RunJournal(self.path, self.options, True).finished, "Starting over should have emptied the journal")
+
+	# A record cut short by the run being stopped is ignored
+	def test_resume_cutShort(self):
+		self.stoppedRun()
+		with open(self.path, "a") as fp:
+			fp.write('{"line": "D:\\\\Ha')
+
+		journal = runJournal.RunJournal(self.path, self.options, True)
+		self.assertEqual(len(journal.finished), 2)
+		journal.record("D:\\Error|2", 0)
+		journal.close()
+		self.assertTrue(runJournal.RunJournal(self.path, self.options, True).isFinished("D:\\Error|2"), "Record after the cut short one should have been kept")
+
+	def test_finish(self):
+		journal = runJournal.RunJournal(self.path, self.options)
+		journal.finish()
+
+		self.assertFalse(os.path.exists(self.path))
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,112 @@
+#	Comic Spread Stitch - for making digital comic books easier to read
+#	Copyright (C) 2024 Reed Mauzy
+#
+#	This program is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import unittest
+import spreadDetect
+import fakeBooks
+import cv2
+import numpy as np
+import os
+import tempfile
+from zipfile import ZipFile
+
+# art that changes smoothly across the page, the way real art mostly does
+def makeArt(width, height, seed):
+	rng = np.random.default_rng(seed)
+	small = rng.integers(0, 255, (height // 40 + 2, width // 40 + 2, 3)).astype(np.uint8)
+	return cv2.resize(small, (width, height), interpolation = cv2.INTER_CUBIC)
+
+# art with a white margin all the way around it
+def makeMarginPage(width, height, seed):
+	page = np.full((height, width, 3), 255, np.uint8)
+	page[40:-40, 40:-40] = makeArt(width - 80, height - 80, seed)
+	return page
+
+class TestDetectSpreads(unittest.TestCase):
+	def setUp(self):
+		self.tempDir = tempfile.TemporaryDirectory()
+		self.bookDir = self.tempDir.name
+		spread = makeArt(800, 600, 1)
+		overlapped = makeArt(790, 600, 4)
+		# page 2 starts a spread, pages 4 and 5 run off the edge without being one, and page 7 starts a spread whose halves overlap
+		self.pages = [makeMarginPage(400, 600, 0), spread[:, :400], spread[:, 400:], makeArt(400, 600, 2), makeArt(400, 600, 3), makeMarginPage(400, 600, 5), overlapped[:, :400], overlapped[:, 390:], makeMarginPage(400, 600, 6)]
+		self.book = self.writeBook(self.pages)
+
+	def tearDown(self):
+		self.tempDir.cleanup()
+
+	def writeBook(self, pages, name = "Book.cbz"):
+		book = os.path.join(self.bookDir, name)
+		with ZipFile(book, "w") as cbz:
+			for i, page in enumerate(pages):
+				cbz.writestr(f"{i:02d}.jpg", cv2.imencode(".jpg", page)[1].tobytes())
+		return book
+
+	# The halves of each spread are found, and nothing else
+	def test_detectSpreads_sanity(self):
+		aspects, spreads = spreadDetect.detectSpreads(self.book)
+
+		self.assertEqual([pageNum for pageNum, score in spreads], [2, 7])
+		self.assertTrue(np.allclose(aspects, 400 / 600, atol = 0.02), "Every page is portrait")
+
+	# In manga, the first half of a spread is on the right
+	def test_detectSpreads_manga(self):
+		spread = makeArt(800, 600, 7)
+		book = self.writeBook([makeMarginPage(400, 600, 0), spread[:, 400:], spread[:, :400], makeMarginPage(400, 600, 8)], "Manga.cbz")
+
+		self.assertEqual([pageNum for pageNum, score in spreadDetect.detectSpreads(book, manga = True)[1]], [2])
+		self.assertEqual(spreadDetect.detectSpreads(book)[1], [])
+
+	# The made-up books the benchmarks use have a spread every four pages
+	def test_detectSpreads_benchmarkBook(self):
+		book = fakeBooks.makeCbz(self.bookDir, 12, 300, 450, ".jpg", 20)
+
+		self.assertEqual([pageNum for pageNum, score in spreadDetect.detectSpreads(book)[1]], [1, 5, 9])
+
+	# A line without pages has them filled in, keeping its flags
+	def test_detectLine_fillsPages(self):
+		self.assertEqual(spreadDetect.detectLine(f"{self.bookDir}||backedup"), (1, f"{self.bookDir}||backedup"), "Book with no backup should be left alone")
+		self.assertEqual(spreadDetect.detectLine(f"{self.bookDir}|", "right"), (0, f"{self.bookDir}|2s, 7s"))
+
+	# A line that already has pages is left alone
+	def test_detectLine_hasPages(self):
+		self.assertEqual(spreadDetect.detectLine(f"{self.bookDir}|3"), (1, f"{self.bookDir}|3"))
+
+class TestPickSpreads(unittest.TestCase):
+	# A page can only be in one spread, so the better join wins
+	def test_pickSpreads_overlapping(self):
+		self.assertEqual(spreadDetect.pickSpreads(np.array([0.7, 0.9, 0.8, 0.2])), [(2, 0.9)])
+
+	def test_pickSpreads_belowScore(self):
+		self.assertEqual(spreadDetect.pickSpreads(np.array([0.5, 0.1])), [])
+
+class TestProposePageList(unittest.TestCase):
+	# Without rotate, spreads are only stitched
+	def test_proposePageList_noRotate(self):
+		self.assertEqual(spreadDetect.proposePageList((np.array([0.7, 0.7, 0.7, 1.4]), [(1, 0.9)])), "1")
+
+	# With rotate, landscape spreads and pages in a portrait book are turned
+	def test_proposePageList_rotate(self):
+		aspects = np.array([0.7, 0.7, 0.7, 1.4, 0.7])
+		self.assertEqual(spreadDetect.proposePageList((aspects, [(1, 0.9)]), "left"), "1m, 4l")
+		self.assertEqual(spreadDetect.proposePageList((aspects, [(1, 0.9)]), "right"), "1s, 4r")
+
+	# A book of landscape pages isn't turned at all
+	def test_proposePageList_landscapeBook(self):
+		self.assertEqual(spreadDetect.proposePageList((np.array([1.4, 1.4, 1.4]), [(2, 0.9)]), "left"), "2")
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,78 @@
+#	Comic Spread Stitch - for making digital comic books easier to read
+#	Copyright (C) 2024 Reed Mauzy
+#
+#	This program is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import unittest
+import zipUtils
+import os
+import tempfile
+from zipfile import ZipFile, ZIP_STORED, ZIP_DEFLATED
+
+class TestCopyMember(unittest.TestCase):
+	def setUp(self):
+		self.tempDir = tempfile.TemporaryDirectory()
+		self.newZipFile = os.path.join(self.tempDir.name, "New.cbz")
+	
+	def tearDown(self):
+		self.tempDir.cleanup()
+	
+	# stored and deflated members both come out the same as they went in
+	def test_copyMember_sanity(self):
+		cbz = os.path.join(os.path.dirname(__file__), "test-resources", "cbz", "Test.cbz")
+		with ZipFile(cbz, "r") as srcZip, ZipFile(self.newZipFile, "w") as dstZip:
+			for info in srcZip.infolist():
+				zipUtils.copyMember(srcZip, info, dstZip)
+		with ZipFile(cbz, "r") as srcZip, ZipFile(self.newZipFile, "r") as dstZip:
+			self.assertIsNone(dstZip.testzip(), "Copied archive should not be corrupt")
+			self.assertEqual(srcZip.namelist(), dstZip.namelist(), "Name lists should match")
+			for info in srcZip.infolist():
+				self.assertEqual(dstZip.getinfo(info.filename).compress_type, info.compress_type, f"{info.filename} should keep its compression")
+				self.assertEqual(dstZip.read(info.filename), srcZip.read(info), f"{info.filename} should not have changed")
+	
+	# members can be renamed on the way and mixed with newly written members
+	def test_copyMember_renamed(self):
+		epub = os.path.join(os.path.dirname(__file__), "test-resources", "epub", "Test ePub.epub")
+		with ZipFile(epub, "r") as srcZip, ZipFile(self.newZipFile, "w") as dstZip:
+			zipUtils.copyMember(srcZip, srcZip.getinfo("OEBPS/images/boat.png"), dstZip, "0.png")
+			zipUtils.writeMember(dstZip, "1.png", b"not really a PNG")
+			zipUtils.copyMember(srcZip, srcZip.getinfo("OEBPS/content.opf"), dstZip, "2.opf")
+		with ZipFile(epub, "r") as srcZip, ZipFile(self.newZipFile, "r") as dstZip:
+			self.assertIsNone(dstZip.testzip(), "Copied archive should not be corrupt")
+			self.assertEqual(dstZip.namelist(), ["0.png", "1.png", "2.opf"], "Members were not renamed")
+			self.assertEqual(dstZip.read("0.png"), srcZip.read("OEBPS/images/boat.png"), "Copied image should not have changed")
+			self.assertEqual(dstZip.read("1.png"), b"not really a PNG", "Written member is incorrect")
+			self.assertEqual(dstZip.read("2.opf"), srcZip.read("OEBPS/content.opf"), "Copied OPF file should not have changed")
+	
+	# without the parts of ZipFile that are used to copy members as they are, members are still copied
+	def test_copyMember_missingInternals(self):
+		dstInternals = zipUtils.dstInternals
+		zipUtils.dstInternals = ["_notInZipfile"]
+		try:
+			self.test_copyMember_sanity()
+		finally:
+			zipUtils.dstInternals = dstInternals
+
+
+class TestCompressTypeFor(unittest.TestCase):
+	# images are stored, anything else uses the archive's compression
+	def test_compressTypeFor_sanity(self):
+		with tempfile.TemporaryDirectory() as tempDir:
+			with ZipFile(os.path.join(tempDir, "New.cbz"), "w", compression = ZIP_DEFLATED) as dstZip:
+				self.assertEqual(zipUtils.compressTypeFor("01.JPG", dstZip), ZIP_STORED, "JPEG pages should be stored")
+				self.assertEqual(zipUtils.compressTypeFor("02.png", dstZip), ZIP_STORED, "PNG pages should be stored")
+				self.assertEqual(zipUtils.compressTypeFor("ComicInfo.xml", dstZip), ZIP_DEFLATED, "Other files should use the archive's compression")
+
+if __name__ == "__main__":
+	unittest.main()
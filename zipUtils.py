@@ -0,0 +1,96 @@
+#	Comic Spread Stitch - for making digital comic books easier to read
+#	Copyright (C) 2024 Reed Mauzy
+#
+#	This program is free software: you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation, either version 3 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#
+#	You should have received a copy of the GNU General Public License
+#	along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from zipfile import ZipInfo, ZIP_STORED, sizeFileHeader
+import os
+import struct
+import time
+
+# JPEG, PNG, and WebP pages are already compressed, so deflating them again just costs time
+storedExts = [".jpg", ".jpeg", ".png", ".webp", ".gif"]
+
+# bit 3 of the general purpose flags says the sizes and CRC come after the data instead of in the header
+dataDescriptorFlag = 0x08
+# the private parts of ZipFile that copying a member as it is uses, which are checked for in case another version of Python changes them
+srcInternals = ["_lock", "fp"]
+dstInternals = ["_lock", "_writing", "_writecheck", "_didModify", "start_dir", "fp", "NameToInfo"]
+
+# copies a member of srcZip into dstZip without decompressing and recompressing it
+# arcname defaults to the member's name in srcZip
+# zipfile has no public way of doing this, so the local file header is written the same way ZipFile.writestr writes it
+# if zipfile doesn't have the parts this uses, the member is decompressed and compressed again with writestr instead
+def copyMember(srcZip, info, dstZip, arcname = None):
+	if not (all(hasattr(srcZip, name) for name in srcInternals) and all(hasattr(dstZip, name) for name in dstInternals)):
+		newInfo = ZipInfo(arcname if arcname else info.filename, date_time = info.date_time)
+		newInfo.compress_type = info.compress_type
+		newInfo.external_attr = info.external_attr
+		dstZip.writestr(newInfo, srcZip.read(info))
+		return
+	data = readRawMember(srcZip, info)
+
+	newInfo = ZipInfo(arcname if arcname else info.filename, date_time = info.date_time)
+	newInfo.compress_type = info.compress_type
+	newInfo.external_attr = info.external_attr
+	newInfo.flag_bits = info.flag_bits & ~dataDescriptorFlag
+	newInfo.CRC = info.CRC
+	newInfo.compress_size = info.compress_size
+	newInfo.file_size = info.file_size
+
+	with dstZip._lock:
+		if dstZip._writing:
+			raise ValueError("Can't copy into the ZIP file while there is another write handle open on it.")
+		dstZip._writecheck(newInfo)
+		dstZip._didModify = True
+		dstZip.fp.seek(dstZip.start_dir)
+		newInfo.header_offset = dstZip.fp.tell()
+		dstZip.fp.write(newInfo.FileHeader())
+		dstZip.fp.write(data)
+		dstZip.start_dir = dstZip.fp.tell()
+		dstZip.filelist.append(newInfo)
+		dstZip.NameToInfo[newInfo.filename] = newInfo
+
+# where the compressed data of a member starts in the archive, which is after its local file header
+# the local header can have a different extra field to the one in the central directory, so it has to be read
+def dataOffset(srcZip, info):
+	with srcZip._lock:
+		srcZip.fp.seek(info.header_offset)
+		header = srcZip.fp.read(sizeFileHeader)
+	nameLength, extraLength = struct.unpack("<HH", header[26:30])
+	return info.header_offset + sizeFileHeader + nameLength + extraLength
+
+# the compressed data of a member exactly as it's stored in the archive
+def readRawMember(srcZip, info):
+	offset = dataOffset(srcZip, info)
+	with srcZip._lock:
+		srcZip.fp.seek(offset)
+		return srcZip.fp.read(info.compress_size)
+
+# images are stored as they are and anything else gets the archive's default compression
+def compressTypeFor(name, dstZip):
+	if os.path.splitext(name)[1].lower() in storedExts:
+		return ZIP_STORED
+	return dstZip.compression
+
+# writes data as a new member of dstZip, storing it without compression if it's an image
+def writeMember(dstZip, name, data, externalAttr = 0):
+	newInfo = ZipInfo(name, date_time = time.localtime(time.time())[:6])
+	newInfo.compress_type = compressTypeFor(name, dstZip)
+	newInfo.external_attr = externalAttr
+	dstZip.writestr(newInfo, data)
+
+# writes a file from disk into dstZip, storing it without compression if it's an image
+def writeFile(dstZip, path, arcname):
+	dstZip.write(path, arcname = arcname, compress_type = compressTypeFor(arcname, dstZip))